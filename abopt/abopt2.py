@@ -2,7 +2,11 @@
 from .algs.lbfgs import LBFGS
 from .algs.gradient import GradientDescent, LineSearchGradientDescent
 from .algs.newton import DirectNewton
+from .algs.newtoncg import NewtonCG
 from .algs.trustregion import TrustRegionCG
+from .algs.qntrustregion import QuasiNewtonTrustRegion
+from .algs.stochastic import StochasticLBFGS, StochasticProblem
+from .algs.anderson import AndersonAcceleration
 
 # expose common vector spaces
 from .vectorspace import real_vector_space
@@ -16,6 +20,8 @@ from .base import State
 from .base import Preconditioner
 from .base import Problem
 
+from .asktell import AskTell
+
 def minimize(optimizer, objective, gradient, x0, hessian_vector_product=None,
     monitor=None, vs=real_vector_space, precond=None):
 
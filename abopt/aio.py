@@ -0,0 +1,118 @@
+"""
+    Driving the optimizers from asyncio.
+
+    The objective, gradient and hessian vector products of an ``AsyncProblem``
+    are coroutine functions (``async def``).
+
+    The optimizers are not rewritten as coroutines. The synchronous
+    algorithm runs on a worker thread, and each evaluation it asks for is
+    scheduled on the event loop of the caller and awaited there.
+    One event loop can thus drive many minimizations at once, and the
+    evaluations of independent minimizations overlap.
+
+        problem = AsyncProblem(objective, gradient)
+        r1, r2 = await asyncio.gather(
+                    minimize(LBFGS(), problem, x0),
+                    minimize(LBFGS(), problem, x1))
+
+    Requires Python 3.7 or later; the module is not imported by ``abopt``.
+"""
+
+import asyncio
+import functools
+
+from abopt.base import Problem
+from abopt.linesearch import backtrace as _backtrace
+from abopt.linesearch import minpack as _minpack
+from abopt.algs.trustregion import cg_steihaug as _cg_steihaug
+
+def _run_threadsafe(loop, func, *args):
+    """ call the coroutine function func on loop from a worker thread,
+        and wait for the result.
+    """
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+
+    if running is loop:
+        raise RuntimeError("synchronous evaluation from the event loop thread would deadlock; "
+                           "use the awaitable functions in abopt.aio instead.")
+
+    return asyncio.run_coroutine_threadsafe(func(*args), loop).result()
+
+class AsyncProblem(Problem):
+    """ A problem defined by coroutine functions.
+
+        The synchronous interface of Problem (f, g, Hvp, ...) is still
+        available, but only from a thread other than the one running the event
+        loop; this is where the optimizers are run by ``abopt.aio.minimize``.
+
+        The problem is attached to the event loop of the last awaitable that
+        used it.
+    """
+    def __init__(self, objective, gradient,
+        hessian_vector_product=None,
+        inverse_hessian_vector_product=None,
+        hessian_matrix_product=None,
+        **kwargs):
+
+        self.loop = None
+
+        def wrap(func):
+            if func is None: return None
+            def wrapped(*args):
+                if self.loop is None:
+                    raise RuntimeError("AsyncProblem is not attached to an event loop; "
+                                       "use the awaitable functions in abopt.aio.")
+                return _run_threadsafe(self.loop, func, *args)
+            return wrapped
+
+        Problem.__init__(self,
+                objective=wrap(objective),
+                gradient=wrap(gradient),
+                hessian_vector_product=wrap(hessian_vector_product),
+                inverse_hessian_vector_product=wrap(inverse_hessian_vector_product),
+                hessian_matrix_product=wrap(hessian_matrix_product),
+                **kwargs)
+
+async def _offload(problem, executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    if isinstance(problem, AsyncProblem):
+        problem.loop = loop
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+async def minimize(optimizer, problem, x0, monitor=None, executor=None, **state_args):
+    """ Awaitable version of ``Optimizer.minimize``.
+
+        The optimizer runs on a thread of executor (the default executor of the
+        loop if None). The monitor is called from that thread.
+
+        Returns the final State.
+    """
+    return await _offload(problem, executor, optimizer.minimize,
+                problem, x0, monitor=monitor, **state_args)
+
+async def backtrace(problem, state, z, rate, maxiter, executor=None, **kwargs):
+    """ Awaitable version of ``abopt.linesearch.backtrace``. """
+    return await _offload(problem, executor, _backtrace,
+                problem, state, z, rate, maxiter, **kwargs)
+
+async def minpack(problem, state, z, rate, maxiter, executor=None, **kwargs):
+    """ Awaitable version of ``abopt.linesearch.minpack``. """
+    return await _offload(problem, executor, _minpack,
+                problem, state, z, rate, maxiter, **kwargs)
+
+async def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None, full_output=False, executor=None):
+    """ Awaitable version of ``abopt.algs.trustregion.cg_steihaug``.
+
+        Avp is a coroutine function; the preconditioner C and monitor
+        are plain functions.
+    """
+    loop = asyncio.get_running_loop()
+
+    def syncAvp(v):
+        return _run_threadsafe(loop, Avp, v)
+
+    return await _offload(None, executor, _cg_steihaug,
+                vs, syncAvp, g, z0, Delta, rtol, maxiter=maxiter, monitor=monitor, C=C, full_output=full_output)
@@ -0,0 +1,219 @@
+"""
+    Anderson acceleration of the gradient descent fixed point iteration,
+
+        x -> x - beta g(x),
+
+    as a multi-secant method. See
+
+    (WN)
+    Anderson Acceleration for Fixed-Point Iterations,
+    Walker, H. F. & Ni, P. SIAM J. Numer. Anal. (2011) 49: 1715.
+
+    doi:10.1137/10078356X
+
+    (FS)
+    Two classes of multisecant methods for nonlinear acceleration,
+    Fang, H. & Saad, Y. Numer. Linear Algebra Appl. (2009) 16: 197.
+
+    doi:10.1002/nla.617
+
+    With the differences of the last m iterates dX and gradients dG,
+    the mixing coefficients are
+
+        gamma = argmin | g - dG gamma |,
+
+    and the step is
+
+        z = dX gamma + beta (g - dG gamma).
+
+    The step is safeguarded by a backtracking line search; if it is
+    not a descent direction or the line search fails, the history is dropped
+    and a gradient descent step is taken instead.
+
+    This is not a drop-in replacement of LBFGS. On RosenProblem it takes 5
+    to 8 times as many iterations (737 against 122 for n=20, 3913 against
+    491 for n=100, with m=6; see benchmarks/bench_anderson.py); on the
+    chi-square problems it is on par.
+"""
+
+import numpy
+
+from abopt.base import Optimizer
+from abopt.base import InitialProposal
+
+from abopt.linesearch import backtrace
+from abopt.linesearch import simpleregulator
+
+from abopt.algs.lbfgs import PairRingBuffer
+
+class AndersonHistory(PairRingBuffer):
+    def __init__(self, vs, m):
+        """ The differences of the last m iterates and gradients.
+
+            The pairs (dX, dG) are kept in a PairRingBuffer.
+
+            The Gram matrix dG^T dG of all slots is maintained incrementally
+            in update, with one blockdot (one reduction) per pair.
+        """
+        PairRingBuffer.__init__(self, vs, m)
+
+        # indexed by slots
+        self.GtG = numpy.zeros((self.nslots, self.nslots))
+        self._XG = numpy.zeros(self.nslots)
+
+    @property
+    def dX(self):
+        return [self.block[i] for i in self.order]
+
+    @property
+    def dG(self):
+        return [self.block[self.nslots + i] for i in self.order]
+
+    @property
+    def XG(self):
+        return [self._XG[i] for i in self.order]
+
+    def update(self, Px0, Px1, Pg0, Pg1):
+        vs = self.vs
+        n = self.nslots
+
+        i = self._spare(Pg1)
+
+        vs.blockassign(self.block, i, Px1, Px0, -1)
+        vs.blockassign(self.block, n + i, Pg1, Pg0, -1)
+
+        dx = self.block[i]
+        dg = self.block[n + i]
+
+        d = vs.blockdot(self.block[n:], dg)
+        if d[i] == 0:
+            # refuse to add a degenerate mode.
+            return
+
+        self.GtG[i, :] = d
+        self.GtG[:, i] = d
+        self._XG[i] = vs.dot(dx, dg)
+
+        self._append(i)
+
+    def reset(self):
+        """ Drops all pairs. """
+        self.order = []
+
+    def mix(self, Pg, beta, regularization=1e-10):
+        """ The Anderson step z = dX gamma + beta (Pg - dG gamma).
+
+            The least squares problem of gamma is solved with the normal equation
+            of the Gram matrix, regularized by regularization times its mean diagonal.
+        """
+        vs = self.vs
+        n = self.nslots
+
+        if len(self.order) == 0:
+            return vs.mul(Pg, beta)
+
+        ix = numpy.array(self.order)
+
+        A = self.GtG[ix][:, ix]
+        b = vs.blockdot(self.block[n:], Pg)[ix]
+
+        A = A + numpy.eye(len(ix)) * (regularization * numpy.trace(A) / len(ix))
+        gamma = numpy.linalg.solve(A, b)
+
+        c = numpy.zeros(2 * n)
+        c[ix] = gamma
+        c[n + ix] = -beta * gamma
+        return vs.blockaddmul(vs.mul(Pg, beta), self.block, c)
+
+    def __repr__(self):
+        return "AndersonHistory(len(dX)=%d, m=%d)" % (len(self.order), self.m)
+
+class AndersonAcceleration(Optimizer):
+    """ Anderson acceleration with a backtrace safeguard.
+
+        mixing is beta of the fixed point iteration. If None, beta is the
+        Barzilai-Borwein step dx.dg / dg.dg of the most recent pair with positive
+        curvature, or the rate of the first gradient descent step.
+
+        The Anderson step is taken only if the cosine of its angle to the gradient
+        is above mintheta.
+    """
+    optimizer_defaults = {
+        'maxiter' : 100000,
+        'conviter' : 6,
+        'm' : 6,
+        'mixing' : None,
+        'regularization' : 1e-10,
+        'mintheta' : 0.0,
+        'linesearch' : backtrace,
+        'linesearchiter' : 100,
+        'regulator' : simpleregulator,
+    }
+
+    def start(self, problem, state, x0):
+        prop = Optimizer.start(self, problem, state, x0)
+        prop.A = AndersonHistory(problem.vs, self.m)
+        prop.z = prop.Pg
+        prop.rate = 1.0
+        prop.beta = self.mixing
+        return prop
+
+    def get_beta(self, problem, state):
+        if self.mixing is not None:
+            return self.mixing
+
+        XG = state.A.XG
+        if len(XG) > 0 and XG[-1] > 0:
+            dG = state.A.dG[-1]
+            return XG[-1] / problem.vs.dot(dG, dG)
+        return state.beta
+
+    def accept(self, problem, state, prop):
+        if isinstance(prop, InitialProposal):
+            state.A = prop.A
+        else:
+            state.A.update(state.Px, prop.Px, state.Pg, prop.Pg)
+
+        state.rate = prop.rate
+        state.beta = prop.beta
+        Optimizer.accept(self, problem, state, prop)
+
+    def propose(self, problem, state):
+        dot = problem.vs.dot
+
+        A = state.A
+
+        prop = None
+        if len(A.order) > 0:
+            beta = self.get_beta(problem, state)
+            z = A.mix(state.Pg, beta, self.regularization)
+
+            znorm = dot(z, z) ** 0.5
+            theta = dot(z, state.Pg) / (znorm * state.Pgnorm)
+            if theta > self.mintheta:
+                # the mixing shall have been good, do not search too many times.
+                prop, rate = self.linesearch(problem, state, z, 1.0, maxiter=3)
+                message = "anderson"
+
+            if prop is None:
+                A.reset()
+
+        if prop is None:
+            z = state.Pg
+            ratemax = self.regulator(problem, state, z)
+            ratemax = min(ratemax, state.rate * 2)
+
+            prop, rate = self.linesearch(problem, state, z, ratemax, maxiter=self.linesearchiter)
+            if prop is None:
+                return None
+
+            message = "gradient descent"
+            prop.rate = rate
+            # the first step length seeds beta
+            beta = state.beta if state.beta is not None else rate
+        else:
+            prop.rate = state.rate
+
+        prop.message = message
+        prop.beta = beta
+        return prop
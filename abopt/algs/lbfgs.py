@@ -57,8 +57,13 @@
     Yu Feng
 """
 
+import numpy
+from scipy.linalg import solve_triangular
+
 from abopt.base import Optimizer
+from abopt.base import Preconditioner
 from abopt.base import Proposal
+from abopt.base import InitialProposal
 
 from abopt.linesearch import backtrace
 from abopt.linesearch import simpleregulator
@@ -201,28 +206,146 @@ def post_scaled_inverse_dfp(vs, hessian):
 
     return inverse_dfp(vs, hessian, post_scaled=True)
 
-class LBFGSHessian(object):
-    def __init__(self, vs, m, diag_update=scalar, rescale_diag=False):
-        """ D is a vector represents the initial diagonal. """
+class PairRingBuffer(object):
+    def __init__(self, vs, m, capacity=None, dtype=None):
+        """ A history of pairs of vectors, e.g. the s and y of LBFGSHessian.
+
+            The pairs are stored in a ring buffer of capacity + 1 slots, preallocated
+            with vs.block by the first update. The first vectors of the pairs are in
+            the first half of the block and the second vectors in the second half.
+            The spare slot receives the next pair, which becomes part of the history
+            only if it is appended; then the slot of the oldest pair becomes the spare.
+
+            At most m pairs are kept. The capacity defaults to m.
+        """
+        if capacity is None: capacity = m
+        if m > capacity:
+            raise ValueError("m = %d is beyond the capacity %d" % (m, capacity))
+
+        self.vs = vs
         self.m = m
-        self.Y = [] # Delta G
-        self.S = [] # Delta S
-        self.YS = []
-        self.YY = []
+        self.capacity = capacity
+        self.dtype = dtype
+
+        self.nslots = capacity + 1
+        self.block = None
+        # slots of the pairs, oldest first.
+        self.order = []
+
+    def _spare(self, template):
+        """ the slot to receive the next pair. """
+        if self.block is None:
+            self.block = self.vs.block(template, 2 * self.nslots, self.dtype)
+
+        used = set(self.order)
+        for i in range(self.nslots):
+            if i not in used: return i
+
+    def _append(self, i):
+        """ adds the pair in slot i to the history, dropping the oldest beyond m. """
+        self.order.append(i)
+        if len(self.order) > self.m:
+            self.order.pop(0)
+
+class LBFGSHessian(PairRingBuffer):
+    def __init__(self, vs, m, diag_update=scalar, rescale_diag=False, dtype=None, capacity=None, curvature=None):
+        """ D is a vector represents the initial diagonal.
+
+            S and Y are kept in a PairRingBuffer; a pair becomes part of the
+            history only if it is not degenerate.
+
+            At most m pairs are kept; m can be changed up to the capacity
+            with resize. The capacity defaults to m.
+
+            S, Y, YS and YY are lists ordered from the oldest to the newest pair.
+
+            dtype stores S and Y in reduced precision, e.g. 'f4' or 'bf16'
+            (see vs.block). YS, YY and the products are still
+            in full precision.
+
+            curvature controls pairs of bad curvature:
+            None adds any pair with ys != 0; 'skip' refuses pairs with ys <= 0;
+            'damp' applies Powell's damping with the initial matrix D^{-1} to pairs with
+            ys <= 0, replacing y by a combination of y and s / D such that
+            ys = 0.2 s^T D^{-1} s. Pairs of positive curvature are not damped:
+            with D from the diag_update the usual threshold of 0.2 damps most pairs
+            of an ill-conditioned problem and slows down the convergence.
+        """
+        PairRingBuffer.__init__(self, vs, m, capacity=capacity, dtype=dtype)
+
         self.D = 1.
-        self.vs = vs
         self.diag_update = diag_update
         self.rescale_diag = rescale_diag
+        self.curvature = curvature
+
+        # indexed by slots
+        self._YS = numpy.zeros(self.nslots)
+        self._YY = numpy.zeros(self.nslots)
+
+    @property
+    def S(self):
+        return [self.block[i] for i in self.order]
+
+    @property
+    def Y(self):
+        return [self.block[self.nslots + i] for i in self.order]
+
+    @property
+    def YS(self):
+        return [self._YS[i] for i in self.order]
+
+    @property
+    def YY(self):
+        return [self._YY[i] for i in self.order]
+
+    def _like(self, m, capacity):
+        """ an empty hessian approximation with the same settings. """
+        return type(self)(vs=self.vs, m=m, diag_update=self.diag_update, rescale_diag=self.rescale_diag,
+                dtype=self.dtype, capacity=capacity, curvature=self.curvature)
 
     def copy(self):
-        r = LBFGSHessian(vs=self.vs, m=self.m, diag_update=self.diag_update, rescale_diag=self.rescale_diag)
-        r.Y = self.Y[:]
-        r.S = self.S[:]
-        r.YS = self.YS[:]
-        r.YY = self.YY[:]
+        r = self._like(self.m, self.capacity)
+        if self.block is not None:
+            r.block = self.vs.block(self.block[0], len(self.block), self.dtype)
+            for i in self.order:
+                r.block[i] = self.block[i]
+                r.block[self.nslots + i] = self.block[self.nslots + i]
+        r.order = self.order[:]
+        r._YS[...] = self._YS
+        r._YY[...] = self._YY
         r.D = self.vs.copy(self.D)
         return r
 
+    def validated(self, m=None, capacity=None):
+        """ Returns a copy to carry over to a new problem, or None if nothing can be used.
+
+            Only the most recent m pairs of positive curvature (ys > 0) are kept.
+            If a pair is dropped D is reset to the scalar estimate
+            from the most recent pair.
+        """
+        if m is None: m = self.m
+        if capacity is None: capacity = m
+
+        r = self._like(m, capacity)
+        YS = self.YS
+        YY = self.YY
+        keep = [i for i in range(len(YS)) if YS[i] > 0 and YY[i] > 0]
+        dropped = len(keep) < len(YS)
+        keep = keep[-m:] if m > 0 else []
+
+        if len(keep) == 0: return None
+
+        S = self.S
+        Y = self.Y
+        for i in keep:
+            r.push(S[i], Y[i], YS[i], YY[i])
+
+        if dropped:
+            r.D = scalar(self.vs, r)
+        else:
+            r.D = self.vs.copy(self.D)
+        return r
+
     def hvp(self, v):
         """ Inverse of Hessian dot any vector; lowercase h indicates it is the inverse """
         q = v
@@ -231,62 +354,355 @@ class LBFGSHessian(object):
         addmul = self.vs.addmul
         mul = self.vs.mul
 
-        if len(self.Y) == 0: # first step
+        if len(self.order) == 0: # first step
             return mul(v, self.D)
 
-        alpha = list(range(len(self.Y)))
-        beta = list(range(len(self.Y)))
+        S = self.S
+        Y = self.Y
+        YS = self.YS
+        YY = self.YY
+
+        alpha = list(range(len(Y)))
+        beta = list(range(len(Y)))
 
-        if self.YY[-1] == 0 or self.YS[-1] == 0: # failed LBFGS
+        if YY[-1] == 0 or YS[-1] == 0: # failed LBFGS
             return None
 
-        for i in range(len(self.Y) - 1, -1, -1):
-            alpha[i] = dot(self.S[i], q) / self.YS[i]
-            q = addmul(q, self.Y[i], -alpha[i])
+        for i in range(len(Y) - 1, -1, -1):
+            alpha[i] = dot(S[i], q) / YS[i]
+            q = addmul(q, Y[i], -alpha[i])
 
         D = self.D
 
         if self.rescale_diag:
-            Dyy = dot(mul(self.Y[-1], D), self.Y[-1])
-            D = mul(self.YS[-1]/ Dyy, D)
+            Dyy = dot(mul(Y[-1], D), Y[-1])
+            D = mul(YS[-1]/ Dyy, D)
 
         z = addmul(0, q, D)
-        for i in range(len(self.Y)):
-            beta[i] = 1.0 / self.YS[i] * dot(self.Y[i], z)
-            z = addmul(z, self.S[i], (alpha[i] - beta[i]))
+        for i in range(len(Y)):
+            beta[i] = 1.0 / YS[i] * dot(Y[i], z)
+            z = addmul(z, S[i], (alpha[i] - beta[i]))
 
         return z
 
+    def _commit(self, i, ys, yy):
+        """ adds the pair in slot i to the history, dropping the oldest beyond m. """
+        self._YS[i] = ys
+        self._YY[i] = yy
+        self._append(i)
+
     def update(self, Px0, Px1, Pg0, Pg1):
-        dot = self.vs.dot
-        addmul = self.vs.addmul
-        mul = self.vs.mul
+        vs = self.vs
+        dot = vs.dot
 
-        y = addmul(Pg1, Pg0, -1)
-        s = addmul(Px1, Px0, -1)
+        i = self._spare(Pg1)
+
+        # y and s are computed into the slot
+        vs.blockassign(self.block, self.nslots + i, Pg1, Pg0, -1)
+        vs.blockassign(self.block, i, Px1, Px0, -1)
+
+        y = self.block[self.nslots + i]
+        s = self.block[i]
 
         ys = dot(y, s)
+
+        if self.curvature == 'damp' and ys <= 0:
+            # Powell's damping; B0 = D^{-1}
+            B0s = vs.mul(s, self.D, -1)
+            sB0s = dot(s, B0s)
+            if sB0s > 0:
+                theta = 0.8 * sB0s / (sB0s - ys)
+                vs.blockassign(self.block, self.nslots + i, vs.mul(y, theta), B0s, 1 - theta)
+                y = self.block[self.nslots + i]
+                ys = dot(y, s)
+
         yy = dot(y, y)
 
         if yy == 0 or ys == 0:
             # refuse to add a degenerate mode.
             return
 
-        self.Y.append(y)
-        self.S.append(s)
-        self.YS.append(ys)
-        self.YY.append(yy)
+        if self.curvature == 'skip' and ys < 0:
+            return
 
-        if len(self.Y) > self.m:
-            del self.Y[0]
-            del self.S[0]
-            del self.YS[0]
-            del self.YY[0]
+        self._commit(i, ys, yy)
 
         self.D = self.diag_update(self.vs, self)
 
+    def drop(self, index):
+        """ Removes the pair at index of S and Y; 0 is the oldest. D is not updated. """
+        self.order.pop(index)
+
+    def resize(self, m):
+        """ Changes the number of pairs to keep, up to the capacity.
+            The oldest pairs are dropped if there are more than m.
+        """
+        if m < 0 or m > self.capacity:
+            raise ValueError("m = %d is not in [0, %d]" % (m, self.capacity))
+        self.m = m
+        while len(self.order) > m:
+            self.order.pop(0)
+
+    def push(self, s, y, ys, yy):
+        """ Adds a pair to the history, dropping the oldest beyond m. D is not updated. """
+        i = self._spare(y)
+        self.block[i] = s
+        self.block[self.nslots + i] = y
+        self._commit(i, ys, yy)
+
     def __repr__(self):
-        return "LBFGSHessian(len(Y)=%d, m=%d)" % (len(self.Y), self.m)
+        return "%s(len(Y)=%d, m=%d)" % (type(self).__name__, len(self.order), self.m)
+
+class CompactLBFGSHessian(LBFGSHessian):
+    """ The L-BFGS inverse Hessian in the compact representation of
+
+        (BNS)
+        Representations of quasi-Newton matrices and their use in limited memory methods,
+        Byrd, R. H., Nocedal, J. & Schnabel, R. B. Mathematical Programming (1994) 63: 129.
+
+        doi:10.1007/BF01582063
+
+            h = D + [S, DY] M [S, DY]^T,
+
+        where M is a small 2k x 2k matrix from S^T Y and Y^T D Y.
+
+        S^T Y, S^T S and Y^T Y of all slots are maintained incrementally
+        in update. With the scalar diag_update, hvp takes a single blockdot
+        (one global reduction) and a single blockaddmul, instead of
+        the 2m dot and addmul of the two-loop recursion.
+
+        With a vector D, Y^T D Y is recomputed with m blockdots after each
+        update, and hvp takes two reductions.
+    """
+    def __init__(self, vs, m, diag_update=scalar, rescale_diag=False, dtype=None, capacity=None, curvature=None):
+        LBFGSHessian.__init__(self, vs, m, diag_update=diag_update, rescale_diag=rescale_diag,
+                dtype=dtype, capacity=capacity, curvature=curvature)
+
+        n = self.nslots
+        # Gram matrices, indexed by slots. StY[i, j] = s_i . y_j
+        self.StY = numpy.zeros((n, n))
+        self.StS = numpy.zeros((n, n))
+        self.YtY = numpy.zeros((n, n))
+
+        self._YtDY = None
+        self._YtDY_D = None
+
+    def _like(self, m, capacity):
+        """ an empty hessian approximation with the same settings. """
+        return type(self)(vs=self.vs, m=m, diag_update=self.diag_update, rescale_diag=self.rescale_diag,
+                dtype=self.dtype, capacity=capacity, curvature=self.curvature)
+
+    def copy(self):
+        r = LBFGSHessian.copy(self)
+        r.StY[...] = self.StY
+        r.StS[...] = self.StS
+        r.YtY[...] = self.YtY
+        return r
+
+    def _commit(self, i, ys, yy):
+        LBFGSHessian._commit(self, i, ys, yy)
+
+        vs = self.vs
+        n = self.nslots
+        s = self.block[i]
+        y = self.block[n + i]
+
+        ds = vs.blockdot(self.block, s)
+        dy = vs.blockdot(self.block, y)
+
+        self.StS[i, :] = ds[:n]
+        self.StS[:, i] = ds[:n]
+        self.StY[i, :] = ds[n:]
+        self.StY[:, i] = dy[:n]
+        self.YtY[i, :] = dy[n:]
+        self.YtY[:, i] = dy[n:]
+
+        self._YtDY_D = None
+
+    def _get_YtDY(self):
+        if self._YtDY_D is not self.D:
+            n = self.nslots
+            YtDY = numpy.zeros((n, n))
+            for i in self.order:
+                YtDY[i, :] = self.vs.blockdot(self.block[n:], self.vs.mul(self.block[n + i], self.D))
+            self._YtDY = YtDY
+            self._YtDY_D = self.D
+        return self._YtDY
+
+    def hvp(self, v):
+        """ Inverse of Hessian dot any vector; lowercase h indicates it is the inverse """
+        vs = self.vs
+        mul = vs.mul
+        addmul = vs.addmul
+        n = self.nslots
+
+        if len(self.order) == 0: # first step
+            return mul(v, self.D)
+
+        ix = numpy.array(self.order)
+        StY = self.StY[ix][:, ix]
+        if StY[-1, -1] == 0 or self.YtY[ix[-1], ix[-1]] == 0: # failed LBFGS
+            return None
+
+        R = numpy.triu(StY)
+        Dm = numpy.diag(numpy.diag(StY))
+
+        D = self.D
+        if numpy.isscalar(D):
+            YtDY = D * self.YtY[ix][:, ix]
+            if self.rescale_diag:
+                c = StY[-1, -1] / YtDY[-1, -1]
+                D = D * c
+                YtDY = YtDY * c
+
+            d = vs.blockdot(self.block, v)
+            a = d[ix]
+            b = D * d[n + ix]
+        else:
+            YtDY = self._get_YtDY()[ix][:, ix]
+            if self.rescale_diag:
+                c = StY[-1, -1] / YtDY[-1, -1]
+                D = mul(D, c)
+                YtDY = YtDY * c
+
+            Dv = mul(v, D)
+            a = vs.blockdot(self.block[:n], v)[ix]
+            b = vs.blockdot(self.block[n:], Dv)[ix]
+
+        u = solve_triangular(R, a)
+        p1 = solve_triangular(R, (Dm + YtDY).dot(u) - b, trans='T')
+        p2 = -u
+
+        # the spare slot and unused slots have zero coefficients.
+        c = numpy.zeros(2 * n)
+        c[ix] = p1
+        if numpy.isscalar(D):
+            c[n + ix] = D * p2
+            return vs.blockaddmul(mul(v, D), self.block, c)
+        else:
+            c[n + ix] = p2
+            DYp2 = mul(vs.blockaddmul(0, self.block[n:], c[n:]), D)
+            return vs.blockaddmul(addmul(Dv, DYp2, 1), self.block[:n], c[:n])
+
+class LBFGSOperator(object):
+    """ The hessian approximation of a LBFGSHessian as a linear operator,
+        e.g. to precondition a later solve with the curvature learned by LBFGS.
+
+        The inverse hessian is factored as h = C C^T, with
+
+            C = W_k ... W_1 D^{1/2},  W_j = I + s_j w_j^T,
+
+        from the product form of the BFGS update (Brodlie, Gourlay & Greenstadt, 1973),
+        where w_j = (rho_j / s_j^T B_j s_j)^{1/2} B_j s_j - rho_j y_j, rho_j = 1 / y_j^T s_j,
+        and B_j is the hessian from the pairs before j.
+        W_j is inverted with Sherman-Morrison, such that h, its inverse H and
+        the factors are applied with O(m) vector operations.
+        Building the factors takes O(m^2) vector operations.
+
+        All pairs must have positive curvature (see LBFGSHessian.validated).
+        The operator is a snapshot; later updates to the hessian approximation are not seen.
+        Vectors are in the (preconditioned) variables of the problem the hessian
+        approximation was built on.
+
+        Usage:
+
+            op = LBFGSOperator(state.B)
+            TrustRegionCG(cg_preconditioner=op.cg_preconditioner)
+            Problem(..., precond=op.preconditioner())
+    """
+    def __init__(self, hessian):
+        vs = hessian.vs
+        dot = vs.dot
+        self.vs = vs
+
+        Y = hessian.Y
+        YS = hessian.YS
+
+        if any(ys <= 0 for ys in YS):
+            raise ValueError("the hessian approximation has pairs of non-positive curvature; "
+                             "use hessian.validated()")
+
+        D = hessian.D
+        if hessian.rescale_diag and len(Y) > 0:
+            Dyy = dot(vs.mul(Y[-1], D), Y[-1])
+            D = vs.mul(D, YS[-1] / Dyy)
+        self.D = D
+
+        self.S = []
+        self.W = []
+        # 1 + w_j . s_j
+        self.WS = []
+
+        for s, y, ys in zip(hessian.S, Y, YS):
+            Bs = self.Hvp(s)
+            sBs = dot(s, Bs)
+            rho = 1.0 / ys
+            self.S.append(vs.copy(s))
+            self.W.append(vs.addmul(vs.mul(y, -rho), Bs, (rho / sBs) ** 0.5))
+            self.WS.append((rho * sBs) ** 0.5)
+
+    def Cvp(self, v):
+        """ C v """
+        v = self.vs.mul(v, self.D, 0.5)
+        for s, w in zip(self.S, self.W):
+            v = self.vs.addmul(v, s, self.vs.dot(w, v))
+        return v
+
+    def vCp(self, v):
+        """ C^T v """
+        for s, w in reversed(list(zip(self.S, self.W))):
+            v = self.vs.addmul(v, w, self.vs.dot(s, v))
+        return self.vs.mul(v, self.D, 0.5)
+
+    def Cinvvp(self, v):
+        """ C^{-1} v """
+        for s, w, ws in reversed(list(zip(self.S, self.W, self.WS))):
+            v = self.vs.addmul(v, s, -self.vs.dot(w, v) / ws)
+        return self.vs.mul(v, self.D, -0.5)
+
+    def vCinvp(self, v):
+        """ C^{-T} v """
+        v = self.vs.mul(v, self.D, -0.5)
+        for s, w, ws in zip(self.S, self.W, self.WS):
+            v = self.vs.addmul(v, w, -self.vs.dot(s, v) / ws)
+        return v
+
+    def hvp(self, v):
+        """ Inverse of Hessian dot any vector; lowercase h indicates it is the inverse """
+        return self.Cvp(self.vCp(v))
+
+    def Hvp(self, v):
+        """ Hessian dot any vector """
+        return self.vCinvp(self.Cinvvp(v))
+
+    def apply(self, v, direction):
+        """ H v if direction is 1, h v if direction is -1; the C of cg_steihaug. """
+        if direction == 1:
+            return self.Hvp(v)
+        else:
+            return self.hvp(v)
+
+    def cg_preconditioner(self, Avp):
+        """ for the cg_preconditioner argument of TrustRegionCG. """
+        return self.apply
+
+    def preconditioner(self):
+        """ A Preconditioner with x = C x~, such that the hessian of x~ is
+            approximately the identity.
+        """
+        def Pvp(v, direction):
+            if direction == 1:
+                return self.Cinvvp(v)
+            else:
+                return self.vCp(v)
+
+        def vPp(v, direction):
+            if direction == 1:
+                return self.vCinvp(v)
+            else:
+                return self.Cvp(v)
+
+        return Preconditioner(Pvp=Pvp, vPp=vPp)
 
 class LBFGSFailure(StopIteration):
     def __init__(self, message):
@@ -303,16 +719,121 @@ class LBFGS(Optimizer):
         'regulator' : simpleregulator,
         'diag_update' : post_scaled_direct_bfgs,
         'rescale_diag' : False,
+        'compact' : False,
+        'history_dtype' : None,
+        'memory_budget' : None,
+        'adapt_m' : False,
+        'm_min' : 2,
+        'adapt_m_theta' : 0.1,
+        'recovery' : 'purge',
+        'curvature' : None,
     }
 
+    def history_capacity(self, problem, Px):
+        """ The number of pairs that fits in memory_budget (bytes), or m if no budget is set. """
+        if self.memory_budget is None:
+            return self.m
+
+        pairbytes = 2 * problem.vs.nbytes(Px, self.history_dtype)
+
+        # the ring buffer has a spare slot
+        capacity = int(self.memory_budget // pairbytes) - 1
+        if capacity < 1:
+            raise ValueError("memory_budget = %d bytes is too small for two pairs of %d bytes"
+                    % (self.memory_budget, pairbytes))
+        return capacity
+
+    def make_hessian(self, problem, Px, m=None):
+        """ a new, empty, hessian approximation.
+
+            m defaults to the capacity; or to the smaller of self.m and
+            the capacity if m is adapted.
+        """
+        capacity = self.history_capacity(problem, Px)
+        if m is None:
+            if self.adapt_m:
+                m = self.m
+            else:
+                m = capacity
+        m = min(m, capacity)
+
+        if self.compact:
+            klass = CompactLBFGSHessian
+        else:
+            klass = LBFGSHessian
+        return klass(problem.vs, m, self.diag_update, self.rescale_diag, self.history_dtype,
+                capacity=capacity, curvature=self.curvature)
+
+    def recover(self, problem, state, B):
+        """ the hessian approximation to continue with after a failed LBFGS step.
+
+            recovery is one of
+            'purge' : start over with an empty approximation;
+            'drop_oldest' : drop the oldest pair;
+            'drop_suspicious' : drop the pair with the smallest
+                curvature cosine ys / (|s| |y|).
+
+            B is not modified; the pairs are dropped from a copy, which
+            replaces state.B only if the proposal is accepted.
+        """
+        if self.recovery == 'purge':
+            return self.make_hessian(problem, state.Px, B.m)
+
+        if len(B.YS) == 0:
+            return B
+
+        B = B.copy()
+        if self.recovery == 'drop_oldest':
+            B.drop(0)
+        elif self.recovery == 'drop_suspicious':
+            dot = problem.vs.dot
+            cosines = [ys / (dot(s, s) * yy) ** 0.5 for s, ys, yy in zip(B.S, B.YS, B.YY)]
+            B.drop(cosines.index(min(cosines)))
+        else:
+            raise ValueError("unknown recovery strategy %s" % self.recovery)
+        return B
+
+    def adapt_history(self, B, prop):
+        """ grow or shrink the number of pairs in B after a step.
+
+            If the LBFGS step failed or was poorly aligned with the gradient,
+            (theta < adapt_m_theta), the old pairs are likely stale and m is
+            halved, down to m_min. If the LBFGS step is taken at the unit
+            rate, m grows by one, up to the capacity.
+
+            Gradient descent steps taken without trying the LBFGS direction,
+            e.g. while the history is empty, do not change m.
+        """
+        if not prop.tried:
+            return
+        if prop.r2 is None or prop.theta < self.adapt_m_theta:
+            B.resize(max(min(self.m_min, B.capacity), B.m // 2))
+        elif prop.r2 == 1.0:
+            B.resize(min(B.m + 1, B.capacity))
+
     def start(self, problem, state, x0):
         prop = Optimizer.start(self, problem, state, x0)
-        prop.B = None
+        # carry over the hessian approximation of a warm start
+        B = getattr(state, 'B', None)
+        if B is not None:
+            capacity = self.history_capacity(problem, prop.Px)
+            if self.adapt_m:
+                m = min(B.m, capacity)
+            else:
+                m = capacity
+            B = B.validated(m, capacity)
+        prop.B = B
         prop.z = prop.Pg
         # carry over the gradient descent search radius
         prop.r1 = getattr(state, 'r1', 1.0)
         return prop
 
+    def warmstart(self, state):
+        if getattr(state, 'B', None) is None:
+            # the previous minimization has not accepted a point.
+            return {}
+        return dict(B=state.B.copy(), r1=state.r1)
+
     def accept(self, problem, state, prop):
         addmul = problem.vs.addmul
         dot = problem.vs.dot
@@ -324,9 +845,13 @@ class LBFGS(Optimizer):
         state.r1 = prop.r1
 
         if state.B is None:
-            state.B = LBFGSHessian(problem.vs, self.m, self.diag_update, self.rescale_diag)
-        else:
+            state.B = self.make_hessian(problem, prop.Px)
+        elif not isinstance(prop, InitialProposal):
             state.B.update(state.Px, prop.Px, state.Pg, prop.Pg)
+            if self.adapt_m:
+                self.adapt_history(state.B, prop)
+
+        state.m = state.B.m
 
         Optimizer.accept(self, problem, state, prop)
 
@@ -337,6 +862,8 @@ class LBFGS(Optimizer):
         mul = problem.vs.mul
 
         r1 = state.r1
+        r2 = None
+        tried = False
 
         try:
             # use old LBFGSHessian, and update it
@@ -346,6 +873,7 @@ class LBFGS(Optimizer):
             if len(B.Y) == 0:
                 raise LBFGSFailure("no lbfgs")
 
+            tried = True
             z = B.hvp(state.Pg)
 
             # hvp cannot be computed, recover
@@ -359,8 +887,7 @@ class LBFGS(Optimizer):
             else:
                 theta = dot(z, state.Pg) / (state.Pgnorm * znorm)
                 if theta < 0.0:
-                    # purge the hessian approximation
-                    B = LBFGSHessian(problem.vs, self.m, self.diag_update, self.rescale_diag)
+                    B = self.recover(problem, state, B)
                     raise LBFGSFailure("lbfgs misaligned theta = %g" % (theta,))
 
                 # LBFGS should have been good, so we shall not search too many times.
@@ -368,7 +895,7 @@ class LBFGS(Optimizer):
 
             # failed line search, recover
             if prop is None:
-                B = LBFGSHessian(problem.vs, self.m, self.diag_update, self.rescale_diag)
+                B = self.recover(problem, state, B)
                 raise LBFGSFailure("lbfgs linesearch failed theta=%g " % (theta, ))
 
             # print('BFGS Starting step = %0.2e, step moved = %0.2e'%(r2))
@@ -381,6 +908,7 @@ class LBFGS(Optimizer):
         except LBFGSFailure as e:
 
             z = state.Pg
+            r2 = None
 
             r1max = self.regulator(problem, state, z)
             r1max = min(r1max, state.r1 * 2)
@@ -399,5 +927,7 @@ class LBFGS(Optimizer):
         prop.B = B
         prop.z = z
         prop.r1 = r1
+        prop.r2 = r2
+        prop.tried = tried
 
         return prop
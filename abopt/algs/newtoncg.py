@@ -0,0 +1,181 @@
+"""
+    Truncated Newton (line search Newton-CG), Algorithm 7.1 of
+
+        Numerical Optimization, Nocedal, J. & Wright, S. J., Springer (2006), 2nd ed.
+
+    The Newton system A z = g of the preconditioned Hessian A is solved
+    inexactly with preconditioned CG, started from zero, and terminated
+    when the residual is below the forcing term eta, or on negative curvature.
+    The problem then takes a line search along z, starting from the Newton step.
+
+    The forcing term is either fixed (cg_rtol), or chosen with the
+    strategies of Eisenstat and Walker, see eisenstat_walker; it is loose far from
+    the solution, where the quadratic model is poor, and tightens as the gradient
+    decreases, giving a superlinear convergence near the solution.
+"""
+
+from abopt.base import Optimizer
+from abopt.base import InitialProposal
+from abopt.linesearch import backtrace
+from abopt.algs.trustregion import HessianOperator, eisenstat_walker
+
+def truncated_cg(vs, Avp, g, rtol, maxiter=1000, monitor=None, C=None):
+    """ Solves A z = g with preconditioned CG, until the residual r satisfies
+        r C^{-1} r < rtol ** 2 g C^{-1} g, same as cg_steihaug.
+
+        C(v, direction) applies the preconditioner C^{direction}.
+
+        If a search direction d of non-positive curvature is found, the iteration
+        stops with the current z; on the first iteration, z is the preconditioned
+        gradient C^{-1} g, scaled by the magnitude of its curvature.
+
+        Returns (z, Az, message); Az is tracked along the iterations.
+    """
+    if C is None: C = lambda x, direction: x
+
+    dot = vs.dot
+    mul = vs.mul
+    addmul = vs.addmul
+
+    z0 = vs.zeros_like(g)
+    Az0 = vs.zeros_like(g)
+    r0 = mul(g, -1)
+    mr0 = C(r0, -1)
+    d0 = mul(mr0, -1)
+
+    rho_init = dot(mr0, r0)
+    rho0 = rho_init
+
+    if rho_init == 0:
+        return z0, Az0, "zero gradient"
+
+    j = 0
+    while True:
+        Bd0 = Avp(d0)
+        dBd0 = dot(d0, Bd0)
+
+        if dBd0 <= 0:
+            if j == 0:
+                if dBd0 == 0:
+                    # no curvature information, the preconditioned gradient.
+                    return d0, Bd0, "zero hessian"
+                tau = rho0 / -dBd0
+                z0 = mul(d0, tau)
+                Az0 = mul(Bd0, tau)
+            message = "negative curvature"
+            break
+
+        alpha = rho0 / dBd0
+        z0 = addmul(z0, d0, alpha)
+        Az0 = addmul(Az0, Bd0, alpha)
+        r0 = addmul(r0, Bd0, alpha)
+        mr0 = C(r0, -1)
+
+        rho1 = dot(mr0, r0)
+        d0 = addmul(mul(mr0, -1), d0, rho1 / rho0)
+        rho0 = rho1
+        message = "regular iteration"
+
+        if monitor is not None:
+            monitor(j, message, rho0, rho_init, rtol)
+
+        if rho0 / rho_init < rtol ** 2:
+            message = "converged"
+            break
+
+        if j >= maxiter:
+            message = "maxiter"
+            break
+        j = j + 1
+
+    return z0, Az0, message
+
+class NewtonCG(Optimizer):
+    """ Truncated Newton; see the module docstring.
+
+        forcing is None for the fixed forcing term cg_rtol, or
+        'ew1' and 'ew2' for the choices 1 and 2 of Eisenstat and Walker, starting
+        from cg_rtol; ew_gamma and ew_alpha are the parameters of choice 2, and
+        the forcing term is at most forcing_max. A loose forcing term (0.5 or above)
+        makes a poor direction on a nonconvex problem, e.g. Rosenbrock.
+
+        cg_preconditioner(A) is called with the HessianOperator A at each
+        proposal, and returns the preconditioner C(v, direction), as in TrustRegionCG.
+
+        The line search starts from rate 1, the Newton step.
+        If it fails along the Newton-CG direction, a line search along the gradient
+        is attempted, starting from the last accepted rate of the gradient.
+
+        state.eta is the forcing term of the next iteration.
+    """
+    optimizer_defaults = {
+                        'maxiter' : 1000,
+                        'conviter' : 2,
+                        'linesearch' : backtrace,
+                        'linesearchiter' : 100,
+                        'cg_preconditioner' : None,
+                        'cg_monitor' : None,
+                        'cg_maxiter' : 100,
+                        'cg_rtol' : 0.1,
+                        'forcing' : 'ew2',
+                        'forcing_max' : 0.1,
+                        'ew_gamma' : 0.9,
+                        'ew_alpha' : 2,
+                        }
+
+    def start(self, problem, state, x0):
+        if self.forcing not in (None, 'ew1', 'ew2'):
+            raise ValueError("unknown forcing term strategy %s" % self.forcing)
+
+        prop = Optimizer.start(self, problem, state, x0)
+        prop.eta = self.cg_rtol
+        prop.rnorm = None
+        prop.rate = 1.0
+        return prop
+
+    def propose(self, problem, state):
+        vs = problem.vs
+
+        Avp = HessianOperator(problem, state.x, state.Pg, state)
+
+        if self.cg_preconditioner:
+            C = self.cg_preconditioner(Avp)
+        else:
+            C = None
+
+        z, Az, message = truncated_cg(vs, Avp, state.Pg, state.eta, self.cg_maxiter,
+                monitor=self.cg_monitor, C=C)
+
+        prop, rate = self.linesearch(problem, state, z, 1.0, maxiter=self.linesearchiter)
+        rnorm = None
+
+        if prop is not None:
+            prop.message = "newton-cg " + message
+            if self.forcing == 'ew1':
+                r = vs.addmul(state.Pg, Az, -rate)
+                rnorm = vs.dot(r, r) ** 0.5
+            prop.rate = state.rate
+        else:
+            z = vs.mul(state.Pg, 1 / state.Pgnorm)
+            prop, rate = self.linesearch(problem, state, z, state.rate * 2, maxiter=self.linesearchiter)
+            if prop is None:
+                return None
+            prop.message = "gradient descent"
+            prop.rate = rate
+
+        prop.rnorm = rnorm
+        return prop
+
+    def accept(self, problem, state, prop):
+        if isinstance(prop, InitialProposal) or self.forcing is None:
+            eta = self.cg_rtol
+        elif prop.rnorm is None and self.forcing == 'ew1':
+            # no linear model at the gradient descent step
+            eta = state.eta
+        else:
+            eta = eisenstat_walker(state.eta, state.Pgnorm, prop.Pgnorm, prop.rnorm,
+                gamma=self.ew_gamma, alpha=self.ew_alpha, etamax=self.forcing_max)
+
+        state.eta = eta
+        state.rate = prop.rate
+        Optimizer.accept(self, problem, state, prop)
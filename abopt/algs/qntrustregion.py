@@ -0,0 +1,246 @@
+"""
+    Trust region with a limited memory quasi-Newton model of the Hessian,
+    which takes no Hessian vector products.
+
+    The model is
+
+        B = delta I + Psi M Psi^T,
+
+    the compact representation of L-BFGS or L-SR1 of
+
+        (BNS)
+        Representations of quasi-Newton matrices and their use in limited memory methods,
+        Byrd, R. H., Nocedal, J. & Schnabel, R. B. Mathematical Programming (1994) 63: 129.
+
+        doi:10.1007/BF01582063
+
+    'bfgs' : Psi = [S, Y], M = - E K^{-1} E, E = diag(delta, 1),
+             K = [[delta S^T S, L], [L^T, -D]];
+
+    'sr1'  : Psi = Y - delta S, M = (D + L + L^T - delta S^T S)^{-1},
+
+    where L and D are the strictly lower triangle and the diagonal of S^T Y,
+    and delta = y.y / y.s of the most recent pair of positive curvature.
+
+    The trust region subproblem is solved exactly in the eigen basis of B,
+    following the orthonormal basis (OBS) method of
+
+        (BEM)
+        On solving L-SR1 trust-region subproblems,
+        Brust, J., Erway, J. B. & Marcia, R. F. Comput. Optim. Appl. (2017) 66: 245.
+
+        doi:10.1007/s10589-016-9868-3
+
+    With Psi = Q R, R M R^T = U Lambda U^T, the eigen vectors are P = Q U
+    with eigen values Lambda + delta, and delta on the orthogonal complement of P.
+    The Gram matrix Psi^T Psi comes from the Gram matrices maintained
+    by CompactLBFGSHessian, thus Q is never formed; a subproblem takes
+    one blockdot and one blockaddmul of the gradient.
+"""
+
+import numpy
+
+from abopt.base import InitialProposal
+from abopt.algs.lbfgs import CompactLBFGSHessian
+from abopt.algs.trustregion import TrustRegionCG, solve_diagonal
+
+class QuasiNewtonModel(object):
+    """ A limited memory quasi-Newton model B of the Hessian; see the module docstring.
+
+        The pairs are stored in a CompactLBFGSHessian, which maintains the
+        Gram matrices of S and Y. For 'bfgs', pairs of negative curvature are skipped;
+        for 'sr1', pairs with |s.(y - Bs)| < sr1_skip |s| |y - Bs| are skipped.
+
+        The 'sr1' model is reset to the most recent pair if the condition number
+        of M exceeds sr1_maxcond. An ill conditioned M yields spurious eigen
+        values of B far below the curvature of the problem (e.g. -2e3 on
+        RosenProblem, whose Hessian has no eigen value below -3), which
+        repeatedly shrink the trust region to nothing.
+    """
+    def __init__(self, vs, m, model='bfgs', sr1_skip=1e-8, sr1_maxcond=1e2):
+        if model not in ('bfgs', 'sr1'):
+            raise ValueError("unknown quasi-Newton model %s" % model)
+
+        self.vs = vs
+        self.model = model
+        self.sr1_skip = sr1_skip
+        self.sr1_maxcond = sr1_maxcond
+        self.H = CompactLBFGSHessian(vs, m, curvature='skip' if model == 'bfgs' else None)
+        self.delta = 1.0
+
+        self._compact = None
+        self._eigen = None
+
+    def __len__(self):
+        return len(self.H.order)
+
+    def update(self, Px0, Px1, Pg0, Pg1):
+        vs = self.vs
+        dot = vs.dot
+
+        if self.model == 'sr1':
+            s = vs.addmul(Px1, Px0, -1)
+            r = vs.addmul(vs.addmul(Pg1, Pg0, -1), self.Bvp(s), -1)
+            sr = dot(s, r)
+            if abs(sr) < self.sr1_skip * (dot(s, s) * dot(r, r)) ** 0.5:
+                return
+
+        order = self.H.order[:]
+        self.H.update(Px0, Px1, Pg0, Pg1)
+        if self.H.order == order:
+            # refused
+            return
+
+        i = self.H.order[-1]
+        ys = self.H.StY[i, i]
+        if ys > 0:
+            self.delta = self.H.YY[-1] / ys
+
+        self._compact = None
+        self._eigen = None
+
+        if self.model == 'sr1' and len(self) > 1:
+            T, M = self.compact()
+            if numpy.linalg.cond(M) > self.sr1_maxcond:
+                while len(self) > 1:
+                    self.H.drop(0)
+                self._compact = None
+
+    def compact(self):
+        """ T and M, such that Psi = block^T T, where block is the storage of S and Y. """
+        if self._compact is not None:
+            return self._compact
+
+        H = self.H
+        n = H.nslots
+        ix = numpy.array(H.order, dtype='intp')
+        k = len(ix)
+        j = numpy.arange(k)
+        delta = self.delta
+
+        StS = H.StS[ix][:, ix]
+        StY = H.StY[ix][:, ix]
+        L = numpy.tril(StY, -1)
+        D = numpy.diag(numpy.diag(StY))
+
+        if self.model == 'bfgs':
+            T = numpy.zeros((2 * n, 2 * k))
+            T[ix, j] = 1
+            T[n + ix, k + j] = 1
+            K = numpy.vstack([numpy.hstack([delta * StS, L]), numpy.hstack([L.T, -D])])
+            E = numpy.concatenate([numpy.ones(k) * delta, numpy.ones(k)])
+            M = -E[:, None] * numpy.linalg.pinv(K) * E[None, :]
+        else:
+            T = numpy.zeros((2 * n, k))
+            T[ix, j] = -delta
+            T[n + ix, j] = 1
+            M = numpy.linalg.pinv(D + L + L.T - delta * StS)
+
+        self._compact = T, M
+        return self._compact
+
+    def eigen(self):
+        """ C and lam, such that P = block^T C are the eigen vectors of B
+            with eigen values lam, and B = delta I on the complement of P.
+        """
+        if self._eigen is not None:
+            return self._eigen
+
+        H = self.H
+        T, M = self.compact()
+
+        W = numpy.vstack([numpy.hstack([H.StS, H.StY]), numpy.hstack([H.StY.T, H.YtY])])
+        G = T.T.dot(W).dot(T)
+        s, V = numpy.linalg.eigh(G)
+
+        keep = s > 1e-10 * max(s.max() if len(s) else 0, 0)
+        s = s[keep]
+        V = V[:, keep]
+
+        R = s[:, None] ** 0.5 * V.T
+        Lambda, U = numpy.linalg.eigh(R.dot(M).dot(R.T))
+
+        C = T.dot(V / s[None, :] ** 0.5).dot(U)
+
+        self._eigen = C, Lambda + self.delta
+        return self._eigen
+
+    def Bvp(self, v):
+        """ B dot any vector; uppercase B indicates it is the Hessian. """
+        vs = self.vs
+        v1 = vs.mul(v, self.delta)
+        if len(self) == 0:
+            return v1
+
+        T, M = self.compact()
+        d = vs.blockdot(self.H.block, v)
+        return vs.blockaddmul(v1, self.H.block, T.dot(M.dot(T.T.dot(d))))
+
+    def solve(self, g, Delta):
+        """ z = -p, where p minimizes g.p + 0.5 p B p subject to |p| <= Delta,
+            and the change of the model mdiff = 0.5 z B z - g z.
+        """
+        vs = self.vs
+
+        gg = vs.dot(g, g)
+
+        if len(self) > 0:
+            C, lam = self.eigen()
+            a = C.T.dot(vs.blockdot(self.H.block, g))
+        else:
+            C, lam = None, numpy.zeros(0)
+            a = numpy.zeros(0)
+
+        # the complement of P is the last component.
+        aperp = max(gg - numpy.sum(a ** 2), 0) ** 0.5
+        lam1 = numpy.append(lam, self.delta)
+        a1 = numpy.append(a, aperp)
+
+        c, sigma = solve_diagonal(lam1, a1, Delta)
+
+        mdiff = numpy.dot(a1, c) + 0.5 * numpy.dot(lam1 * c, c)
+
+        # p = f g + P (c - f a)
+        f = c[-1] / aperp if aperp > 0 else 0.
+        z = vs.mul(g, -f)
+        if C is not None:
+            z = vs.blockaddmul(z, self.H.block, -C.dot(c[:-1] - f * a))
+
+        return z, mdiff
+
+    def __repr__(self):
+        return "QuasiNewtonModel(model=%s, len(Y)=%d, m=%d)" % (self.model, len(self), self.H.m)
+
+class QuasiNewtonTrustRegion(TrustRegionCG):
+    """ Trust region with the L-BFGS or L-SR1 model of m pairs.
+
+        The radius is updated in the same way as TrustRegionCG.
+
+        The model is updated with the pairs of the accepted steps; a rejected step
+        does not evaluate the gradient and thus does not update the model.
+        Only the objective and the gradient are evaluated.
+    """
+    optimizer_defaults = dict(TrustRegionCG.optimizer_defaults)
+    optimizer_defaults.update({
+                        'model' : 'bfgs',
+                        'sr1_skip' : 1e-8,
+                        'sr1_maxcond' : 1e2,
+                        })
+
+    def start(self, problem, state, x0):
+        prop = TrustRegionCG.start(self, problem, state, x0)
+        prop.B = QuasiNewtonModel(problem.vs, self.m, model=self.model,
+                    sr1_skip=self.sr1_skip, sr1_maxcond=self.sr1_maxcond)
+        return prop
+
+    def propose(self, problem, state):
+        z, mdiff = state.B.solve(state.Pg, state.radius)
+        return self.trust(problem, state, z, mdiff)
+
+    def accept(self, problem, state, prop):
+        if isinstance(prop, InitialProposal):
+            state.B = prop.B
+        elif prop.Px is not state.Px:
+            state.B.update(state.Px, prop.Px, state.Pg, prop.Pg)
+
+        TrustRegionCG.accept(self, problem, state, prop)
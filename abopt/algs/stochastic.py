@@ -0,0 +1,247 @@
+"""
+    Stochastic L-BFGS for objectives that are a mean over many terms,
+
+        f(x) = 1 / N sum_i f_i(x).
+
+    Every iteration evaluates the objective and gradient on a mini-batch
+    of terms, thus the cost of an iteration does not depend on N.
+    The step is the L-BFGS direction of the mini-batch gradient,
+    scaled by a decreasing step size; there is no line search.
+
+    The curvature pairs are built in either of two ways:
+
+    'overlap' : the multi-batch L-BFGS of
+
+        A Multi-Batch L-BFGS Method for Machine Learning,
+        Berahas, A. S., Nocedal, J. & Takac, M., NIPS (2016)
+
+        https://arxiv.org/abs/1605.06049
+
+      consecutive batches share half of their terms; y is the difference
+      of the gradients on the shared half, which is evaluated at both ends
+      of the step anyways. No additional evaluation is needed.
+
+    'hvp' : the stochastic quasi-Newton method (SQN) of
+
+        A Stochastic Quasi-Newton Method for Large-Scale Optimization,
+        Byrd, R. H., Hansen, S. L., Nocedal, J. & Singer, Y., SIAM J. Optim. (2016) 26: 1008.
+
+        doi:10.1137/140954362
+
+      every hessian_period iterations, s is the difference of the averaged
+      iterates, and y is a hessian vector product on a separate, larger batch.
+
+    Pairs of non-positive curvature are skipped.
+"""
+
+import numpy
+
+from abopt.base import Optimizer, Problem
+from abopt.base import Proposal, InitialProposal
+from abopt.base import ContinueIteration, ConvergedIteration
+from abopt.algs.lbfgs import LBFGSHessian, scalar
+
+class StochasticProblem(Problem):
+    """ A problem with an objective that is a mean over nterms terms.
+
+        The functions take an additional argument batch,
+        an integer array of the indices of the terms to average over,
+        or None for all terms:
+
+            objective(x, batch),
+            gradient(x, batch),
+            hessian_vector_product(x, v, batch).
+
+        The full objective and gradient (f, g, Hvp) are still available,
+        e.g. to monitor the progress or for other optimizers.
+    """
+    def __init__(self, objective, gradient, nterms,
+        hessian_vector_product=None,
+        **kwargs):
+
+        self.nterms = nterms
+
+        self._batch_objective = objective
+        self._batch_gradient = gradient
+        self._batch_hessian_vector_product = hessian_vector_product
+
+        if hessian_vector_product is not None:
+            full_hessian_vector_product = lambda x, v: hessian_vector_product(x, v, None)
+        else:
+            full_hessian_vector_product = None
+
+        Problem.__init__(self,
+                objective=lambda x: objective(x, None),
+                gradient=lambda x: gradient(x, None),
+                hessian_vector_product=full_hessian_vector_product,
+                **kwargs)
+
+    def f_batch(self, x, batch):
+        return self._batch_objective(x, batch)
+
+    def g_batch(self, x, batch):
+        """ This returns the gradient for the original variable"""
+        return self._batch_gradient(x, batch)
+
+    def PHvp_batch(self, x, v, batch):
+        """ This returns the preconditioned hessian of the batch times v, see PHvp. """
+        if self._batch_hessian_vector_product is None:
+            raise ValueError("hessian vector product is not defined")
+        vQ = self._precond.vPp(v, direction=-1)
+        return self._precond.Pvp(self._batch_hessian_vector_product(x, vQ, batch), direction=-1)
+
+class StochasticLBFGS(Optimizer):
+    """ Stochastic L-BFGS on a StochasticProblem.
+
+        The step size of iteration k is rate / (1 + rate_decay * k), or
+        schedule(k) if a schedule is given.
+
+        With m = 0 this is stochastic gradient descent.
+
+        Batches are drawn with replacement from random_state (a seed),
+        which avoids a permutation of all terms.
+
+        state.y and state.g are the estimates from the last mini-batch;
+        fev, gev and hev count the evaluations of mini-batches.
+    """
+    optimizer_defaults = {
+        'maxiter' : 1000,
+        'conviter' : 1,
+        'm' : 10,
+        'diag_update' : scalar,
+        'batchsize' : 64,
+        'pairs' : 'overlap',
+        'hessian_batchsize' : 256,
+        'hessian_period' : 10,
+        'rate' : 1.0,
+        'rate_decay' : 0.0,
+        'schedule' : None,
+        'random_state' : None,
+    }
+
+    def sample(self, problem, state, size):
+        return state.rng.randint(0, problem.nterms, size=size)
+
+    def get_rate(self, state):
+        if self.schedule is not None:
+            return self.schedule(state.nit)
+        return self.rate / (1 + self.rate_decay * state.nit)
+
+    def evaluate(self, problem, state, x, batches):
+        """ objective and gradient on the union of equally sized batches,
+            and the gradient of each batch.
+        """
+        vs = problem.vs
+        y = 0
+        g = 0
+        gs = []
+        for batch in batches:
+            yb = problem.f_batch(x, batch)
+            gb = problem.g_batch(x, batch)
+            state.fev = state.fev + 1
+            state.gev = state.gev + 1
+            y = y + yb / len(batches)
+            g = vs.addmul(g, gb, 1.0 / len(batches))
+            gs.append(gb)
+        return y, g, gs
+
+    def batches(self, problem, state):
+        """ batches of the next point; for 'overlap' the second half is shared with the point after. """
+        if self.pairs == 'overlap':
+            h = max(self.batchsize // 2, 1)
+            if 'batch' in state:
+                return [state.batch, self.sample(problem, state, h)]
+            return [self.sample(problem, state, h), self.sample(problem, state, h)]
+        elif self.pairs == 'hvp':
+            return [self.sample(problem, state, self.batchsize)]
+        else:
+            raise ValueError("unknown method of curvature pairs %s" % self.pairs)
+
+    def start(self, problem, state, x0):
+        if not isinstance(problem, StochasticProblem):
+            raise TypeError("StochasticLBFGS requires a StochasticProblem")
+
+        state.rng = numpy.random.RandomState(self.random_state)
+
+        Px0 = problem.x2Px(x0)
+        batches = self.batches(problem, state)
+        y0, g0, gs = self.evaluate(problem, state, x0, batches)
+
+        prop = InitialProposal(problem, x=x0, Px=Px0, y=y0, g=g0).complete(state)
+        prop.batches = batches
+        prop.gs = gs
+        prop.rate = self.get_rate(state)
+        return prop
+
+    def propose(self, problem, state):
+        addmul = problem.vs.addmul
+
+        z = state.B.hvp(state.Pg)
+        rate = self.get_rate(state)
+
+        Px1 = addmul(state.Px, z, -rate)
+        x1 = problem.Px2x(Px1)
+
+        batches = self.batches(problem, state)
+        y1, g1, gs = self.evaluate(problem, state, x1, batches)
+
+        prop = Proposal(problem, Px=Px1, x=x1, y=y1, g=g1, z=z)
+        prop.batches = batches
+        prop.gs = gs
+        prop.rate = rate
+        return prop
+
+    def update_pairs(self, problem, state, prop):
+        vs = problem.vs
+
+        if self.m == 0: return
+
+        if self.pairs == 'overlap':
+            # the gradients of the shared batch, at both ends of the step.
+            Pg0 = problem.g2Pg(state.gs[-1])
+            Pg1 = problem.g2Pg(prop.gs[0])
+            state.B.update(state.Px, prop.Px, Pg0, Pg1)
+            return
+
+        # 'hvp'
+        state.Pxsum = vs.addmul(state.Pxsum, prop.Px, 1)
+        state.nsum = state.nsum + 1
+        if state.nsum < self.hessian_period: return
+
+        Pxbar = vs.mul(state.Pxsum, 1.0 / state.nsum)
+        state.Pxsum = 0
+        state.nsum = 0
+
+        if state.Pxbar is not None:
+            s = vs.addmul(Pxbar, state.Pxbar, -1)
+            batch = self.sample(problem, state, self.hessian_batchsize)
+            y = problem.PHvp_batch(problem.Px2x(Pxbar), s, batch)
+            state.hev = state.hev + 1
+            zero = vs.zeros_like(s)
+            state.B.update(zero, s, zero, y)
+
+        state.Pxbar = Pxbar
+
+    def accept(self, problem, state, prop):
+        if isinstance(prop, InitialProposal):
+            state.B = LBFGSHessian(problem.vs, self.m, diag_update=self.diag_update, curvature='skip')
+            state.Pxsum = 0
+            state.nsum = 0
+            state.Pxbar = None
+        else:
+            self.update_pairs(problem, state, prop)
+
+        state.batch = prop.batches[-1]
+        state.gs = prop.gs
+        state.rate = prop.rate
+        Optimizer.accept(self, problem, state, prop)
+
+    def assess(self, problem, state, prop):
+        # the objective is noisy; only stop if the solution stopped moving.
+        if prop.gnorm <= problem.gtol:
+            return ConvergedIteration("Gradient is sufficiently small")
+
+        if prop.dxnorm <= problem.xtol:
+            return ConvergedIteration("Solution stopped moving")
+
+        return ContinueIteration("continue iteration")
@@ -0,0 +1,55 @@
+from __future__ import print_function
+
+import pytest
+
+from abopt.algs.anderson import AndersonAcceleration, AndersonHistory
+from abopt.testing import RosenProblem, ChiSquareProblem
+from abopt.vectorspace import real_vector_space
+import numpy
+from numpy.testing import assert_allclose
+
+@pytest.mark.parametrize("mixing", [None, 1e-3])
+def test_abopt_anderson(mixing):
+    anderson = AndersonAcceleration(mixing=mixing)
+    problem = RosenProblem()
+
+    r = anderson.minimize(problem, numpy.zeros(20))
+    assert r.converged
+    assert_allclose(r.x, 1.0, rtol=1e-4)
+
+def test_abopt_anderson_quad():
+    anderson = AndersonAcceleration()
+
+    J = numpy.array([ [0, 0,     2,  1],
+                      [0,  10,   2,  0],
+                      [40, 100,  0,  0],
+                      [400, 0,   0,  0]])
+
+    problem = ChiSquareProblem(J=J)
+    r = anderson.minimize(problem, numpy.zeros(4))
+    assert r.converged
+    assert_allclose(problem.f(r.x), 0, atol=1e-7)
+
+def test_anderson_history():
+    rng = numpy.random.RandomState(1)
+    H = numpy.diag(numpy.arange(1., 6.))
+    A = AndersonHistory(real_vector_space, m=3)
+
+    x = [rng.normal(size=5) for i in range(6)]
+    for x0, x1 in zip(x[:-1], x[1:]):
+        A.update(x0, x1, H.dot(x0), H.dot(x1))
+
+    assert len(A.dX) == 3
+    dG = numpy.array(A.dG)
+    # the gram matrix is maintained incrementally
+    ix = numpy.array(A.order)
+    assert_allclose(A.GtG[ix][:, ix], dG.dot(dG.T))
+
+    g = H.dot(x[-1])
+    beta = 0.1
+    gamma = numpy.linalg.lstsq(dG.T, g, rcond=-1)[0]
+    z = numpy.array(A.dX).T.dot(gamma) + beta * (g - dG.T.dot(gamma))
+    assert_allclose(A.mix(g, beta), z, rtol=1e-6)
+
+    A.reset()
+    assert_allclose(A.mix(g, beta), beta * g)
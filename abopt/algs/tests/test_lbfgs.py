@@ -2,7 +2,7 @@ from __future__ import print_function
 
 import pytest
 
-from abopt.base import Preconditioner
+from abopt.base import Preconditioner, State
 
 from abopt.linesearch import minpack, backtrace, exact
 
@@ -12,6 +12,7 @@ from abopt.algs.lbfgs import pre_scaled_direct_bfgs, pre_scaled_inverse_dfp
 from abopt.algs.lbfgs import post_scaled_direct_bfgs, post_scaled_inverse_dfp
 
 from abopt.testing import RosenProblem, ChiSquareProblem
+from abopt.vectorspace import real_vector_space, complex_vector_space
 import numpy
 from numpy.testing import assert_allclose
 
@@ -61,3 +62,346 @@ def test_abopt_lbfgs_quad(precond):
     r = lbfgs.minimize(problem, x0, monitor=print)
     assert r.converged
     assert_allclose(problem.f(r.x), 0.0, atol=1e-7)
+
+def test_abopt_lbfgs_warmstart():
+    lbfgs = LBFGS()
+
+    rng = numpy.random.RandomState(1)
+    J = numpy.eye(20) * 3 + rng.normal(size=(20, 20)) * 0.3
+
+    def make_problem(beta):
+        def phi(x): return x + beta * x ** 2
+        def phiprime(x): return 1 + 2 * beta * x
+        return ChiSquareProblem(J=J, phi=phi, phiprime=phiprime)
+
+    r = lbfgs.minimize(make_problem(0.0), numpy.zeros(20))
+    npairs = len(r.B.Y)
+
+    # continuation to a nearby problem.
+    problem = make_problem(0.04)
+    cold = lbfgs.minimize(problem, r.x)
+    warm = lbfgs.minimize(problem, r.x, **lbfgs.warmstart(r))
+
+    assert warm.converged
+    assert_allclose(problem.f(warm.x), 0.0, atol=1e-7)
+    assert warm.fev < cold.fev
+
+    # the old state is not modified by the new minimization.
+    assert len(r.B.Y) == npairs
+    assert r.B is not warm.B
+
+    # nothing to carry from a state without a hessian approximation.
+    assert lbfgs.warmstart(State()) == {}
+
+def test_abopt_lbfgs_hessian_validated():
+    from abopt.algs.lbfgs import LBFGSHessian
+    from abopt.vectorspace import real_vector_space
+
+    B = LBFGSHessian(real_vector_space, m=3)
+    x = numpy.zeros(2)
+    g = numpy.zeros(2)
+    for s, y in [([1, 0], [2, 0]), ([1, 0], [-1, 0]), ([0, 1], [0, 3])]:
+        s = numpy.array(s, dtype='f8')
+        y = numpy.array(y, dtype='f8')
+        B.update(x, x + s, g, g + y)
+
+    assert len(B.Y) == 3
+    B1 = B.validated()
+    assert len(B1.Y) == 2
+    assert all(ys > 0 for ys in B1.YS)
+    assert_allclose(B1.D, 1 / 3.)
+
+    assert len(B.validated(m=1).Y) == 1
+    assert B.validated(m=0) is None
+
+@pytest.mark.parametrize("diag_update", [scalar, post_scaled_direct_bfgs, inverse_dfp])
+@pytest.mark.parametrize("rescale_diag", [False, True])
+@pytest.mark.parametrize("vs", [real_vector_space, complex_vector_space])
+def test_compact_lbfgs_hessian(diag_update, rescale_diag, vs):
+    from abopt.algs.lbfgs import LBFGSHessian, CompactLBFGSHessian
+
+    B0 = LBFGSHessian(vs, m=3, diag_update=diag_update, rescale_diag=rescale_diag)
+    B1 = CompactLBFGSHessian(vs, m=3, diag_update=diag_update, rescale_diag=rescale_diag)
+
+    rng = numpy.random.RandomState(1)
+    A = rng.normal(size=(8, 8))
+    A = A.dot(A.T) + 8 * numpy.eye(8)
+    if vs is complex_vector_space:
+        A = A[:4, :4] + 0j
+
+    x = numpy.zeros(len(A), dtype=A.dtype)
+    v = rng.normal(size=len(A)) + 0 * x
+
+    for i in range(5):
+        assert_allclose(B1.hvp(v), B0.hvp(v))
+        x1 = x + (rng.normal(size=len(A)) + 0 * x)
+        B0.update(x, x1, A.dot(x), A.dot(x1))
+        B1.update(x, x1, A.dot(x), A.dot(x1))
+        x = x1
+
+    assert_allclose(B1.hvp(v), B0.hvp(v))
+    assert_allclose(B1.copy().hvp(v), B0.hvp(v))
+    assert_allclose(B1.validated(m=2).hvp(v), B0.validated(m=2).hvp(v))
+
+def test_abopt_lbfgs_compact():
+    problem = RosenProblem()
+    x0 = numpy.zeros(20)
+
+    r1 = LBFGS(compact=True).minimize(problem, x0)
+    assert r1.converged
+    assert_allclose(r1.x, 1.0, rtol=1e-4)
+
+    # same up to round off errors; a single trajectory on rosen is
+    # sensitive to the round off errors, thus compare a few starts.
+    rng = numpy.random.RandomState(1)
+    nit0, nit1 = [], []
+    for i in range(5):
+        x0 = rng.normal(size=20) * 1e-14
+        nit0.append(LBFGS().minimize(problem, x0).nit)
+        nit1.append(LBFGS(compact=True).minimize(problem, x0).nit)
+    assert abs(numpy.mean(nit1) - numpy.mean(nit0)) < 0.1 * numpy.mean(nit0)
+
+def test_lbfgs_hessian_ring_buffer():
+    from abopt.algs.lbfgs import LBFGSHessian
+
+    B = LBFGSHessian(real_vector_space, m=3)
+    rng = numpy.random.RandomState(1)
+
+    x = numpy.zeros(4)
+    g = numpy.zeros(4)
+    pairs = []
+    for i in range(7):
+        s = rng.normal(size=4)
+        B.update(x, x + s, g, g + 2 * s)
+        pairs.append(s)
+        if i == 0: block = B.block
+
+    # no new storage after the first update, the ordering is chronological.
+    assert B.block is block
+    assert len(B.S) == 3
+    for s0, s1 in zip(B.S, pairs[-3:]):
+        assert numpy.shares_memory(s0, block)
+        assert_allclose(s0, s1)
+    assert_allclose(B.Y[-1], 2 * pairs[-1])
+
+    # a degenerate pair does not replace the oldest pair.
+    B.update(x, x, g, g)
+    for s0, s1 in zip(B.S, pairs[-3:]):
+        assert_allclose(s0, s1)
+
+@pytest.mark.parametrize("dtype", ['f4', 'bf16'])
+@pytest.mark.parametrize("compact", [False, True])
+def test_abopt_lbfgs_history_dtype(dtype, compact):
+    lbfgs = LBFGS(history_dtype=dtype, compact=compact)
+    problem = RosenProblem()
+
+    x0 = numpy.zeros(20)
+    r = lbfgs.minimize(problem, x0)
+    assert r.converged
+    assert_allclose(r.x, 1.0, rtol=1e-4)
+    assert r.B.copy().block[0].dtype == numpy.dtype('f4')
+
+@pytest.mark.parametrize("dtype", [None, 'f4', 'bf16'])
+def test_abopt_lbfgs_memory_budget(dtype):
+    itemsize = {None : 8, 'f4' : 4, 'bf16' : 2}[dtype]
+    # 10 pairs and a spare of 20 elements.
+    budget = 2 * 20 * itemsize * 11
+
+    lbfgs = LBFGS(memory_budget=budget, history_dtype=dtype)
+    problem = RosenProblem()
+
+    r = lbfgs.minimize(problem, numpy.zeros(20))
+    assert r.converged
+    assert r.m == 10
+    assert r.B.capacity == 10
+
+    with pytest.raises(ValueError):
+        LBFGS(memory_budget=budget // 10).minimize(problem, numpy.zeros(20))
+
+def test_abopt_lbfgs_adapt_m():
+    ms = []
+    def monitor(state):
+        ms.append(state.m)
+
+    lbfgs = LBFGS(memory_budget=2 * 20 * 8 * 21, adapt_m=True, m=4)
+    problem = RosenProblem()
+
+    r = lbfgs.minimize(problem, numpy.zeros(20), monitor=monitor)
+    assert r.converged
+    assert_allclose(r.x, 1.0, rtol=1e-4)
+    assert ms[0] == 4
+    # the first step is plain gradient descent and shall not shrink m.
+    assert ms[1] == 4
+    assert max(ms) > 4
+    assert max(ms) <= 20
+    assert min(ms) >= lbfgs.m_min
+
+def test_lbfgs_hessian_resize():
+    from abopt.algs.lbfgs import LBFGSHessian
+
+    B = LBFGSHessian(real_vector_space, m=2, capacity=4)
+    x = numpy.zeros(4)
+    for i in range(4):
+        s = numpy.eye(4)[i]
+        B.update(x, x + s, x, x + s * (i + 1))
+    assert len(B.S) == 2
+    B.resize(4)
+    for i in range(4):
+        s = numpy.eye(4)[i]
+        B.update(x, x + s, x, x + s * (i + 1))
+    assert len(B.S) == 4
+    B.resize(1)
+    assert len(B.S) == 1
+    assert_allclose(B.S[0], numpy.eye(4)[3])
+
+    with pytest.raises(ValueError):
+        B.resize(5)
+
+@pytest.mark.parametrize("recovery", ['purge', 'drop_oldest', 'drop_suspicious'])
+def test_abopt_lbfgs_recovery(recovery):
+    lbfgs = LBFGS(linesearch=backtrace, recovery=recovery)
+    problem = RosenProblem()
+
+    r = lbfgs.minimize(problem, numpy.zeros(20))
+    assert r.converged
+    assert_allclose(r.x, 1.0, rtol=1e-4)
+
+def test_abopt_lbfgs_recovery_history():
+    from abopt.base import Problem
+
+    # a double well; the pairs in the concave region have ys < 0.
+    def f(x): return numpy.sum(x ** 4 / 4 - x ** 2 / 2 + 0.1 * x)
+    def g(x): return x ** 3 - x + 0.1
+    problem = Problem(objective=f, gradient=g)
+    x0 = numpy.array([2., 1.5, 0.1, -0.2, -2])
+
+    class RecordingLBFGS(LBFGS):
+        def recover(self, problem, state, B):
+            YS = list(B.YS)
+            B1 = LBFGS.recover(self, problem, state, B)
+            # the history of the state is not modified.
+            assert list(B.YS) == YS
+            self.nrecover += 1
+            return B1
+
+    def failing_linesearch(problem, state, z, rate, maxiter):
+        # the line search of the third LBFGS direction fails.
+        if maxiter == 3:
+            failing_linesearch.nlbfgs += 1
+            if failing_linesearch.nlbfgs == 3:
+                return None, None
+        return backtrace(problem, state, z, rate, maxiter)
+
+    histories = {}
+    for recovery, curvature in [('drop_oldest', None), ('drop_suspicious', None),
+                                ('drop_oldest', 'skip'), ('drop_oldest', 'damp')]:
+        failing_linesearch.nlbfgs = 0
+        lbfgs = RecordingLBFGS(linesearch=failing_linesearch, recovery=recovery,
+                    curvature=curvature, m=4, maxiter=3)
+        lbfgs.nrecover = 0
+        r = lbfgs.minimize(problem, x0)
+        assert lbfgs.nrecover > 0
+        histories[recovery, curvature] = numpy.array(r.B.YS)
+
+    # the first recovery happens with the pairs [ys > 0, ys < 0] in the history.
+    assert histories['drop_oldest', None][0] < 0
+    assert all(histories['drop_suspicious', None] > 0)
+    assert all(histories['drop_oldest', 'skip'] > 0)
+    assert all(histories['drop_oldest', 'damp'] > 0)
+
+    keys = list(histories)
+    for i, k1 in enumerate(keys):
+        for k2 in keys[i + 1:]:
+            h1, h2 = histories[k1], histories[k2]
+            assert len(h1) != len(h2) or not numpy.allclose(h1, h2)
+
+def test_lbfgs_hessian_drop():
+    from abopt.algs.lbfgs import LBFGSHessian
+
+    B = LBFGSHessian(real_vector_space, m=4)
+    x = numpy.zeros(4)
+    for i in range(3):
+        s = numpy.eye(4)[i]
+        B.update(x, x + s, x, x + s * (i + 1))
+    B.drop(0)
+    assert len(B.S) == 2
+    assert_allclose(B.S[0], numpy.eye(4)[1])
+    assert_allclose(B.YS, [2., 3.])
+
+@pytest.mark.parametrize("curvature", [None, 'skip', 'damp'])
+def test_lbfgs_hessian_curvature(curvature):
+    from abopt.algs.lbfgs import LBFGSHessian
+
+    B = LBFGSHessian(real_vector_space, m=4, curvature=curvature)
+    x = numpy.zeros(4)
+    s = numpy.ones(4)
+    B.update(x, x + s, x, x + s)
+    # a pair of negative curvature
+    B.update(x, x + s, x, x - s * 0.5)
+
+    if curvature is None:
+        assert len(B.S) == 2
+        assert B.YS[1] < 0
+    elif curvature == 'skip':
+        assert len(B.S) == 1
+    else:
+        assert len(B.S) == 2
+        # D is 1 after the first pair; y is damped to ys = 0.2 s^T s
+        assert_allclose(B.YS[1], 0.2 * s.dot(s))
+        assert_allclose(B.YS[1], B.S[1].dot(B.Y[1]))
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("diag_update", [scalar, post_scaled_direct_bfgs])
+@pytest.mark.parametrize("rescale_diag", [False, True])
+def test_lbfgs_operator(compact, diag_update, rescale_diag):
+    from abopt.algs.lbfgs import LBFGSOperator
+
+    rng = numpy.random.RandomState(1)
+    J = rng.normal(size=(8, 8)) + numpy.diag(numpy.arange(8) + 4.)
+    problem = ChiSquareProblem(J=J)
+    lbfgs = LBFGS(m=4, maxiter=6, compact=compact,
+            diag_update=diag_update, rescale_diag=rescale_diag)
+    B = lbfgs.minimize(problem, numpy.zeros(8)).B
+    assert len(B.S) == 4
+
+    op = LBFGSOperator(B)
+    v = rng.normal(size=8)
+    assert_allclose(op.hvp(v), B.hvp(v))
+    assert_allclose(op.Hvp(op.hvp(v)), v)
+    assert_allclose(op.apply(v, -1), B.hvp(v))
+    assert_allclose(op.apply(v, 1), op.Hvp(v))
+
+    problem = ChiSquareProblem(J=J, precond=op.preconditioner())
+    problem.check_preconditioner(v)
+    # the preconditioned inverse hessian of the approximation is the identity
+    assert_allclose(op.vCp(op.Hvp(op.Cvp(v))), v)
+
+def test_lbfgs_operator_curvature():
+    from abopt.algs.lbfgs import LBFGSHessian, LBFGSOperator
+
+    B = LBFGSHessian(real_vector_space, m=4)
+    x = numpy.zeros(4)
+    s = numpy.ones(4)
+    B.update(x, x + s, x, x - s)
+    with pytest.raises(ValueError):
+        LBFGSOperator(B)
+
+def test_abopt_lbfgs_operator_precondition():
+    from abopt.algs.lbfgs import LBFGSOperator
+    from abopt.algs.trustregion import TrustRegionCG
+
+    rng = numpy.random.RandomState(1)
+    U, r = numpy.linalg.qr(rng.normal(size=(20, 20)))
+    J = U.dot(numpy.diag(numpy.logspace(0, 1, 20))).dot(U.T)
+
+    B = LBFGS(m=10, maxiter=20).minimize(ChiSquareProblem(J=J), numpy.zeros(20)).B
+    op = LBFGSOperator(B)
+
+    trcg = TrustRegionCG(cg_preconditioner=op.cg_preconditioner)
+    r = trcg.minimize(ChiSquareProblem(J=J), numpy.zeros(20))
+    assert r.converged
+    assert_allclose(r.y, 0, atol=1e-7)
+
+    r = LBFGS().minimize(ChiSquareProblem(J=J, precond=op.preconditioner()), numpy.zeros(20))
+    assert r.converged
+    assert_allclose(r.y, 0, atol=1e-7)
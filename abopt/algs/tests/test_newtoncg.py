@@ -0,0 +1,72 @@
+from __future__ import print_function
+
+import pytest
+
+from abopt.algs.newtoncg import NewtonCG, truncated_cg
+from abopt.algs.trustregion import eisenstat_walker
+from abopt.linesearch import backtrace, minpack
+from abopt.testing import RosenProblem, ChiSquareProblem
+from abopt.vectorspace import real_vector_space
+import numpy
+from numpy.testing import assert_allclose
+
+def test_truncated_cg():
+    rng = numpy.random.RandomState(1)
+    A = rng.normal(size=(10, 10))
+    A = A.dot(A.T) + numpy.eye(10)
+    g = rng.normal(size=10)
+    Avp = lambda v: A.dot(v)
+
+    z, Az, message = truncated_cg(real_vector_space, Avp, g, 1e-10)
+    assert message == "converged"
+    assert_allclose(A.dot(z), g, atol=1e-8)
+    assert_allclose(Az, A.dot(z))
+
+    d = numpy.diag(A)
+    C = lambda v, direction: v * d ** direction
+    z, Az, message = truncated_cg(real_vector_space, Avp, g, 1e-10, C=C)
+    assert_allclose(A.dot(z), g, atol=1e-8)
+
+    # indefinite: stops with a descent direction.
+    A = numpy.diag([1., 2., -3.])
+    g = numpy.array([1., 1., 2.])
+    z, Az, message = truncated_cg(real_vector_space, lambda v: A.dot(v), g, 1e-10)
+    assert message == "negative curvature"
+    assert z.dot(g) > 0
+    assert_allclose(Az, A.dot(z))
+
+def test_eisenstat_walker():
+    # choice 2
+    assert_allclose(eisenstat_walker(0.1, 1.0, 0.1), 0.9 * 0.1 ** 2)
+    # safeguarded
+    assert_allclose(eisenstat_walker(0.5, 1.0, 0.1), 0.9 * 0.5 ** 2)
+    # capped
+    assert_allclose(eisenstat_walker(0.1, 1.0, 2.0), 0.9)
+    # choice 1
+    assert_allclose(eisenstat_walker(0.01, 1.0, 0.1, 0.05), 0.05)
+
+@pytest.mark.parametrize("forcing", [None, 'ew1', 'ew2'])
+@pytest.mark.parametrize("precond", [True, False])
+def test_newtoncg_rosen(forcing, precond):
+    ncg = NewtonCG(forcing=forcing)
+    problem = RosenProblem(precond=precond)
+
+    r = ncg.minimize(problem, numpy.zeros(20))
+    assert r.converged
+    assert_allclose(r.x, 1.0, rtol=1e-4)
+    assert r.nit < 100
+
+@pytest.mark.parametrize("linesearch", [backtrace, minpack])
+def test_newtoncg_quad(linesearch):
+    ncg = NewtonCG(linesearch=linesearch)
+
+    J = numpy.array([ [0, 0,     2,  1],
+                      [0,  10,   2,  0],
+                      [40, 100,  0,  0],
+                      [400, 0,   0,  0]])
+
+    problem = ChiSquareProblem(J=J)
+    r = ncg.minimize(problem, numpy.zeros(4))
+    assert r.converged
+    assert_allclose(problem.f(r.x), 0, atol=1e-7)
+    assert 0 < r.eta <= 0.1
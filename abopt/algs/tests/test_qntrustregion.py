@@ -0,0 +1,86 @@
+from __future__ import print_function
+
+import pytest
+
+from abopt.algs.qntrustregion import QuasiNewtonTrustRegion, QuasiNewtonModel, solve_diagonal
+from abopt.testing import RosenProblem, ChiSquareProblem
+from abopt.vectorspace import real_vector_space
+import numpy
+from numpy.testing import assert_allclose
+
+@pytest.mark.parametrize("model", ['bfgs', 'sr1'])
+def test_abopt_qntrustregion(model):
+    # about 650 iterations for 'bfgs' and 1100 for 'sr1'
+    trqn = QuasiNewtonTrustRegion(model=model, maxiter=1500)
+    problem = RosenProblem()
+
+    r = trqn.minimize(problem, numpy.zeros(100))
+    assert r.converged
+    assert r.hev == 0
+    assert_allclose(r.x, 1.0, rtol=1e-4)
+
+@pytest.mark.parametrize("model", ['bfgs', 'sr1'])
+def test_abopt_qntrustregion_quad(model):
+    trqn = QuasiNewtonTrustRegion(model=model)
+
+    J = numpy.array([ [0, 0,     2,  1],
+                      [0,  10,   2,  0],
+                      [40, 100,  0,  0],
+                      [400, 0,   0,  0]])
+
+    problem = ChiSquareProblem(J=J)
+    r = trqn.minimize(problem, numpy.zeros(4))
+    assert r.converged
+    assert r.hev == 0
+    assert_allclose(problem.f(r.x), 0, atol=1e-7)
+
+@pytest.mark.parametrize("model", ['bfgs', 'sr1'])
+def test_qn_model(model):
+    rng = numpy.random.RandomState(1)
+    n = 8
+    A = rng.normal(size=(n, n))
+    if model == 'bfgs':
+        A = A.dot(A.T) + numpy.eye(n)
+    else:
+        A = A + A.T
+
+    B = QuasiNewtonModel(real_vector_space, 4, model=model)
+    x = [rng.normal(size=n) for i in range(7)]
+    for x0, x1 in zip(x[:-1], x[1:]):
+        B.update(x0, x1, A.dot(x0), A.dot(x1))
+
+    assert len(B) == 4
+    Bd = numpy.array([B.Bvp(e) for e in numpy.eye(n)])
+
+    # the eigen vectors are orthonormal
+    C, lam = B.eigen()
+    P = B.H.block.T.dot(C)
+    assert_allclose(P.T.dot(P), numpy.eye(len(lam)), atol=1e-8)
+    assert_allclose(Bd.dot(P), P * lam, atol=1e-8)
+
+    g = rng.normal(size=n)
+    for Delta in [1e-2, 1., 1e2]:
+        z, mdiff = B.solve(g, Delta)
+        assert numpy.dot(z, z) ** 0.5 <= Delta * (1 + 1e-8)
+        assert_allclose(mdiff, 0.5 * z.dot(Bd.dot(z)) - g.dot(z), rtol=1e-6)
+
+def test_solve_diagonal():
+    lam = numpy.array([-1., 2., 3.])
+    a = numpy.array([1., 1., 1.])
+    c, sigma = solve_diagonal(lam, a, 0.5)
+    assert sigma >= 1
+    assert_allclose(numpy.dot(c, c) ** 0.5, 0.5)
+    assert_allclose(c, -a / (lam + sigma))
+
+    # hard case: no component along the negative curvature.
+    a = numpy.array([0., 1., 1.])
+    c, sigma = solve_diagonal(lam, a, 2.0)
+    assert_allclose(sigma, 1)
+    assert_allclose(numpy.dot(c, c) ** 0.5, 2.0)
+    assert_allclose(c[1:], -a[1:] / (lam[1:] + sigma))
+
+    # interior
+    lam = numpy.array([1., 2., 3.])
+    c, sigma = solve_diagonal(lam, a, 2.0)
+    assert sigma == 0
+    assert_allclose(c, -a / lam)
@@ -0,0 +1,44 @@
+from __future__ import print_function
+
+import pytest
+
+from abopt.algs.stochastic import StochasticLBFGS
+from abopt.testing import LeastSquaresProblem, RosenProblem
+import numpy
+from numpy.testing import assert_allclose
+
+@pytest.mark.parametrize("pairs, rate, rate_decay",
+    [
+        ('overlap', 0.1, 0.01),
+        ('hvp', 0.01, 0.0),
+    ]
+)
+def test_abopt_stochastic_lbfgs(pairs, rate, rate_decay):
+    problem = LeastSquaresProblem()
+    fmin = problem.f(problem.xmin)
+
+    slbfgs = StochasticLBFGS(pairs=pairs, rate=rate, rate_decay=rate_decay, maxiter=500, random_state=1)
+    r = slbfgs.minimize(problem, numpy.zeros(10))
+
+    assert problem.f(r.x) - fmin < 1e-3
+    assert len(r.B.S) > 0
+    # each iteration evaluates a mini-batch, not the full objective.
+    assert r.gev <= 2 * (r.nit + 1)
+    if pairs == 'hvp':
+        assert r.hev == (r.nit - 1) // slbfgs.hessian_period - 1
+
+    # L-BFGS beats SGD of the same cost
+    sgd = StochasticLBFGS(m=0, rate=0.01, rate_decay=0.01, maxiter=500, random_state=1)
+    r0 = sgd.minimize(problem, numpy.zeros(10))
+    assert problem.f(r.x) < problem.f(r0.x)
+
+def test_abopt_stochastic_lbfgs_reproducible():
+    problem = LeastSquaresProblem(nterms=1000)
+    slbfgs = StochasticLBFGS(rate=0.1, maxiter=20, random_state=3)
+    r1 = slbfgs.minimize(problem, numpy.zeros(10))
+    r2 = slbfgs.minimize(problem, numpy.zeros(10))
+    assert_allclose(r1.x, r2.x)
+
+def test_abopt_stochastic_lbfgs_problem():
+    with pytest.raises(TypeError):
+        StochasticLBFGS().minimize(RosenProblem(), numpy.zeros(2))
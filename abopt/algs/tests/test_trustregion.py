@@ -1,10 +1,12 @@
 from __future__ import print_function
 
-from abopt.algs.trustregion import cg_steihaug, TrustRegionCG
+from abopt.base import Problem
+from abopt.algs.trustregion import cg_steihaug, pipelined_cg_steihaug, gltr, CGSpectrum, solve_diagonal, TrustRegionCG, DeflationSubspace
 
 import numpy
 from numpy.testing import assert_allclose
 from abopt.testing import RosenProblem, ChiSquareProblem
+from abopt.vectorspace import real_vector_space, RealVectorSpace
 
 import pytest
 def test_cg_steihaug():
@@ -47,9 +49,274 @@ def test_cg_steihaug():
     assert_allclose(Avp(z), g)
 
 
+@pytest.mark.parametrize("Delta", [8000., 1.0])
+def test_cg_steihaug_full_output(Delta):
+    J = numpy.array([[0, 0, 0, 1],
+                      [0, 0, 2, 0],
+                      [0, 3, 0, 0],
+                      [400, 0, 0, 0]])
+
+    problem = ChiSquareProblem(J=J)
+    g = numpy.array([  -2.,   -4.,   -6., -800.])
+
+    calls = []
+    def Avp(v):
+        calls.append(v)
+        return problem.Hvp(0, v)
+
+    z, mdiff, Az = cg_steihaug(problem.vs, Avp, g, g * 0.5, Delta, 1e-8, full_output=True)
+    ncalls = len(calls)
+
+    assert_allclose(Az, Avp(z), atol=1e-8 * abs(Az).max())
+    assert_allclose(mdiff, 0.5 * z.dot(Avp(z)) - g.dot(z), rtol=1e-8)
+
+    calls[:] = []
+    assert_allclose(cg_steihaug(problem.vs, Avp, g, g * 0.5, Delta, 1e-8), z)
+    assert len(calls) == ncalls
+
+
+class CountingVectorSpace(RealVectorSpace):
+    """ counts the global reductions. """
+    def __init__(self):
+        self.nreductions = 0
+
+    def dot(self, a, b):
+        self.nreductions += 1
+        return RealVectorSpace.dot(self, a, b)
+
+    def blockdot(self, A, b):
+        self.nreductions += 1
+        return RealVectorSpace.blockdot(self, A, b)
+
+@pytest.mark.parametrize("precond", [True, False])
+@pytest.mark.parametrize("shift,Delta", [(0, 1e3), (0, 0.1), (8, 1.0)])
+def test_pipelined_cg_steihaug(precond, shift, Delta):
+    rng = numpy.random.RandomState(1)
+    n = 30
+    A = rng.normal(size=(n, n))
+    A = A.dot(A.T) + numpy.eye(n) - shift * numpy.eye(n)
+    g = rng.normal(size=n)
+    if precond:
+        d = abs(numpy.diag(A))
+        C = lambda v, direction: v * d ** direction
+    else:
+        C = None
+
+    calls = []
+    def Avp(v):
+        calls.append(v)
+        return A.dot(v)
+
+    vs = CountingVectorSpace()
+    z0, mdiff0, Az0 = cg_steihaug(vs, Avp, g, None, Delta, 1e-10, C=C, full_output=True)
+    nreductions0 = vs.nreductions
+
+    calls[:] = []
+    vs.nreductions = 0
+    z, mdiff, Az = pipelined_cg_steihaug(vs, Avp, g, Delta, 1e-10, C=C, full_output=True)
+
+    assert_allclose(z, z0, atol=1e-8)
+    assert_allclose(mdiff, mdiff0, rtol=1e-8)
+    assert_allclose(Az, A.dot(z), atol=1e-8)
+    # one reduction per product, and two for mdiff.
+    assert vs.nreductions <= len(calls) + 2
+    assert vs.nreductions < nreductions0 / 2
+
+@pytest.mark.parametrize("monitor", [None, lambda *args: None])
+def test_tr_pipelined_reductions(monitor):
+    rng = numpy.random.RandomState(1)
+    n = 30
+    A = rng.normal(size=(n, n))
+    A = A.dot(A.T) + numpy.eye(n)
+    b = rng.normal(size=n)
+
+    vs = CountingVectorSpace()
+    # the reductions between two hessian vector products of a cg iteration.
+    between = []
+    def hessian(x, v):
+        between.append(vs.nreductions)
+        vs.nreductions = 0
+        return A.dot(v)
+
+    problem = Problem(lambda x: 0.5 * x.dot(A).dot(x) - b.dot(x), lambda x: A.dot(x) - b,
+                hessian_vector_product=hessian, vs=vs)
+
+    trcg = TrustRegionCG(subproblem='pipelined', cg_monitor=monitor, maxradius=10.)
+    r = trcg.minimize(problem, numpy.zeros(n))
+    assert r.converged
+    assert_allclose(r.x, numpy.linalg.solve(A, b), rtol=1e-5)
+
+    if monitor is None:
+        assert numpy.median(between) == 1
+    else:
+        assert numpy.median(between) > 1
+
+@pytest.mark.parametrize("pipelined", [True, False])
+@pytest.mark.parametrize("precond", [True, False])
+def test_cg_spectrum(pipelined, precond):
+    rng = numpy.random.RandomState(1)
+    n = 20
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    A = (U * numpy.logspace(0, 2, n)).dot(U.T)
+    g = rng.normal(size=n)
+    if precond:
+        d = numpy.diag(A)
+        C = lambda v, direction: v * d ** direction
+        lam = numpy.linalg.eigvals(A / d[:, None]).real
+    else:
+        C = None
+        lam = numpy.linalg.eigvalsh(A)
+
+    def solve(Delta, maxiter):
+        spectrum = CGSpectrum()
+        if pipelined:
+            pipelined_cg_steihaug(real_vector_space, A.dot, g, Delta, 1e-12, maxiter, C=C, spectrum=spectrum)
+        else:
+            cg_steihaug(real_vector_space, A.dot, g, None, Delta, 1e-12, maxiter, C=C, spectrum=spectrum)
+        return spectrum
+
+    # the extreme ritz values converge first
+    spectrum = solve(1e6, 8)
+    ritz = spectrum.ritz_values()
+    assert len(ritz) == len(spectrum)
+    assert lam.min() <= ritz[0] <= 2 * lam.min()
+    assert_allclose(ritz[-1], lam.max(), rtol=3e-2)
+
+    spectrum = solve(1e6, 100)
+    assert_allclose(spectrum.ritz_values()[[0, -1]], [lam.min(), lam.max()], rtol=1e-6)
+
+    # truncated by the trust region; the ritz values are within the spectrum
+    spectrum = solve(1e-2, 100)
+    ritz = spectrum.ritz_values()
+    assert len(ritz) > 0
+    assert lam.min() * (1 - 1e-8) <= ritz[0] and ritz[-1] <= lam.max() * (1 + 1e-8)
+
+    # negative curvature gives a negative ritz value
+    spectrum = CGSpectrum()
+    B = numpy.diag([1., 2., -3.])
+    cg_steihaug(real_vector_space, B.dot, numpy.array([1., 1., 2.]), None, 10., 1e-12, spectrum=spectrum)
+    assert spectrum.ritz_values()[0] < 0
+
+@pytest.mark.parametrize("subproblem", ['steihaug', 'pipelined', 'gltr'])
+def test_tr_ritz(subproblem):
+    problem = RosenProblem()
+    states = []
+    trcg = TrustRegionCG(maxiter=1000, subproblem=subproblem)
+    r = trcg.minimize(problem, numpy.zeros(20), monitor=lambda state: states.append(
+            (state.ritz_min, state.ritz_max, state.ritz_cond, state.cg_niter, state.hev)))
+    assert r.converged
+    # no additional hessian vector products; the initial state has no ritz values
+    assert states[0] == (None, None, None, 0, 0)
+    ritz = [s for s in states[1:] if s[0] is not None]
+    assert len(ritz) > 0
+    for rmin, rmax, cond, niter, hev in ritz:
+        assert rmin <= rmax
+        if rmin > 0:
+            assert_allclose(cond, rmax / rmin)
+
+    # the iterations of each subproblem; cg takes a product at the starting point
+    # and pipelined cg skips that of the last step if it is truncated.
+    for s0, s1 in zip(states[:-1], states[1:]):
+        niter = s1[3]
+        nhev = s1[4] - s0[4]
+        if subproblem == 'gltr':
+            assert niter == nhev
+        elif subproblem == 'steihaug':
+            assert niter == nhev - 1
+        else:
+            assert nhev - 1 <= niter <= nhev
+
 @pytest.mark.parametrize("precond", [True, False])
-def test_tr(precond):
-    trcg = TrustRegionCG(maxradius=10., maxiter=100, cg_monitor=print)
+def test_cg_steihaug_deflation(precond):
+    rng = numpy.random.RandomState(1)
+    n = 40
+    # a few small eigen values
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    lam = numpy.concatenate([[1e-3, 1e-2, 3e-2], numpy.linspace(1, 2, n - 3)])
+    A = U.dot(numpy.diag(lam)).dot(U.T)
+    if precond:
+        c = numpy.linspace(1, 2, n)
+    else:
+        c = numpy.ones(n)
+
+    def C(v, direction):
+        return v * c ** direction
+
+    calls = []
+    def Avp(v):
+        calls.append(v)
+        return A.dot(v)
+
+    def Amp(V):
+        return numpy.array([Avp(v) for v in V])
+
+    D = DeflationSubspace(real_vector_space, 3, 20)
+    x = numpy.zeros(n)
+
+    g = rng.normal(size=n)
+    D.prepare(x, Amp)
+    z = cg_steihaug(real_vector_space, Avp, g, None, 1e8, 1e-8, C=C, deflation=D)
+    nplain = len(calls)
+    assert_allclose(z, numpy.linalg.solve(A, g), rtol=1e-5)
+    assert D.ready
+
+    # the Ritz values are close to the smallest eigen values
+    W = numpy.array(D.W)
+    assert_allclose(W.dot(A).dot(W.T), numpy.eye(len(W)) * numpy.diag(W.dot(A).dot(W.T)), atol=1e-8)
+
+    calls[:] = []
+    g = rng.normal(size=n)
+    D.prepare(x, Amp)
+    z, mdiff, Az = cg_steihaug(real_vector_space, Avp, g, None, 1e8, 1e-8, C=C, deflation=D, full_output=True)
+    assert len(calls) < nplain
+    assert_allclose(z, numpy.linalg.solve(A, g), rtol=1e-5)
+    assert_allclose(Az, A.dot(z), atol=1e-8)
+
+@pytest.mark.parametrize("Delta", [10., 1.0, 0.1])
+@pytest.mark.parametrize("precond", [True, False])
+def test_gltr(Delta, precond):
+    rng = numpy.random.RandomState(1)
+    # indefinite
+    A = rng.normal(size=(6, 6))
+    A = A + A.T
+    g = rng.normal(size=6)
+    if precond:
+        c = numpy.arange(1., 7.)
+    else:
+        c = numpy.ones(6)
+
+    def C(v, direction):
+        return v * c ** direction
+
+    calls = []
+    def Avp(v):
+        calls.append(v)
+        return A.dot(v)
+
+    z, mdiff, K = gltr(real_vector_space, Avp, g, Delta, 1e-10, C=C)
+    assert len(calls) <= 6
+
+    # the exact solution in the variable c^0.5 z
+    A1 = A / c[:, None] ** 0.5 / c[None, :] ** 0.5
+    lam, U = numpy.linalg.eigh(A1)
+    h, sigma = solve_diagonal(lam, -U.T.dot(g / c ** 0.5), Delta)
+    z1 = U.dot(h) / c ** 0.5
+
+    assert_allclose(z, z1, rtol=1e-6, atol=1e-8)
+    assert_allclose(mdiff, 0.5 * z.dot(A.dot(z)) - g.dot(z), rtol=1e-8)
+
+    # a smaller radius is solved in the same subspace.
+    calls[:] = []
+    z2, mdiff2 = K.solve(0.5 * Delta)
+    assert len(calls) == 0
+    assert_allclose(z2, gltr(real_vector_space, Avp, g, 0.5 * Delta, 1e-10, C=C)[0], rtol=1e-6, atol=1e-8)
+    assert_allclose(mdiff2, 0.5 * z2.dot(A.dot(z2)) - g.dot(z2), rtol=1e-8)
+
+@pytest.mark.parametrize("subproblem,cg_deflation", [('steihaug', 0), ('gltr', 0), ('steihaug', 4), ('pipelined', 0)])
+@pytest.mark.parametrize("precond", [True, False])
+def test_tr(precond, subproblem, cg_deflation):
+    trcg = TrustRegionCG(maxradius=10., maxiter=100, cg_monitor=print, subproblem=subproblem,
+                cg_deflation=cg_deflation)
     problem = RosenProblem(precond=precond)
 
     x0 = numpy.zeros(20)
@@ -57,6 +324,36 @@ def test_tr(precond):
     assert r.converged
     assert_allclose(r.x, 1.0, rtol=1e-4)
 
+@pytest.mark.parametrize("cg_forcing,subproblem", [('ew1', 'steihaug'), ('ew2', 'steihaug'), ('ew2', 'gltr'), ('ew1', 'pipelined')])
+def test_tr_forcing(cg_forcing, subproblem):
+    problem = RosenProblem()
+    x0 = numpy.zeros(20)
+
+    r0 = TrustRegionCG(maxiter=1000, subproblem=subproblem).minimize(problem, x0)
+
+    trcg = TrustRegionCG(maxiter=1000, subproblem=subproblem, cg_forcing=cg_forcing)
+    r = trcg.minimize(problem, x0)
+    assert r.converged
+    assert_allclose(r.x, 1.0, rtol=1e-4)
+    assert r.hev < r0.hev
+    assert r.cg_rtol <= trcg.cg_forcing_max
+
+    with pytest.raises(ValueError):
+        TrustRegionCG(subproblem='gltr', cg_forcing='ew1').minimize(problem, x0)
+
+@pytest.mark.parametrize("finite_difference", ['forward', 'central'])
+def test_tr_finite_difference(finite_difference):
+    from scipy.optimize import rosen, rosen_der
+    trcg = TrustRegionCG(maxradius=10., maxiter=100)
+    problem = Problem(rosen, rosen_der, finite_difference=finite_difference)
+
+    x0 = numpy.zeros(20)
+    r = trcg.minimize(problem, x0)
+    assert r.converged
+    assert_allclose(r.x, 1.0, rtol=1e-4)
+    # each product is counted as hvp_gev gradients.
+    assert r.gev > r.hev * problem.hvp_gev
+
 @pytest.mark.parametrize("alpha,beta", 
     [
     [1.0, 0.0],
@@ -81,15 +378,16 @@ def test_gaussnewton(alpha, beta):
     assert r.converged
     assert_allclose(problem.f(r.x), 0, atol=1e-7)
 
+@pytest.mark.parametrize("subproblem", ['steihaug', 'gltr'])
 @pytest.mark.parametrize("alpha,beta", 
     [
     [1.0, 0.0],
     ]
 )
-def test_gaussnewton_prec(alpha, beta):
+def test_gaussnewton_prec(alpha, beta, subproblem):
     trcg = TrustRegionCG(maxiter=100, cg_rtol=1e-9,
             rtol=1e-8, maxradius=80,
-            cg_monitor=print)
+            cg_monitor=print, subproblem=subproblem)
 
     J = numpy.array([ [1e6, 0,     0,  1],
                       [0,  10,   0,  0],
@@ -5,11 +5,83 @@
 
 """
 
-from abopt.base import Optimizer, Problem, Proposal
+import numpy
+from scipy.linalg import solve_triangular
+
+from abopt.base import Optimizer, Problem, Proposal, InitialProposal
 from abopt.base import ContinueIteration, ConvergedIteration, FailedIteration
 from abopt.linesearch import backtrace
 
+class HessianOperator(object):
+    """ The preconditioned Hessian A of problem at x, A v = problem.PHvp(x, v).
+
+        Calling it is the Avp of cg_steihaug and gltr; block(V) is the product
+        with a block of vectors, see Problem.PHmp. The products are counted
+        in state.hev, and the gradients of finite differences in state.gev,
+        if state is given.
+
+        Pg is a vector like those A acts on; builders of preconditioners
+        (see abopt.preconditioners) use it as a template.
+    """
+    def __init__(self, problem, x, Pg, state=None):
+        self.problem = problem
+        self.vs = problem.vs
+        self.x = x
+        self.Pg = Pg
+        self.state = state
+
+    def _count(self, n):
+        if self.state is not None:
+            self.state.hev = self.state.hev + n
+            self.state.gev = self.state.gev + self.problem.hvp_gev * n
+
+    def __call__(self, v):
+        self._count(1)
+        return self.problem.PHvp(self.x, v)
+
+    def block(self, V):
+        self._count(len(V))
+        return self.problem.PHmp(self.x, V)
+
 class TrustRegionCG(Optimizer):
+    """ Trust region with the subproblem solved by conjugate gradient.
+
+        cg_preconditioner(A) is called with the HessianOperator A at each
+        proposal, and returns the preconditioner C(v, direction) of cg; see
+        abopt.preconditioners for builders.
+
+        subproblem is 'steihaug' for cg_steihaug, 'pipelined' for pipelined_cg_steihaug,
+        which takes one global reduction per cg iteration, or 'gltr' for gltr. With 'gltr',
+        the Lanczos vectors are kept after a rejected step, and the subproblem
+        of the shrunk radius is solved in the same Krylov subspace, without
+        any Hessian vector product.
+
+        With cg_deflation > 0, the 'steihaug' subproblem is deflated by up to cg_deflation
+        Ritz vectors, refreshed from the first cg_recycle search directions of the
+        previous solve; see DeflationSubspace. At each new x, AW takes a block
+        product of cg_deflation vectors, see Problem.PHmp. These products are
+        counted in hev and are not always repaid by the shorter solves: on
+        RosenProblem(precond=True), n=20, cg_deflation=4 and cg_recycle=16 take
+        807 hev (296 of them for AW) and 87 iterations, against 617 and 68
+        without deflation. Hence it is off by default.
+
+        cg_forcing is None for the fixed tolerance cg_rtol of the subproblem, or
+        'ew1' and 'ew2' for the forcing terms of Eisenstat and Walker (see
+        eisenstat_walker), starting from cg_rtol and at most cg_forcing_max.
+        The tolerance is updated after an accepted step, from the reduction of the
+        gradient norm; a rejected step (rho < eta1) keeps it, as the gradient
+        is unchanged. 'ew1' takes the residual of the model from cg_steihaug,
+        and is not available with 'gltr'. state.cg_rtol is the tolerance of the
+        next subproblem.
+
+        The Ritz values of the preconditioned Hessian C^{-1} A in the Krylov subspace
+        of the last subproblem are kept in state.ritz, from the coefficients of cg
+        (see CGSpectrum) or the tridiagonal of gltr, without any Hessian vector product.
+        state.ritz_min, state.ritz_max and the condition number estimate
+        state.ritz_cond tell whether cg_preconditioner still helps; state.cg_niter
+        is the number of cg iterations of the subproblem, counted by the solver, and
+        0 if gltr reuses the Krylov subspace after a rejected step.
+    """
     optimizer_defaults = {'eta1' : 0.1,
                         'eta2' : 0.25,
                         'eta3' : 0.75,
@@ -24,36 +96,89 @@ class TrustRegionCG(Optimizer):
                         'cg_monitor' : None,
                         'cg_maxiter' : 50,
                         'cg_rtol' : 1e-2,
+                        'cg_forcing' : None,
+                        'cg_forcing_max' : 0.5,
                         'maxradius' : 100.,
                         'minradius' : 1e-9,
                         'initradius' : None,
+                        'subproblem' : 'steihaug',
+                        'cg_deflation' : 0,
+                        'cg_recycle' : 8,
                         }
 
     def propose(self, problem, state):
-        mul = problem.vs.mul
-        dot = problem.vs.dot
-        addmul = problem.vs.addmul
+        Avp = HessianOperator(problem, state.x, state.Pg, state)
 
-        def Avp(v):
-            state.hev = state.hev + 1
-            return problem.PHvp(state.x, v)
+        # None skips the reductions of the monitor in cg.
+        cg_monitor = self.cg_monitor
 
-        def cg_monitor(*kwargs):
-            if self.cg_monitor is not None:
-                self.cg_monitor(*kwargs)
+        # solve - H z = g constrained by the radius
+        radius1 = state.radius
+
+        if self.subproblem == 'gltr' and state.krylov is not None:
+            # the last step was rejected at the same x; solve in the same subspace.
+            z, mdiff = state.krylov.solve(radius1)
+            prop = self.trust(problem, state, z, mdiff)
+            if prop.Px is state.Px:
+                prop.krylov = state.krylov
+            prop.ritz = state.ritz
+            prop.cg_niter = 0
+            return prop
 
         if self.cg_preconditioner:
             C = self.cg_preconditioner(Avp)
         else:
             C = None
 
-        # solve - H z = g constrained by the radius
-        radius1 = state.radius
+        if self.subproblem == 'gltr':
+            z, mdiff, K = gltr(problem.vs, Avp, state.Pg, radius1,
+                    state.cg_rtol, self.cg_maxiter, monitor=cg_monitor, C=C)
+            prop = self.trust(problem, state, z, mdiff)
+            if prop.Px is state.Px:
+                prop.krylov = K
+            if len(K.alpha) > 0:
+                prop.ritz = numpy.linalg.eigvalsh(K.T)
+            else:
+                prop.ritz = numpy.zeros(0)
+            # one Lanczos step per iteration
+            prop.cg_niter = len(K.alpha)
+            return prop
+
+        spectrum = CGSpectrum()
 
-        z = cg_steihaug(problem.vs, Avp, state.Pg, state.z, radius1,
-                self.cg_rtol, self.cg_maxiter, monitor=cg_monitor, C=C)
+        if self.subproblem == 'pipelined':
+            z, mdiff, Az = pipelined_cg_steihaug(problem.vs, Avp, state.Pg, radius1,
+                    state.cg_rtol, self.cg_maxiter, monitor=cg_monitor, C=C, full_output=True,
+                    spectrum=spectrum)
+        elif self.subproblem == 'steihaug':
+            if state.deflation is not None:
+                state.deflation.prepare(state.Px, Avp.block)
 
-        mdiff = 0.5 * dot(z, Avp(z)) - dot(state.Pg, z)
+            # the model decrease is tracked by cg, avoiding another Hvp.
+            z, mdiff, Az = cg_steihaug(problem.vs, Avp, state.Pg, state.z, radius1,
+                    state.cg_rtol, self.cg_maxiter, monitor=cg_monitor, C=C, full_output=True,
+                    deflation=state.deflation, spectrum=spectrum)
+        else:
+            raise ValueError("unknown subproblem solver %s" % self.subproblem)
+
+        prop = self.trust(problem, state, z, mdiff)
+        prop.ritz = spectrum.ritz_values()
+        prop.cg_niter = spectrum.niter
+        if self.cg_forcing == 'ew1':
+            # the residual of the model at the step, g - A z.
+            r = problem.vs.addmul(state.Pg, Az, -1)
+            prop.rnorm = problem.vs.dot(r, r) ** 0.5
+        return prop
+
+    def trust(self, problem, state, z, mdiff):
+        """ Proposes the step Px - z, and the new radius from the ratio
+            of the actual change of the objective to the change mdiff of the model.
+        """
+        mul = problem.vs.mul
+        dot = problem.vs.dot
+        addmul = problem.vs.addmul
+
+        radius1 = state.radius
 
         Px1 = addmul(state.Px, z, -1)
         x1 = problem.Px2x(Px1)
@@ -78,7 +203,9 @@ class TrustRegionCG(Optimizer):
             # restart from the previus cg_steihaug result, but shrink the size to avoid
             # excessive recoveries.
             radius1 = min(self.t1 * radius1, state.Pgnorm)
-            prop = Proposal(problem, Px=state.Px, x=state.x, y=state.y, z=mul(z, 0.9 * radius1 / state.radius))
+            # the gradient at the current point is known.
+            prop = Proposal(problem, Px=state.Px, x=state.x, y=state.y, g=state.g, Pg=state.Pg,
+                            z=mul(z, 0.9 * radius1 / state.radius))
             prop.message = "poor descent "
         elif rho < self.eta2:
             # poor approximation but good descent, move and shrink
@@ -100,6 +227,10 @@ class TrustRegionCG(Optimizer):
 
         prop.radius = radius1
         prop.rho = rho
+        prop.krylov = None
+        prop.rnorm = None
+        prop.ritz = None
+        prop.cg_niter = None
 
         return prop
 
@@ -120,6 +251,11 @@ class TrustRegionCG(Optimizer):
         return ContinueIteration("normal iteration")
 
     def start(self, problem, state, x0):
+        if self.cg_forcing not in (None, 'ew1', 'ew2'):
+            raise ValueError("unknown forcing term strategy %s" % self.cg_forcing)
+        if self.cg_forcing == 'ew1' and self.subproblem == 'gltr':
+            raise ValueError("cg_forcing 'ew1' requires the 'steihaug' subproblem")
+
         prop = Optimizer.start(self, problem, state, x0)
 
         if self.initradius is None:
@@ -128,16 +264,52 @@ class TrustRegionCG(Optimizer):
             prop.radius = self.initradius
 
         prop.rho = 1.0
+        prop.krylov = None
+        prop.ritz = numpy.zeros(0)
+        prop.cg_niter = 0
+
+        if self.cg_deflation > 0 and self.subproblem == 'steihaug':
+            state.deflation = DeflationSubspace(problem.vs, self.cg_deflation, self.cg_recycle)
+        else:
+            state.deflation = None
         return prop
 
+    def update_spectrum(self, state, ritz, niter):
+        state.ritz = ritz
+        state.cg_niter = niter
+        if len(ritz) == 0:
+            state.ritz_min = None
+            state.ritz_max = None
+            state.ritz_cond = None
+            return
+
+        state.ritz_min = ritz[0]
+        state.ritz_max = ritz[-1]
+        if ritz[0] > 0:
+            state.ritz_cond = ritz[-1] / ritz[0]
+        else:
+            # indefinite
+            state.ritz_cond = numpy.inf
+
     def accept(self, problem, state, prop):
+        if isinstance(prop, InitialProposal) or self.cg_forcing is None:
+            state.cg_rtol = self.cg_rtol
+        elif prop.Px is not state.Px:
+            state.cg_rtol = eisenstat_walker(state.cg_rtol, state.Pgnorm, prop.Pgnorm,
+                    prop.rnorm, etamax=self.cg_forcing_max)
+
         state.radius = prop.radius
         state.rho = prop.rho
+        state.krylov = prop.krylov
+
+        if prop.ritz is not None:
+            self.update_spectrum(state, prop.ritz, prop.cg_niter)
 
         #print('accept', prop.y)
         Optimizer.accept(self, problem, state, prop)
 
-def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None):
+def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None, full_output=False,
+            deflation=None, spectrum=None):
     """ best effort solving for y = A^{-1} g with cg,
         given the trust-region constraint;
 
@@ -161,6 +333,23 @@ def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None)
 
         See Steihaug's paper. https://epubs.siam.org/doi/pdf/10.1137/0720042
 
+        If full_output is True, returns (z, mdiff, Az), where
+        mdiff = 0.5 z A z - g z is the change of the quadratic model
+        and Az = A z. A z is tracked along the iterations from the products
+        of the search directions, thus no additional Avp is needed.
+
+        If a DeflationSubspace is given as deflation, this is the deflated CG
+        of Saad et al. (see DeflationSubspace); the subspace shall have been
+        prepared at the current x. z0 is replaced by the projection of the solution
+        onto the subspace W, and the search directions are kept A-orthogonal to W.
+        The tolerance is then relative to the residual of g, rather than that of
+        the starting point. The deflation is skipped if W is empty, or the
+        projection is beyond the trust region. The search directions are recorded
+        and W is refreshed with the Ritz vectors at the end.
+
+        If a CGSpectrum is given as spectrum, the coefficients alpha and beta
+        and the number of iterations are recorded in it.
+
     """
     if C is None: C = lambda x, direction: x
 
@@ -171,23 +360,50 @@ def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None)
     if z0 is None:
         z0 = vs.zeros_like(g)
 
-    # FIXME: how to seed cg with a different starting point?
-    r0 = addmul(Avp(z0), g, -1)
+    recycle = deflation
+    if deflation is not None and not deflation.ready:
+        deflation = None
+
+    if deflation is not None:
+        z1, Az1 = deflation.project(g)
+        if dot(z1, C(z1, 1)) < Delta ** 2:
+            z0, Az0 = z1, Az1
+        else:
+            deflation = None
+
+    if deflation is None:
+        Az0 = Avp(z0)
+
+    r0 = addmul(Az0, g, -1)
     mr0 = C(r0, -1)
-    d0 = mul(mr0, 1)
 
-    j = 0
+    if deflation is not None:
+        d0 = deflation.deflate(mr0)
+        rho_init = dot(C(g, -1), g)
+    else:
+        d0 = mul(mr0, 1)
+        rho_init = dot(mr0, r0)   # <r, mr>
 
-    rho_init = dot(mr0, r0)   # <r, mr>
+    j = 0
 
-    rho0 = rho_init
+    # the tolerance is relative to rho_init; the steps take the residual of z0.
+    rho0 = dot(mr0, r0)
 
     while True:
         Bd0 = Avp(d0)
         dBd0 = dot(d0, Bd0)  # gamma
 
+        if spectrum is not None:
+            spectrum.niter = spectrum.niter + 1
+
+        if recycle is not None and dBd0 > 0:
+            recycle.record(d0, Bd0)
+
         alpha = rho0 / dBd0
 
+        if spectrum is not None and dBd0 != 0:
+            spectrum.record(alpha=alpha)
+
         p0 = addmul(z0, d0, -alpha)
 
         message = ""
@@ -195,6 +411,7 @@ def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None)
         if dBd0 == 0: # zero Hessian
             rho1 = 0 # will terminate
             z1 = z0
+            Az1 = Az0
             r1 = r0
             mr1 = mr0
             d1 = d0
@@ -215,11 +432,15 @@ def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None)
                 if c_ > 0:
                     tau = Delta / c_ ** 0.5
                 z1 = mul(z0, tau)
+                Az1 = mul(Az0, tau)
                 if a_ == 0:
                     message = "already at the right direction"
                     rho1 = -1
                 else:
                     message = "no solution to second order equation, restarting "
+                    deflation = None
+                    if spectrum is not None:
+                        spectrum.reset()
                     z0 = vs.zeros_like(g)
                     r0 = addmul(Avp(z0), g, -1)
                     mr0 = C(r0, -1)
@@ -231,6 +452,7 @@ def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None)
                 # tau may be a large number
                 # assert tau <= 0
                 z1 = addmul(z0, d0, tau)
+                Az1 = addmul(Az0, Bd0, tau)
 
                 if dBd0 <= 0:
                     rho1 = -1 # will terminate
@@ -246,11 +468,17 @@ def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None)
             d1 = d0
         else:
             z1 = addmul(z0, d0,  -alpha)
+            Az1 = addmul(Az0, Bd0, -alpha)
             r1 = addmul(r0, Bd0, -alpha)
             mr1 = C(r1, -1)
 
             rho1 = dot(mr1, r1)
-            d1 = mul(mr1, 1)
+            if spectrum is not None:
+                spectrum.record(beta=rho1 / rho0)
+            if deflation is not None:
+                d1 = deflation.deflate(mr1)
+            else:
+                d1 = mul(mr1, 1)
             d1 = addmul(d1, d0, rho1 / rho0)
 
 
@@ -260,6 +488,7 @@ def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None)
         mr0 = mr1
         d0 = d1
         z0 = z1
+        Az0 = Az1
         rho0 = rho1
 
         if monitor is not None:
@@ -277,4 +506,587 @@ def cg_steihaug(vs, Avp, g, z0, Delta, rtol, maxiter=1000, monitor=None, C=None)
             break
         j = j + 1
 
+    if recycle is not None:
+        recycle.refresh(C)
+
+    if full_output:
+        mdiff = 0.5 * dot(z0, Az0) - dot(g, z0)
+        return z0, mdiff, Az0
+
     return z0
+
+def pipelined_cg_steihaug(vs, Avp, g, Delta, rtol, maxiter=1000, monitor=None, C=None, full_output=False,
+            spectrum=None):
+    """ cg_steihaug with the pipelined preconditioned CG of
+
+            Hiding global synchronization latency in the preconditioned Conjugate Gradient algorithm,
+            Ghysels, P. & Vanroose, W. Parallel Computing (2014) 40: 224.
+
+            doi:10.1016/j.parco.2013.06.001
+
+        Each iteration takes one global reduction: (r, u) and (w, u) are
+        computed together with a blockdot of the block [r, w] against u, where
+        u = C^{-1} r and w = A u are carried by recurrences. The reduction
+        does not depend on the Hessian vector product of the iteration, A C^{-1} w,
+        thus on a vector space with a non-blocking reduction the two can overlap.
+        The product is taken after the reduction, such that the last
+        iteration does not spend it.
+
+        The trust region is enforced in the norm |z|_C = (z C z)^{1/2}, as in
+        cg_steihaug. z C z, z C p and p C p are updated with the scalar recurrences of
+
+            Solving the Trust-Region Subproblem using the Lanczos Method,
+            Gould, N. I. M., Lucidi, S., Roma, M. & Toint, P. L. SIAM J. Optim. (1999) 9: 504.
+
+            doi:10.1137/S1052623497322735
+
+        which hold because CG starts from z = 0; there is no warm start.
+        On negative curvature or when the step leaves the trust region, z
+        moves to the boundary along the search direction p.
+
+        The recurrences accumulate more rounding error than cg_steihaug;
+        the tolerance rtol is on the same preconditioned residual.
+        full_output and spectrum are the same as cg_steihaug.
+    """
+    if C is None: C = lambda x, direction: x
+
+    dot = vs.dot
+    addmul = vs.addmul
+
+    z = vs.zeros_like(g)
+    # r = g - A z, u = C^{-1} r, w = A u
+    r = g
+    u = C(r, -1)
+    w = Avp(u)
+
+    # storage of the reduction
+    RW = vs.block(g, 2)
+
+    # p, s = A p, q = C^{-1} s, Aq = A q
+    p = s = q = Aq = None
+
+    zCz = 0.
+    zCp = 0.
+    pCp = 0.
+    alpha = 0.
+    gamma0 = None
+
+    j = 0
+    message = "regular iteration"
+    while True:
+        vs.blockassign(RW, 0, 0, r)
+        vs.blockassign(RW, 1, 0, w)
+        gamma, delta = vs.blockdot(RW, u)
+
+        if gamma0 is None:
+            rho_init = gamma
+            if rho_init == 0:
+                message = "zero gradient"
+                break
+            beta = 0
+            eta = delta
+        else:
+            if gamma / rho_init < rtol ** 2:
+                break
+            if j > maxiter:
+                break
+            beta = gamma / gamma0
+            eta = delta - beta * gamma / alpha
+            if spectrum is not None:
+                spectrum.record(beta=beta)
+
+        if p is None:
+            p = u
+            s = w
+        else:
+            p = addmul(u, p, beta)
+            s = addmul(w, s, beta)
+
+        zCp = beta * (zCp + alpha * pCp)
+        pCp = gamma + beta ** 2 * pCp
+
+        if eta == 0: # zero Hessian
+            message = "zero hessian"
+            break
+
+        # a step along p, inside or to the boundary.
+        if spectrum is not None:
+            spectrum.niter = spectrum.niter + 1
+
+        alpha = gamma / eta
+        if spectrum is not None:
+            spectrum.record(alpha=alpha)
+
+        if eta < 0 or zCz + 2 * alpha * zCp + alpha ** 2 * pCp >= Delta ** 2:
+            # negative curvature or too fast; to the boundary along p.
+            tau = (-zCp + max(zCp ** 2 + pCp * (Delta ** 2 - zCz), 0) ** 0.5) / pCp
+            z = addmul(z, p, tau)
+            r = addmul(r, s, -tau)
+            if eta < 0:
+                message = "negative curvature "
+            else:
+                message = "truncation"
+            break
+
+        m = C(w, -1)
+        n = Avp(m)
+        if q is None:
+            q = m
+            Aq = n
+        else:
+            q = addmul(m, q, beta)
+            Aq = addmul(n, Aq, beta)
+
+        z = addmul(z, p, alpha)
+        r = addmul(r, s, -alpha)
+        w = addmul(w, Aq, -alpha)
+        u = addmul(u, q, -alpha)
+
+        zCz = zCz + 2 * alpha * zCp + alpha ** 2 * pCp
+        gamma0 = gamma
+
+        if monitor is not None:
+            zz = dot(z, z)
+            zg = dot(z, g)
+            gg = dot(g, g)
+            monitor(j, message, gamma, rho_init, rtol, zg / zz ** 0.5 / gg ** 0.5)
+
+        j = j + 1
+
+    if full_output:
+        Az = addmul(g, r, -1)
+        mdiff = 0.5 * dot(z, Az) - dot(g, z)
+        return z, mdiff, Az
+
+    return z
+
+class CGSpectrum(object):
+    """ The Ritz values of the preconditioned Hessian C^{-1} A, from the
+        coefficients of CG. CG is the Lanczos process of C^{-1} A; with the
+        step lengths alpha_j and the ratios beta_j = rho_{j+1} / rho_j of the
+        preconditioned residuals, the Lanczos tridiagonal is
+
+            T_jj = 1 / alpha_j + beta_{j-1} / alpha_{j-1},
+            T_j,j+1 = beta_j ** 0.5 / alpha_j,
+
+        see section 6.7.3 of
+
+            Iterative Methods for Sparse Linear Systems, Saad, Y., SIAM (2003), 2nd ed.
+
+        The extreme Ritz values converge to the extreme eigen values of C^{-1} A
+        in a few iterations; no Hessian vector product is taken. A negative
+        alpha is the step of negative curvature.
+
+        niter is the number of iterations counted by the solver; unlike the
+        coefficients, it includes the iterations before a restart or after a breakdown.
+    """
+    def __init__(self):
+        self.alpha = []
+        self.beta = []
+        self.niter = 0
+
+    def record(self, alpha=None, beta=None):
+        """ records the step length of a direction, or the ratio beta to the next direction. """
+        if alpha is not None:
+            self.alpha.append(alpha)
+        if beta is not None:
+            self.beta.append(beta)
+
+    def reset(self):
+        """ drops the coefficients, when CG restarts. """
+        self.alpha = []
+        self.beta = []
+
+    def __len__(self):
+        """ the number of coefficients before a breakdown, e.g. a vanishing residual. """
+        k = 0
+        for alpha in self.alpha:
+            if not numpy.isfinite(alpha) or alpha == 0:
+                break
+            if k > 0:
+                if k > len(self.beta) or not numpy.isfinite(self.beta[k - 1]) or self.beta[k - 1] < 0:
+                    break
+            k = k + 1
+        return k
+
+    @property
+    def T(self):
+        k = len(self)
+        alpha = numpy.array(self.alpha[:k], dtype='f8')
+        beta = numpy.array(self.beta[:k - 1], dtype='f8')
+        diag = 1 / alpha
+        diag[1:] += beta / alpha[:-1]
+        off = beta ** 0.5 / alpha[:-1]
+        return numpy.diag(diag) + numpy.diag(off, 1) + numpy.diag(off, -1)
+
+    def ritz_values(self):
+        """ the eigen values of T in ascending order. """
+        if len(self) == 0:
+            return numpy.zeros(0)
+        return numpy.linalg.eigvalsh(self.T)
+
+def eisenstat_walker(eta0, gnorm0, gnorm1, rnorm0=None, gamma=0.9, alpha=2, etamax=0.9):
+    """ The forcing term eta of the next inexact Newton iteration,
+        the relative tolerance of the linear solver, from
+
+            Choosing the forcing terms in an inexact Newton method,
+            Eisenstat, S. C. & Walker, H. F. SIAM J. Sci. Comput. (1996) 17: 16.
+
+            doi:10.1137/0917003
+
+        gnorm0 and gnorm1 are the gradient norms before and after the last step,
+        and eta0 is the last forcing term.
+
+        If rnorm0 = |g0 + A s0|, the residual of the linear model at the last step,
+        is given, this is choice 1,
+
+            eta = |gnorm1 - rnorm0| / gnorm0,
+
+        safeguarded by eta0 ** ((1 + sqrt(5)) / 2); otherwise choice 2,
+
+            eta = gamma (gnorm1 / gnorm0) ** alpha,
+
+        safeguarded by gamma eta0 ** alpha. The safeguard applies if it is above 0.1,
+        such that eta does not drop abruptly, and eta is at most etamax.
+    """
+    if rnorm0 is not None:
+        eta = abs(gnorm1 - rnorm0) / gnorm0
+        safe = eta0 ** (0.5 * (1 + 5 ** 0.5))
+    else:
+        eta = gamma * (gnorm1 / gnorm0) ** alpha
+        safe = gamma * eta0 ** alpha
+
+    if safe > 0.1:
+        eta = max(eta, safe)
+
+    return min(eta, etamax)
+
+def solve_diagonal(lam, a, Delta, rtol=1e-10, maxiter=100):
+    """ Minimizes a.c + 0.5 sum lam c^2 subject to |c| <= Delta.
+
+        The multiplier sigma >= max(0, -min(lam)) is found with a safeguarded
+        Newton iteration on the secular equation 1 / |c(sigma)| - 1 / Delta = 0,
+        where c(sigma) = - a / (lam + sigma). In the hard case, where the
+        components of a along the smallest lam vanish, the step is completed
+        along the first of those.
+
+        Returns c and sigma.
+    """
+    lmin = lam.min()
+    anorm = numpy.sum(a ** 2) ** 0.5
+
+    if lmin > 0:
+        c = -a / lam
+        if numpy.sum(c ** 2) ** 0.5 <= Delta:
+            return c, 0.
+
+    lo = max(0., -lmin)
+
+    small = lam - lmin <= 1e-12 * max(1., numpy.abs(lam).max())
+    if numpy.all(numpy.abs(a[small]) <= 1e-10 * anorm):
+        d = lam + lo
+        d[small] = numpy.inf
+        c = -a / d
+        cnorm = numpy.sum(c ** 2) ** 0.5
+        if cnorm <= Delta:
+            # hard case
+            c[numpy.argmax(small)] = (Delta ** 2 - cnorm ** 2) ** 0.5
+            return c, lo
+
+    # |c(hi)| <= anorm / (lmin + hi) <= Delta
+    hi = lo + anorm / Delta
+    sigma = hi
+
+    for i in range(maxiter):
+        d = lam + sigma
+        c = -a / d
+        cnorm = numpy.sum(c ** 2) ** 0.5
+        if abs(cnorm - Delta) <= rtol * Delta: break
+
+        phi = 1 / cnorm - 1 / Delta
+        if phi < 0:
+            lo = sigma
+        else:
+            hi = sigma
+
+        dphi = numpy.sum(a ** 2 / d ** 3) / cnorm ** 3
+        sigma1 = sigma - phi / dphi
+        if not lo < sigma1 < hi:
+            sigma1 = 0.5 * (lo + hi)
+        sigma = sigma1
+
+    return c, sigma
+
+class LanczosSubspace(object):
+    """ The Krylov subspace of A and g built by gltr.
+
+        Q are the Lanczos vectors, orthonormal under the inner product of
+        the preconditioner C, and T = Q^T A Q is tridiagonal, with the
+        diagonal alpha and the off-diagonal beta; Q^T g = gamma e_0.
+
+        The trust region subproblem restricted to the subspace is solved
+        with the eigen decomposition of T; solve takes no Avp, thus the
+        subproblem of a different radius is solved again at no cost.
+    """
+    def __init__(self, vs):
+        self.vs = vs
+        self.Q = None
+        self.k = 0
+        self.alpha = []
+        self.beta = []
+        self.gamma = 0.
+
+    def append(self, q):
+        vs = self.vs
+        if self.Q is None:
+            self.Q = vs.block(q, 8)
+        elif self.k == len(self.Q):
+            # grow the storage by doubling.
+            Q = vs.block(q, 2 * self.k)
+            for i in range(self.k):
+                Q[i] = self.Q[i]
+            self.Q = Q
+        self.Q[self.k] = q
+        self.k = self.k + 1
+
+    @property
+    def T(self):
+        k = len(self.alpha)
+        b = numpy.array(self.beta[:k - 1])
+        return numpy.diag(self.alpha) + numpy.diag(b, 1) + numpy.diag(b, -1)
+
+    def solve_tridiagonal(self, Delta):
+        """ h minimizing 0.5 h T h - gamma h_0 subject to |h| <= Delta,
+            the minimum mdiff, and the multiplier sigma.
+        """
+        lam, U = numpy.linalg.eigh(self.T)
+        a = -self.gamma * U[0]
+        c, sigma = solve_diagonal(lam, a, Delta)
+        mdiff = numpy.dot(a, c) + 0.5 * numpy.dot(lam * c, c)
+        return U.dot(c), mdiff, sigma
+
+    def solve(self, Delta):
+        """ z = Q h and mdiff = 0.5 z A z - g z of the subproblem of radius Delta. """
+        if len(self.alpha) == 0:
+            return self.vs.zeros_like(self.Q[0]), 0.
+
+        h, mdiff, sigma = self.solve_tridiagonal(Delta)
+        z = self.vs.blockaddmul(0, self.Q[:len(h)], h)
+        return z, mdiff
+
+def gltr(vs, Avp, g, Delta, rtol, maxiter=1000, monitor=None, C=None):
+    """ Solving for z = A^{-1} g given the trust-region constraint |z|_C <= Delta,
+        with the generalized Lanczos trust region method of
+
+            Solving the trust-region subproblem using the Lanczos method,
+            Gould, N. I. M., Lucidi, S., Roma, M. & Toint, P. L., SIAM J. Optim. (1999) 9: 504.
+
+            doi:10.1137/S1052623497322735
+
+        Unlike cg_steihaug, the iteration continues on the boundary and in
+        directions of negative curvature, and the solution is the minimum of
+        the model in the Krylov subspace. The iteration stops when the residual
+        of the subproblem is below rtol times |g|_{C^{-1}}.
+
+        C(v, direction) the preconditioner operator, as in cg_steihaug.
+
+        Returns (z, mdiff, subspace), where mdiff = 0.5 z A z - g z is the change
+        of the quadratic model, and subspace is the LanczosSubspace; the Lanczos
+        vectors are kept, such that subspace.solve(Delta1) solves the subproblem
+        of another radius without any Avp.
+    """
+    if C is None: C = lambda x, direction: x
+
+    dot = vs.dot
+    mul = vs.mul
+    addmul = vs.addmul
+
+    K = LanczosSubspace(vs)
+
+    w = g
+    u = C(w, -1)
+    gamma = dot(w, u) ** 0.5
+    K.gamma = gamma
+
+    if gamma == 0:
+        K.append(vs.zeros_like(g))
+        return vs.zeros_like(g), 0., K
+
+    # q is the Lanczos vector, p = C q.
+    q = mul(u, 1 / gamma)
+    p = mul(w, 1 / gamma)
+    p0 = None
+    beta0 = 0
+
+    j = 0
+    while True:
+        K.append(q)
+        Aq = Avp(q)
+        alpha = dot(q, Aq)
+        K.alpha.append(alpha)
+
+        w = addmul(Aq, p, -alpha)
+        if p0 is not None:
+            w = addmul(w, p0, -beta0)
+        u = C(w, -1)
+        beta = max(dot(w, u), 0) ** 0.5
+
+        h, mdiff, sigma = K.solve_tridiagonal(Delta)
+
+        # |g - A z - sigma C z|_{C^{-1}}
+        res = beta * abs(h[-1])
+
+        if sigma == 0:
+            message = "interior"
+        else:
+            message = "boundary"
+
+        if monitor is not None:
+            monitor(j, message, res ** 2, gamma ** 2, rtol, sigma)
+
+        if res <= rtol * gamma:
+            break
+
+        if beta <= 1e-14 * gamma:
+            # the subspace is invariant
+            break
+
+        if j >= maxiter:
+            break
+
+        K.beta.append(beta)
+        p0 = p
+        beta0 = beta
+        q = mul(u, 1 / beta)
+        p = mul(w, 1 / beta)
+        j = j + 1
+
+    z = vs.blockaddmul(0, K.Q[:len(h)], h)
+    return z, mdiff, K
+
+class DeflationSubspace(object):
+    """ The approximate eigen vectors W of A with the smallest eigen values,
+        recycled across the cg_steihaug solves of a sequence of slowly changing A,
+        for the deflated CG of
+
+            A deflated version of the conjugate gradient algorithm,
+            Saad, Y., Yeung, M., Erhel, J. & Guyomarc'h, F., SIAM J. Sci. Comput. (2000) 21: 1909.
+
+            doi:10.1137/S1064829598339761
+
+        Up to k vectors are kept in W, and the first l search directions
+        of each solve are recorded. At the end of a solve, W is replaced by the
+        Ritz vectors of the smallest positive Ritz values of the preconditioned A
+        in the span of W and the recorded directions, which takes no Avp.
+
+        prepare(Px, Amp) computes AW at a new point with one block product
+        of k vectors, Amp(W); it does nothing if the point did not change.
+        The deflation is not ready if W^T A W is not positive definite.
+    """
+    def __init__(self, vs, k, l):
+        self.vs = vs
+        self.k = k
+        self.l = l
+        self.Z = None
+        self.AZ = None
+        self.nW = 0
+        self.nP = 0
+        self.Px = None
+        self.ready = False
+
+    @property
+    def W(self):
+        return self.Z[:self.nW]
+
+    @property
+    def AW(self):
+        return self.AZ[:self.nW]
+
+    def _blockgram(self, A, B):
+        return numpy.array([self.vs.blockdot(A, b) for b in B])
+
+    def prepare(self, Px, Amp):
+        if Px is self.Px: return
+        self.Px = Px
+        self.nP = 0
+
+        if self.nW == 0:
+            self.ready = False
+            return
+
+        AW = Amp(self.W)
+        for i in range(self.nW):
+            self.AZ[i] = AW[i]
+
+        self._factor()
+
+    def _factor(self):
+        WtAW = self._blockgram(self.W, self.AW)
+        WtAW = 0.5 * (WtAW + WtAW.T)
+        try:
+            self.L = numpy.linalg.cholesky(WtAW)
+            self.ready = True
+        except numpy.linalg.LinAlgError:
+            self.ready = False
+
+    def _solve(self, b):
+        """ (W^T A W)^{-1} b """
+        return solve_triangular(self.L, solve_triangular(self.L, b, lower=True), lower=True, trans='T')
+
+    def project(self, g):
+        """ z = W (W^T A W)^{-1} W^T g, and A z. """
+        c = self._solve(self.vs.blockdot(self.W, g))
+        return self.vs.blockaddmul(0, self.W, c), self.vs.blockaddmul(0, self.AW, c)
+
+    def deflate(self, v):
+        """ v - W (W^T A W)^{-1} (AW)^T v, which is A-orthogonal to W. """
+        mu = self._solve(self.vs.blockdot(self.AW, v))
+        return self.vs.blockaddmul(v, self.W, -mu)
+
+    def record(self, d, Ad):
+        if self.nP >= self.l: return
+        if self.Z is None:
+            self.Z = self.vs.block(d, self.k + self.l)
+            self.AZ = self.vs.block(d, self.k + self.l)
+        self.Z[self.k + self.nP] = d
+        self.AZ[self.k + self.nP] = Ad
+        self.nP = self.nP + 1
+
+    def refresh(self, C=None):
+        """ Replaces W with the Ritz vectors; AW remains valid at the same point. """
+        if C is None: C = lambda x, direction: x
+
+        if self.nP == 0: return
+
+        vs = self.vs
+        ix = list(range(self.nW)) + list(range(self.k, self.k + self.nP))
+        Z = [self.Z[i] for i in ix]
+        AZ = [self.AZ[i] for i in ix]
+
+        F = self._blockgram(Z, AZ)
+        F = 0.5 * (F + F.T)
+        G = self._blockgram(Z, [C(z, 1) for z in Z])
+        G = 0.5 * (G + G.T)
+
+        # Rayleigh-Ritz in a basis orthonormal in the norm of C.
+        s, V = numpy.linalg.eigh(G)
+        keep = s > 1e-10 * s.max()
+        B = V[:, keep] / s[keep] ** 0.5
+        theta, U = numpy.linalg.eigh(B.T.dot(F).dot(B))
+        Y = B.dot(U[:, theta > 0][:, :self.k])
+
+        W = [vs.blockaddmul(0, Z, y) for y in Y.T]
+        AW = [vs.blockaddmul(0, AZ, y) for y in Y.T]
+        for i in range(len(W)):
+            self.Z[i] = W[i]
+            self.AZ[i] = AW[i]
+
+        self.nW = len(W)
+        self.nP = 0
+        if self.nW > 0:
+            self._factor()
+        else:
+            self.ready = False
+
+    def __repr__(self):
+        return "DeflationSubspace(len(W)=%d, k=%d, l=%d)" % (self.nW, self.k, self.l)
@@ -0,0 +1,197 @@
+"""
+    Ask / tell interface.
+
+    The optimizer does not call the objective and gradient itself.
+    It emits evaluation requests, and the caller dispatches them as it likes
+    (e.g. to a batch scheduler) and tells the results back later:
+
+        opt = AskTell(LBFGS(), x0)
+        while not opt.done:
+            for request in opt.ask():
+                if request.kind == 'objective':
+                    opt.tell(request, f(request.x))
+                elif request.kind == 'gradient':
+                    opt.tell(request, g(request.x))
+        state = opt.state
+
+    Any optimizer can be driven this way; it runs on a worker thread and
+    blocks until the requested quantity is told.
+    Several requests are outstanding at once if the optimizer evaluates
+    concurrently, e.g. with ``parallel_backtrace`` as the line search.
+"""
+
+import threading
+import time
+
+from abopt.base import Problem, State
+
+class AskTellClosed(RuntimeError): pass
+
+class Evaluation(object):
+    """ A request to evaluate a quantity of the problem.
+
+        Attributes
+        ----------
+        kind : string
+            'objective', 'gradient', 'hessian_vector_product' or
+            'inverse_hessian_vector_product'.
+        x : the point of the evaluation, not preconditioned.
+        v : the vector of the products, None for objective and gradient.
+    """
+    def __init__(self, kind, x, v=None):
+        self.kind = kind
+        self.x = x
+        self.v = v
+        self.result = None
+        self.error = None
+        self._event = threading.Event()
+
+    def __repr__(self):
+        return "Evaluation(kind=%s)" % self.kind
+
+class AskTell(object):
+    """ Drives an optimizer with externally dispatched evaluations.
+
+        Parameters
+        ----------
+        optimizer : Optimizer
+        x0 : the starting point.
+        hessian_vector_product : bool
+            if the caller will answer 'hessian_vector_product' requests.
+        inverse_hessian_vector_product : bool
+            if the caller will answer 'inverse_hessian_vector_product' requests.
+        monitor : function(state), called from the optimizer thread.
+        problem_args : dict
+            other arguments of Problem, e.g. vs, precond, atol, rtol, xtol, gtol.
+        state_args :
+            initial attributes of the state, as in Optimizer.minimize.
+
+        Attributes
+        ----------
+        state : State
+            the state of the minimization; final once done is True.
+        done : bool
+            if the minimization has ended.
+    """
+    def __init__(self, optimizer, x0,
+            hessian_vector_product=False,
+            inverse_hessian_vector_product=False,
+            monitor=None, problem_args={}, **state_args):
+
+        def request(kind):
+            def func(x, v=None):
+                return self._request(Evaluation(kind, x, v))
+            return func
+
+        self.problem = Problem(
+            objective=request('objective'),
+            gradient=request('gradient'),
+            hessian_vector_product=request('hessian_vector_product') if hessian_vector_product else None,
+            inverse_hessian_vector_product=request('inverse_hessian_vector_product') if inverse_hessian_vector_product else None,
+            **problem_args)
+
+        self.problem.check_preconditioner(x0)
+
+        self.optimizer = optimizer
+        self.monitor = monitor
+
+        self.state = State()
+        self.state.x = x0
+        for key, value in state_args.items():
+            setattr(self.state, key, value)
+
+        self.done = False
+        self.closed = False
+        self.error = None
+
+        self._cond = threading.Condition()
+        self._outstanding = []
+        self._new = []
+        self._thread = None
+
+    @property
+    def outstanding(self):
+        """ the requests that are asked but not yet told. """
+        with self._cond:
+            return list(self._outstanding)
+
+    def _run(self):
+        try:
+            self.optimizer.minimize(self.problem, self.state, monitor=self.monitor)
+        except AskTellClosed:
+            pass
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def _request(self, evaluation):
+        with self._cond:
+            if self.closed:
+                raise AskTellClosed("the driver is closed")
+            self._outstanding.append(evaluation)
+            self._new.append(evaluation)
+            self._cond.notify_all()
+
+        evaluation._event.wait()
+
+        if evaluation.error is not None:
+            raise evaluation.error
+        return evaluation.result
+
+    def ask(self, timeout=None):
+        """ Returns a list of new evaluation requests.
+
+            Blocks until the optimizer has emitted at least one request that
+            has not been returned by a previous ask, or has ended.
+            An empty list is returned once the minimization is done.
+
+            Exceptions raised by the optimizer are raised here.
+        """
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+            # Condition.wait_for is not available on Python 2.
+            if timeout is not None:
+                deadline = time.time() + timeout
+            while not (len(self._new) > 0 or self.done):
+                if timeout is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0: break
+                self._cond.wait(remaining)
+
+            if self.error is not None:
+                error, self.error = self.error, None
+                raise error
+
+            new = self._new
+            self._new = []
+            return new
+
+    def tell(self, evaluation, result):
+        """ Supplies the result of an evaluation request. """
+        with self._cond:
+            self._outstanding.remove(evaluation)
+        evaluation.result = result
+        evaluation._event.set()
+
+    def close(self):
+        """ Abandons the minimization; outstanding requests are failed. """
+        with self._cond:
+            self.closed = True
+            outstanding = self._outstanding
+            self._outstanding = []
+
+        for evaluation in outstanding:
+            evaluation.error = AskTellClosed("the driver is closed")
+            evaluation._event.set()
+
+        if self._thread is not None:
+            self._thread.join()
@@ -259,13 +259,20 @@ class Problem(object):
     def __init__(self, objective, gradient,
         hessian_vector_product=None,
         inverse_hessian_vector_product=None,
+        hessian_matrix_product=None,
         vs=None,
         atol=0,
         rtol=1e-7,
         xtol=1e-7,
         gtol=1e-8,
         precond=None,
+        finite_difference=None,
+        fd_step=None,
         ):
+        """ finite_difference is 'forward' or 'central' to synthesize the hessian
+            vector product from the gradient, for problems without
+            hessian_vector_product; see Hvp.
+        """
         if precond is None:
             precond = Preconditioner(lambda x, direction:x, lambda x, direction:x)
 
@@ -282,10 +289,25 @@ class Problem(object):
         self._precond = precond
         self.vs = vs
 
+        if finite_difference is not None:
+            if finite_difference not in ('forward', 'central'):
+                raise ValueError("unknown finite difference scheme %s" % finite_difference)
+            if hessian_vector_product is not None:
+                raise ValueError("finite_difference replaces hessian_vector_product; do not give both")
+            hessian_vector_product = self._fd_hessian_vector_product
+
+        self.finite_difference = finite_difference
+        self.fd_step = fd_step
+        # the gradient evaluations in a hessian vector product; optimizers
+        # count them in gev.
+        self.hvp_gev = {None : 0, 'forward' : 1, 'central' : 2}[finite_difference]
+        self._gcache = None
+
         self._objective = objective
         self._gradient = gradient
         self._hessian_vector_product = hessian_vector_product
         self._inverse_hessian_vector_product = inverse_hessian_vector_product
+        self._hessian_matrix_product = hessian_matrix_product
         self.atol = atol
         self.rtol = rtol
         self.xtol = xtol
@@ -321,12 +343,61 @@ class Problem(object):
     def g(self, x):
         """ This returns the gradient for the original variable"""
         g = self._gradient(x)
+        if self.finite_difference == 'forward':
+            self._gcache = (x, g)
         return g
 
+    def _fd_hessian_vector_product(self, x, v):
+        """ The finite difference of the gradient along v,
+
+                forward : (g(x + h v) - g(x)) / h,
+                central : (g(x + h v) - g(x - h v)) / (2 h),
+
+            with h = fd_step (1 + |x|) / |v|. fd_step defaults to the square root
+            (forward) or the cubic root (central) of the machine epsilon.
+
+            For forward differences g(x) of the last call to g is reused if x is
+            the same object, which is the case for the products at the current
+            point of an optimizer.
+        """
+        import numpy
+        vs = self.vs
+        dot = vs.dot
+        addmul = vs.addmul
+
+        vnorm = abs(dot(v, v)) ** 0.5
+        if vnorm == 0:
+            return vs.mul(v, 0)
+
+        eps = numpy.finfo('f8').eps
+        fd_step = self.fd_step
+        if fd_step is None:
+            if self.finite_difference == 'central':
+                fd_step = eps ** (1. / 3)
+            else:
+                fd_step = eps ** 0.5
+
+        h = fd_step * (1 + abs(dot(x, x)) ** 0.5) / vnorm
+
+        g1 = self._gradient(addmul(x, v, h))
+
+        if self.finite_difference == 'central':
+            g0 = self._gradient(addmul(x, v, -h))
+            return vs.mul(addmul(g1, g0, -1), 1 / (2 * h))
+
+        if self._gcache is not None and self._gcache[0] is x:
+            g0 = self._gcache[1]
+        else:
+            g0 = self.g(x)
+        return vs.mul(addmul(g1, g0, -1), 1 / h)
+
     def Hvp(self, x, v):
         """ This returns the raw hessian product H_x v
             uppercase H means Hessian, not Hessian inverse.
 
+            With finite_difference, each product takes hvp_gev
+            evaluations of the gradient.
+
             v is not preconditioned.
             x is not preconditioned.
 
@@ -354,6 +425,47 @@ class Problem(object):
         vQ = self._precond.vPp(v, direction=-1)
         return self._precond.Pvp(self._hessian_vector_product(x, vQ), direction=-1)
 
+    def Hmp(self, x, V):
+        """ This returns the raw hessian product H_x V of a block of vectors V,
+            see VectorSpace.block; the result is a block like V.
+
+            hessian_matrix_product(x, V) computes the products in one pass,
+            e.g. sharing the linearization at x. If it is not given,
+            this falls back to a loop over Hvp.
+
+            Neither x nor V is preconditioned.
+        """
+        if self._hessian_matrix_product is not None:
+            return self._hessian_matrix_product(x, V)
+
+        R = self.vs.block(V[0], len(V))
+        for i in range(len(V)):
+            R[i] = self.Hvp(x, V[i])
+        return R
+
+    def PHmp(self, x, V):
+        """ This returns the preconditioned hessian times a block of vectors V,
+            the block version of PHvp.
+
+            V is a block like Px; the result is a block like Px.
+        """
+        if self._hessian_matrix_product is None:
+            R = self.vs.block(V[0], len(V))
+            for i in range(len(V)):
+                R[i] = self.PHvp(x, V[i])
+            return R
+
+        VQ = self.vs.block(V[0], len(V))
+        for i in range(len(V)):
+            VQ[i] = self._precond.vPp(V[i], direction=-1)
+
+        R = self._hessian_matrix_product(x, VQ)
+
+        PR = self.vs.block(V[0], len(V))
+        for i in range(len(V)):
+            PR[i] = self._precond.Pvp(R[i], direction=-1)
+        return PR
+
     def Phvp(self, x, v):
         """ This returns the preconditioned inverse hessian times v
 
@@ -444,6 +556,23 @@ class Optimizer(object):
         # here is an example that doesn't yield a new solution
         return Proposal(Px=state.Px)
 
+    def warmstart(self, state):
+        """ Returns the state variables of a previous minimization that
+            shall seed the minimization of a new, related problem.
+
+            The variables are passed to minimize as state_args, e.g.
+
+                state2 = optimizer.minimize(problem2, x0, **optimizer.warmstart(state1))
+
+            The optimizer shall validate the carried variables in start.
+
+            Nothing is carried by default. The step sizes (e.g. the radius of
+            TrustRegionCG or the rate of LineSearchGradientDescent) are not
+            worth carrying: the final ones are tuned to the converged point
+            and start the new problem no better than a cold start.
+        """
+        return {}
+
     def start(self, problem, state, x0):
         # make a full initial proposal with x and g
         Px0 = problem.x2Px(x0) # the only place we convert from x to Px
@@ -508,6 +637,10 @@ class Optimizer(object):
                 a function that gets called on each iteration.
                 if state.dy is None then it is the first time monitor is called.
 
+            state_args :
+                initial attributes of the state, e.g. those returned by
+                optimizer.warmstart(state) of a previous minimization.
+
             Returns
             -------
             state : a State object of the final minimization result.
@@ -562,6 +695,58 @@ class VectorSpace(object):
         i = self.ones_like(c)
         return self.addmul(0, i, c, p)
 
+    def block(self, b, n, dtype=None):
+        """ Allocates storage for a block of n vectors like b.
+
+            The block A supports len(A), A[i] to get the i-th vector, and
+            A[i] = v to store a vector into the i-th slot. A[i:j] is a sub block.
+
+            The default is a list; subclasses may use contiguous storage
+            to speed up blockdot and blockaddmul.
+
+            dtype requests storage in a reduced precision, if the
+            vector space supports it.
+        """
+        if dtype is not None:
+            raise NotImplementedError("%s does not support blocks of dtype %s" % (type(self).__name__, dtype))
+        return [self.zeros_like(b) for i in range(n)]
+
+    def nbytes(self, b, dtype=None):
+        """ number of bytes to store the vector b in a block of dtype; see block. """
+        if dtype is not None:
+            raise NotImplementedError("%s does not support blocks of dtype %s" % (type(self).__name__, dtype))
+        return b.nbytes
+
+    def blockassign(self, A, i, a, b, c=1):
+        """ Stores a + b * c into the i-th slot of the block A.
+
+            Subclasses shall override this to compute directly into the
+            storage of the slot, without a temporary vector.
+        """
+        A[i] = self.addmul(a, b, c)
+
+    def blockdot(self, A, b):
+        """ inner products of every vector in the block A with b.
+
+            blockdot(A, b) := [a @ b for a in A]
+
+            The result is a numpy array. Subclasses shall override this to
+            do a single pass and a single global reduction.
+        """
+        import numpy
+        return numpy.array([self.dot(a, b) for a in A], dtype='f8')
+
+    def blockaddmul(self, a, A, c):
+        """ linear combination of the vectors in the block A.
+
+            blockaddmul(a, A, c) := a + sum_i A[i] * c[i]
+
+            Subclasses shall override this to do a single pass.
+        """
+        for Ai, ci in zip(A, c):
+            a = self.addmul(a, Ai, ci)
+        return a
+
     def addmul(self, a, b, c, p=1):
         """ Defines the addmul operation.
 
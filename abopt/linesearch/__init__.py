@@ -2,6 +2,7 @@ from abopt.base import Proposal
 
 # line search methods:
 from .backtrace import backtrace
+from .backtrace import parallel_backtrace
 from .minpack import minpack
 from .exact import exact
 
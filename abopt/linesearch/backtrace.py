@@ -1,5 +1,7 @@
 from abopt.base import Proposal
 
+from collections import deque
+
 def backtrace(problem, state, z, rate, maxiter, c=1e-5, tau=0.5):
     vs = problem.vs
 
@@ -29,7 +31,8 @@ def backtrace(problem, state, z, rate, maxiter, c=1e-5, tau=0.5):
         if prop.y < propmin.y:
             propmin = prop
             ratemin = rate
-        if prop.y < state.y and abs(prop.y - state.y) >= abs(rate * c * zg):
+        # Armijo, the decrease is at least c * rate * z.g
+        if prop.y < state.y and abs(prop.y - state.y) >= abs(rate * c * zg) * zz ** 0.5:
             # sufficient
             return prop, rate
 
@@ -38,3 +41,80 @@ def backtrace(problem, state, z, rate, maxiter, c=1e-5, tau=0.5):
         prop = Proposal(problem, Px=Px1, z=z).complete_y(state)
         i = i + 1
     return None, None
+
+def parallel_backtrace(problem, state, z, rate, maxiter, c=1e-5, tau=0.5, k=4, executor=None):
+    """ A speculative version of backtrace.
+
+        The trial rates rate, rate * tau, rate * tau ** 2, ... are evaluated
+        concurrently on executor, keeping k of them in flight. The largest rate
+        that satisfies the sufficient descent condition is returned, thus the
+        result is identical to that of backtrace, with up to k - 1 extra
+        function evaluations.
+
+        Trial evaluations that are no longer needed are cancelled if they have
+        not started; those already running are counted in fev but not waited for.
+
+        Use functools.partial to set k and executor in an optimizer, e.g.
+
+            LBFGS(linesearch=partial(parallel_backtrace, k=8))
+
+        Parameters
+        ----------
+        k : int
+            number of trial rates evaluated concurrently.
+        executor : concurrent.futures.Executor or None
+            if None, a ThreadPoolExecutor of k workers is created for the call;
+            on Python 2 that requires the futures backport of concurrent.futures.
+            With a ProcessPoolExecutor the problem must be picklable.
+    """
+    vs = problem.vs
+
+    addmul = vs.addmul
+    dot = vs.dot
+
+    zz = dot(z, z)
+    zg = dot(z, state.Pg) / zz ** 0.5
+
+    if zg < 0.0:
+        return None, None
+
+    if maxiter < 0:
+        return backtrace(problem, state, z, rate, maxiter, c=c, tau=tau)
+
+    own_executor = executor is None
+    if own_executor:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(k)
+
+    def submit(rate):
+        Px1 = addmul(state.Px, z, -rate)
+        x1 = problem.Px2x(Px1)
+        return rate, Px1, x1, executor.submit(problem.f, x1)
+
+    # the trials are rate, ..., rate * tau ** (maxiter - 1); same as backtrace.
+    ntrials = maxiter
+    pending = deque()
+    i = 0
+    try:
+        while i < ntrials or len(pending) > 0:
+            while len(pending) < k and i < ntrials:
+                pending.append(submit(rate))
+                rate *= tau
+                i = i + 1
+
+            rate1, Px1, x1, future = pending.popleft()
+            y1 = future.result()
+            state.fev = state.fev + 1
+
+            if y1 < state.y and abs(y1 - state.y) >= abs(rate1 * c * zg) * zz ** 0.5:
+                # sufficient; drop the speculative trials of smaller rates.
+                for item in pending:
+                    if not item[-1].cancel():
+                        state.fev = state.fev + 1
+                prop = Proposal(problem, Px=Px1, x=x1, y=y1, z=z)
+                return prop, rate1
+
+        return None, None
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
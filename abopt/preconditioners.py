@@ -0,0 +1,232 @@
+"""
+    Builders of preconditioners of the Hessian, for the cg_preconditioner
+    option of TrustRegionCG.
+
+    A builder is called with the HessianOperator A at the current point
+    (see abopt.algs.trustregion), and returns C(v, direction), which applies
+    C^{direction} with C close to A, as used by cg_steihaug and gltr.
+
+    The builders keep their estimate, and rebuild it from new Hessian
+    vector products every period new points; the Hessian changes slowly between
+    outer iterations, thus an old estimate remains a good preconditioner.
+    A rejected step proposes again at the same point, and reuses the estimate.
+
+    The probes are random numpy arrays like A.Pg.
+
+    NystromPreconditioner also provides a Preconditioner of a Problem,
+    built once from the Hessian at a point.
+"""
+import numpy
+
+from abopt.base import Preconditioner
+
+class HutchinsonDiagonal(object):
+    """ The diagonal of the Hessian, estimated from nprobes Rademacher probes v,
+
+            d = sum_i v_i * A v_i / nprobes,
+
+        the estimator of
+
+            Bekas, C., Kokiopoulou, E. & Saad, Y., An estimator for the diagonal of a matrix,
+            Appl. Numer. Math. (2007) 57: 1214.
+
+            doi:10.1016/j.apnum.2007.01.003
+
+        The probes are applied in one block product, see Problem.PHmp.
+        The absolute value of the estimate is floored at floor times its mean,
+        such that C is positive definite, and normalized to a unit mean.
+        The normalization does not change the convergence of cg, but keeps the
+        norm of the trust region, |z|_C, comparable to |z|.
+
+        The estimate is refreshed every period new points A.x; the proposals
+        after a rejected step reuse it.
+    """
+    def __init__(self, nprobes=8, period=1, floor=1e-2, random_state=None):
+        self.nprobes = nprobes
+        self.period = period
+        self.floor = floor
+        self.rng = numpy.random.RandomState(random_state)
+        self.d = None
+        self.x = None
+        self.npoints = 0
+
+    def probes(self, A):
+        V = A.vs.block(A.Pg, self.nprobes)
+        for i in range(self.nprobes):
+            V[i] = numpy.where(self.rng.uniform(size=numpy.shape(A.Pg)) < 0.5, -1., 1.)
+        return V
+
+    def estimate(self, A):
+        vs = A.vs
+        V = self.probes(A)
+        AV = A.block(V)
+        d = 0
+        for i in range(len(V)):
+            d = vs.addmul(d, vs.mul(V[i], AV[i]), 1. / len(V))
+        # the means are global reductions of vs; the floor is elementwise.
+        one = vs.ones_like(d)
+        n = vs.dot(one, one)
+        d = vs.pow(vs.mul(d, d), 0.5)
+        d = numpy.maximum(d, self.floor * vs.dot(d, one) / n)
+        return vs.mul(d, n / vs.dot(d, one))
+
+    def __call__(self, A):
+        # a rejected step proposes again at the same x, with the same diagonal.
+        if A.x is not self.x:
+            if self.d is None or self.npoints % self.period == 0:
+                self.d = self.estimate(A)
+            self.x = A.x
+            self.npoints = self.npoints + 1
+
+        vs = A.vs
+        d = self.d
+        def C(v, direction):
+            return vs.mul(v, d, direction)
+        return C
+
+def _gram(vs, A, B):
+    """ the matrix of A_i . B_j """
+    return numpy.array([vs.blockdot(A, b) for b in B]).T
+
+class NystromPreconditioner(object):
+    """ The randomized Nystrom preconditioner of
+
+            Frangella, Z., Tropp, J. A. & Udell, M., Randomized Nystrom preconditioning,
+            SIAM J. Matrix Anal. Appl. (2023) 44: 718.
+
+            arXiv:2110.02820
+
+        The Hessian is approximated by the Nystrom sketch of rank k,
+        A ~ U Lambda U^T, from the block product of k Gaussian probes Omega,
+
+            A ~ (A Omega) (Omega^T A Omega)^{-1} (A Omega)^T,
+
+        where Omega is orthonormalized with Cholesky QR, and the eigen vectors U
+        come from the Gram matrices of the block; only k-vector blocks are
+        formed. A small shift stabilizes the Cholesky factor; the Hessian shall be
+        positive semi-definite, and the shift is raised if it is not.
+
+        The preconditioner is the shifted form of Frangella et al.,
+
+            P = U (Lambda + mu) U^T / (lambda_k + mu) + (I - U U^T),
+
+        which maps the top k eigen values lambda to
+        lambda (lambda_k + mu) / (lambda + mu), and leaves the rest of the
+        spectrum, thus |z|_P remains comparable to |z|. mu is the shift, 0 by
+        default, where the top eigen values are mapped to lambda_k. A positive
+        mu, of the order of the tail of the spectrum, is less aggressive
+        when the sketch is poorly resolved; it is the regularization of A + mu I
+        in the paper.
+
+        The sketch helps if the spectrum has a few outlying eigen values. If
+        the spectrum decays slowly, as for a column-scaled J, a rank k sketch
+        does not resolve it and it helps little: on the ChiSquareProblem of
+        300 columns scaled over 3 decades, TrustRegionCG does not converge in
+        1000 iterations with or without the sketch, while the exact diagonal
+        converges in 56. Prefer HutchinsonDiagonal there.
+
+        As a cg_preconditioner, the sketch is rebuilt every period new points A.x;
+        the top eigen space of the Hessian changes slowly, and the k products of
+        the probes are amortized over the outer iterations. preconditioner()
+        returns a Preconditioner of a Problem, with x = P^{-1/2} x~.
+
+        Usage:
+
+            nystrom = NystromPreconditioner(rank=50)
+            TrustRegionCG(cg_preconditioner=nystrom)
+
+            nystrom.build(HessianOperator(problem, x0, problem.g2Pg(problem.g(x0))))
+            Problem(..., precond=nystrom.preconditioner())
+    """
+    def __init__(self, rank=10, period=10, random_state=None, shift=0.):
+        self.rank = rank
+        self.period = period
+        self.shift = shift
+        self.rng = numpy.random.RandomState(random_state)
+        self.vs = None
+        self.U = None
+        self.lam = None
+        self.x = None
+        self.npoints = 0
+
+    def orthonormalize(self, vs, V):
+        """ Cholesky QR, twice """
+        for i in range(2):
+            G = _gram(vs, V, V)
+            R = numpy.linalg.cholesky(G).T
+            Rinv = numpy.linalg.inv(R)
+            Q = vs.block(V[0], len(V))
+            for j in range(len(V)):
+                Q[j] = vs.blockaddmul(0, V, Rinv[:, j])
+            V = Q
+        return V
+
+    def build(self, A):
+        """ builds the sketch from k products of the HessianOperator A. """
+        vs = A.vs
+        k = self.rank
+        self.vs = vs
+
+        Omega = vs.block(A.Pg, k)
+        for i in range(k):
+            Omega[i] = self.rng.normal(size=numpy.shape(A.Pg))
+
+        Q = self.orthonormalize(vs, Omega)
+        Y = A.block(Q)
+
+        YtY = _gram(vs, Y, Y)
+        QtY = _gram(vs, Q, Y)
+        QtY = 0.5 * (QtY + QtY.T)
+
+        nu = numpy.finfo('f8').eps ** 0.5 * numpy.trace(YtY) ** 0.5
+        lmin = numpy.linalg.eigvalsh(QtY).min()
+        if lmin < 0:
+            # not positive semi-definite.
+            nu = nu - 2 * lmin
+
+        L = numpy.linalg.cholesky(QtY + nu * numpy.eye(k))
+
+        # F = (Y + nu Q) L^{-T} = U Sigma V^T
+        YnutYnu = YtY + nu * (QtY + QtY.T) + nu ** 2 * numpy.eye(k)
+        Linv = numpy.linalg.inv(L)
+        sigma2, V = numpy.linalg.eigh(Linv.dot(YnutYnu).dot(Linv.T))
+
+        lam = sigma2 - nu
+        keep = lam > nu
+        c = Linv.T.dot(V[:, keep]) / sigma2[keep] ** 0.5
+
+        U = vs.block(A.Pg, int(keep.sum()))
+        for j in range(len(U)):
+            U[j] = vs.blockaddmul(vs.blockaddmul(0, Q, nu * c[:, j]), Y, c[:, j])
+
+        self.U = U
+        self.lam = lam[keep]
+
+    def apply(self, v, power):
+        """ P^power v """
+        vs = self.vs
+        if self.U is None or len(self.U) == 0:
+            return v
+        mu = self.shift
+        a = ((self.lam + mu) / (self.lam.min() + mu)) ** power - 1
+        return vs.blockaddmul(v, self.U, a * vs.blockdot(self.U, v))
+
+    def __call__(self, A):
+        if A.x is not self.x:
+            if self.U is None or self.npoints % self.period == 0:
+                self.build(A)
+            self.x = A.x
+            self.npoints = self.npoints + 1
+
+        def C(v, direction):
+            return self.apply(v, direction)
+        return C
+
+    def preconditioner(self):
+        """ A Preconditioner with x = P^{-1/2} x~, such that the hessian of x~ is
+            P^{-1/2} H P^{-1/2}; P is symmetric.
+        """
+        def Pvp(v, direction):
+            return self.apply(v, 0.5 * direction)
+
+        return Preconditioner(Pvp=Pvp, vPp=Pvp)
@@ -25,10 +25,16 @@ class ChiSquareProblem(Problem):
             v = numpy.array(v)
             return vjp(x, jvp(x, v)) * 2
 
+        def hessian_matrix(x, V):
+            # rows of V are the vectors; one pass of J for all of them.
+            JV = J.dot((numpy.array(V) * phiprime(x)).T)
+            return JV.T.dot(J) * phiprime(x) * 2
+
         Problem.__init__(self,
                       objective=objective,
                       gradient=gradient,
                       hessian_vector_product=hessian,
+                      hessian_matrix_product=hessian_matrix,
                       precond=precond)
 
 from scipy.linalg import inv
@@ -53,3 +59,46 @@ class RosenProblem(Problem):
                     hessian_vector_product=rosen_hess_prod,
                     inverse_hessian_vector_product = lambda x, v: rosen_inverse_hess(x).dot(v),
                     precond=precond)
+
+from abopt.algs.stochastic import StochasticProblem
+
+class LeastSquaresProblem(StochasticProblem):
+    """ least squares problem of nterms data points,
+
+        y = 1 / N sum_i (A_i x - b_i)^2
+
+        A has columns scaled over a decade, and b has noise of sigma.
+    """
+    def __init__(self, nterms=10000, ndim=10, sigma=0.1, seed=1, precond=None):
+        rng = numpy.random.RandomState(seed)
+        self.A = rng.normal(size=(nterms, ndim)) * numpy.logspace(0, 1, ndim)
+        self.xtrue = rng.normal(size=ndim)
+        self.b = self.A.dot(self.xtrue) + rng.normal(size=nterms) * sigma
+
+        def select(batch):
+            if batch is None:
+                return self.A, self.b
+            return self.A[batch], self.b[batch]
+
+        def objective(x, batch):
+            A, b = select(batch)
+            return numpy.mean((A.dot(x) - b) ** 2)
+
+        def gradient(x, batch):
+            A, b = select(batch)
+            return 2 * (A.dot(x) - b).dot(A) / len(b)
+
+        def hessian(x, v, batch):
+            A, b = select(batch)
+            return 2 * A.dot(v).dot(A) / len(b)
+
+        StochasticProblem.__init__(self,
+                      objective=objective,
+                      gradient=gradient,
+                      hessian_vector_product=hessian,
+                      nterms=nterms,
+                      precond=precond)
+
+    @property
+    def xmin(self):
+        return numpy.linalg.lstsq(self.A, self.b, rcond=-1)[0]
@@ -0,0 +1,95 @@
+from __future__ import print_function
+
+import asyncio
+import numpy
+from numpy.testing import assert_allclose
+from scipy.optimize import rosen, rosen_der, rosen_hess_prod
+
+from abopt.aio import AsyncProblem
+from abopt.aio import minimize, backtrace, minpack, cg_steihaug
+from abopt.abopt2 import LBFGS, TrustRegionCG, State
+from abopt.testing import ChiSquareProblem
+
+import pytest
+
+class Counter(object):
+    def __init__(self):
+        self.inflight = 0
+        self.maxinflight = 0
+
+    async def __call__(self, func, *args):
+        self.inflight += 1
+        self.maxinflight = max(self.inflight, self.maxinflight)
+        # pretend a remote service takes time to respond.
+        await asyncio.sleep(0.001)
+        self.inflight -= 1
+        return func(*args)
+
+def make_problem(counter):
+    async def objective(x): return await counter(rosen, x)
+    async def gradient(x): return await counter(rosen_der, x)
+    async def hessian(x, v): return await counter(rosen_hess_prod, x, v)
+    return AsyncProblem(objective, gradient, hessian_vector_product=hessian)
+
+def test_aio_concurrent_minimize():
+    counter = Counter()
+    problem = make_problem(counter)
+
+    async def main():
+        return await asyncio.gather(
+            minimize(LBFGS(), problem, numpy.zeros(5)),
+            minimize(TrustRegionCG(maxradius=10.), problem, numpy.zeros(5)),
+        )
+
+    r1, r2 = asyncio.run(main())
+    assert r1.converged
+    assert r2.converged
+    assert_allclose(r1.x, 1.0, rtol=1e-4)
+    assert_allclose(r2.x, 1.0, rtol=1e-4)
+
+    # evaluations of the two minimizations overlapped.
+    assert counter.maxinflight == 2
+
+def test_aio_sync_from_loop():
+    problem = make_problem(Counter())
+
+    async def main():
+        await minimize(LBFGS(maxiter=1), problem, numpy.zeros(2))
+        problem.f(numpy.zeros(2))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+
+@pytest.mark.parametrize("linesearch", [backtrace, minpack])
+def test_aio_linesearch(linesearch):
+    problem = make_problem(Counter())
+
+    async def main():
+        state = State()
+        state.x = state.Px = numpy.zeros(2)
+        state.y = rosen(state.x)
+        state.y_ = [state.y]
+        state.g = state.Pg = rosen_der(state.x)
+        state.Pgnorm = numpy.linalg.norm(state.Pg)
+        return await linesearch(problem, state, state.Pg, 1.0, 10)
+
+    prop, rate = asyncio.run(main())
+    assert prop.y < rosen(numpy.zeros(2))
+
+def test_aio_cg_steihaug():
+    J = numpy.array([[0, 0, 0, 1],
+                      [0, 0, 2, 0],
+                      [0, 3, 0, 0],
+                      [400, 0, 0, 0]])
+
+    problem = ChiSquareProblem(J=J)
+
+    g = numpy.array([  -2.,   -4.,   -6., -800.])
+
+    async def Avp(v):
+        await asyncio.sleep(0)
+        return problem.Hvp(0, v)
+
+    z = asyncio.run(cg_steihaug(problem.vs, Avp, g, g, 8000., 1e-8))
+
+    assert_allclose(problem.Hvp(0, z), g)
@@ -2,13 +2,14 @@ from __future__ import print_function
 
 from abopt.abopt2 import LineSearchGradientDescent, GradientDescent, LBFGS, Preconditioner, minimize
 
-from abopt.linesearch import minpack, backtrace, exact
+from abopt.linesearch import minpack, backtrace, exact, parallel_backtrace
 from abopt.vectorspace import real_vector_space, complex_vector_space
 
 from numpy.testing import assert_raises, assert_allclose
 
 from scipy.optimize import rosen, rosen_der
 import numpy
+import pytest
 
 def quad(x):
     return (x[0] - .5)** 2 + (x[1] - .5) ** 2
@@ -39,6 +40,67 @@ def test_abopt_gd_backtrace():
     assert s.converged
     assert_allclose(s.x, 0.5, rtol=1e-4)
 
+def test_abopt_parallel_backtrace():
+    # Python 2 needs the futures backport.
+    pytest.importorskip('concurrent.futures')
+    from functools import partial
+    from scipy.optimize import rosen, rosen_der
+
+    for k in [1, 3]:
+        lbfgs = LBFGS(linesearch=partial(parallel_backtrace, k=k))
+        s = minimize(lbfgs, rosen, rosen_der, numpy.zeros(5))
+        assert s.converged
+        assert_allclose(s.x, 1.0, rtol=1e-4)
+
+        # same trajectory as the sequential backtrace. k - 1 speculative fevs
+        # at most per search; backtrace evaluates one more rate on a failed search.
+        s0 = minimize(LBFGS(linesearch=backtrace), rosen, rosen_der, numpy.zeros(5))
+        assert s.nit == s0.nit
+        assert_allclose(s.x, s0.x)
+        if k == 1:
+            assert s.fev <= s0.fev
+        else:
+            assert s.fev > s0.fev
+
+def test_abopt_parallel_backtrace_maxiter():
+    # Python 2 needs the futures backport.
+    pytest.importorskip('concurrent.futures')
+    from abopt.base import Problem, State
+
+    problem = Problem(rosen, rosen_der)
+    state = State()
+    state.x = state.Px = numpy.zeros(5)
+    state.y = rosen(state.x)
+    state.g = state.Pg = rosen_der(state.x)
+
+    # the sufficient descent is first found at rate * tau ** 3.
+    for maxiter in range(6):
+        for k in [1, 2, 8]:
+            prop0, rate0 = backtrace(problem, state, state.Pg, 0.0625, maxiter)
+            prop, rate = parallel_backtrace(problem, state, state.Pg, 0.0625, maxiter, k=k)
+            assert rate == rate0
+            if prop0 is None:
+                assert prop is None
+            else:
+                assert_allclose(prop.y, prop0.y)
+
+def test_abopt_backtrace_scale():
+    from abopt.base import Problem, State
+
+    problem = Problem(rosen, rosen_der)
+    state = State()
+    state.x = state.Px = numpy.zeros(5) + 0.9
+    state.y = rosen(state.x)
+    state.g = state.Pg = rosen_der(state.x)
+
+    # the same step, from a direction of any length.
+    prop0, rate0 = backtrace(problem, state, state.Pg, 1.0, 10)
+    assert rate0 < 1.0
+    for scale in [1e-8, 1e8]:
+        prop, rate = backtrace(problem, state, state.Pg * scale, 1.0 / scale, 10)
+        assert_allclose(rate * scale, rate0)
+        assert_allclose(prop.y, prop0.y)
+
 def test_abopt_gd_nobacktrace():
     # if rate is 1.0, we jump between mirror images around
     # the center and run into a false convergence.
@@ -86,3 +148,50 @@ def test_state():
     print(s.format(header=True))
     print(s.format())
     print(s.format(columns=['nit', 'na']))
+
+def test_hessian_matrix_product():
+    from abopt.testing import ChiSquareProblem, RosenProblem, diag_scaling
+
+    J = numpy.array([ [0, 0,     2,  1],
+                      [0,  10,   2,  0],
+                      [40, 100,  0,  0],
+                      [400, 0,   0,  0]])
+    precond = Preconditioner(Pvp=diag_scaling, vPp=diag_scaling)
+    rng = numpy.random.RandomState(1)
+    x = rng.normal(size=4)
+    V = real_vector_space.block(x, 3)
+    for i in range(3):
+        V[i] = rng.normal(size=4)
+
+    # native block product and the fallback loop over Hvp
+    for problem in [ChiSquareProblem(J=J, phi=numpy.sin, phiprime=numpy.cos, precond=precond),
+                    RosenProblem(precond=True)]:
+        HV = problem.Hmp(x, V)
+        PHV = problem.PHmp(x, V)
+        assert len(HV) == 3
+        for i in range(3):
+            assert_allclose(HV[i], problem.Hvp(x, V[i]))
+            assert_allclose(PHV[i], problem.PHvp(x, V[i]))
+
+def test_finite_difference_hvp():
+    from abopt.abopt2 import Problem
+    from scipy.optimize import rosen_hess_prod
+
+    x = numpy.linspace(0.1, 1.5, 20)
+    v = numpy.cos(numpy.arange(20.))
+
+    calls = []
+    def gradient(x):
+        calls.append(x)
+        return rosen_der(x)
+
+    for finite_difference, rtol in [('forward', 1e-6), ('central', 1e-9)]:
+        problem = Problem(rosen, gradient, finite_difference=finite_difference)
+        g = problem.g(x)
+        calls[:] = []
+        assert_allclose(problem.Hvp(x, v), rosen_hess_prod(x, v), rtol=rtol, atol=rtol * 1000)
+        # g(x) is reused by forward differences
+        assert len(calls) == problem.hvp_gev
+
+    with assert_raises(ValueError):
+        Problem(rosen, rosen_der, hessian_vector_product=rosen_hess_prod, finite_difference='forward')
@@ -0,0 +1,9 @@
+import sys
+import pytest
+
+# abopt.aio requires Python 3.7; the cases are in a separate module
+# such that the async definitions are not even parsed on older Pythons.
+if sys.version_info < (3, 7):
+    pytest.skip("abopt.aio requires Python 3.7 or later", allow_module_level=True)
+
+from abopt.tests.aio_cases import *
@@ -0,0 +1,76 @@
+from __future__ import print_function
+
+from functools import partial
+import threading
+
+import numpy
+from numpy.testing import assert_allclose
+from scipy.optimize import rosen, rosen_der, rosen_hess_prod
+
+from abopt.abopt2 import AskTell, LBFGS, TrustRegionCG, DirectNewton
+from abopt.asktell import AskTellClosed
+from abopt.linesearch import parallel_backtrace
+from abopt.testing import rosen_inverse_hess
+
+import pytest
+
+def evaluate(request):
+    if request.kind == 'objective':
+        return rosen(request.x)
+    if request.kind == 'gradient':
+        return rosen_der(request.x)
+    if request.kind == 'hessian_vector_product':
+        return rosen_hess_prod(request.x, request.v)
+    if request.kind == 'inverse_hessian_vector_product':
+        return rosen_inverse_hess(request.x).dot(request.v)
+
+@pytest.mark.parametrize("optimizer",
+    [LBFGS(), TrustRegionCG(maxradius=10.), DirectNewton()])
+def test_asktell(optimizer):
+    opt = AskTell(optimizer, numpy.zeros(5),
+            hessian_vector_product=True,
+            inverse_hessian_vector_product=True)
+
+    while not opt.done:
+        for request in opt.ask():
+            opt.tell(request, evaluate(request))
+
+    assert opt.state.converged
+    assert_allclose(opt.state.x, 1.0, rtol=1e-4)
+
+def test_asktell_outstanding():
+    # Python 2 needs the futures backport.
+    pytest.importorskip('concurrent.futures')
+    # hold the trials of the first line search until all of them are asked;
+    # the monitor runs right before the first proposal, after which the only
+    # requests are the speculative trials.
+    searching = threading.Event()
+    opt = AskTell(LBFGS(linesearch=partial(parallel_backtrace, k=4)), numpy.zeros(5),
+            monitor=lambda state: searching.set())
+
+    maxoutstanding = 0
+    while not opt.done:
+        opt.ask()
+        outstanding = opt.outstanding
+        maxoutstanding = max(maxoutstanding, len(outstanding))
+        if searching.is_set() and maxoutstanding < 4: continue
+        for request in outstanding:
+            opt.tell(request, evaluate(request))
+
+    assert maxoutstanding == 4
+    assert opt.state.converged
+    assert_allclose(opt.state.x, 1.0, rtol=1e-4)
+
+def test_asktell_error():
+    opt = AskTell(TrustRegionCG(), numpy.zeros(5))
+    with pytest.raises(ValueError):
+        while not opt.done:
+            for request in opt.ask():
+                opt.tell(request, evaluate(request))
+
+def test_asktell_close():
+    opt = AskTell(LBFGS(), numpy.zeros(5))
+    assert len(opt.ask()) == 1
+    opt.close()
+    assert opt.done
+    assert opt.ask() == []
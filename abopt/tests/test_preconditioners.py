@@ -0,0 +1,168 @@
+from __future__ import print_function
+
+import pytest
+
+from abopt.abopt2 import TrustRegionCG
+from abopt.algs.trustregion import HessianOperator
+from abopt.preconditioners import HutchinsonDiagonal, NystromPreconditioner
+from abopt.testing import ChiSquareProblem
+import numpy
+from numpy.testing import assert_allclose
+
+def make_chisquare(n, decades, seed=1):
+    rng = numpy.random.RandomState(seed)
+    J = rng.normal(size=(n, n)) / n ** 0.5 + numpy.eye(n)
+    J = J * numpy.logspace(0, decades, n)[None, :]
+    return ChiSquareProblem(J=J)
+
+def make_spiked(n, k, seed=1, precond=None):
+    # k large singular values over 1 decade, the rest in [1, 2]
+    rng = numpy.random.RandomState(seed)
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    s = numpy.concatenate([numpy.logspace(1.5, 2.5, k), 1 + rng.uniform(size=n - k)])
+    return ChiSquareProblem(J=U.dot(numpy.diag(s)).dot(U.T), precond=precond)
+
+def test_hutchinson_diagonal():
+    d = numpy.logspace(0, 0.5, 10)
+    # exact for a diagonal hessian
+    problem = ChiSquareProblem(J=numpy.diag(d))
+    x = numpy.zeros(10)
+    A = HessianOperator(problem, x, x)
+
+    builder = HutchinsonDiagonal(nprobes=2, period=3, random_state=1)
+    C = builder(A)
+    h = 2 * d ** 2
+    v = numpy.ones(10)
+    assert_allclose(C(v, 1), h / h.mean())
+    assert_allclose(C(v, -1), h.mean() / h)
+
+    # not refreshed at the same x, e.g. after a rejected step
+    d0 = builder.d
+    builder(A)
+    assert builder.d is d0
+
+    # refreshed every period new points
+    builder(HessianOperator(problem, x.copy(), x))
+    builder(HessianOperator(problem, x.copy(), x))
+    assert builder.d is d0
+    builder(HessianOperator(problem, x.copy(), x))
+    assert builder.d is not d0
+
+def test_hutchinson_tr():
+    problem = make_chisquare(100, 2)
+
+    ncg = []
+    trcg = TrustRegionCG(maxiter=1000, cg_monitor=lambda *args: ncg.append(1))
+    r0 = trcg.minimize(problem, numpy.zeros(100))
+    n0 = len(ncg)
+
+    ncg[:] = []
+    trcg = TrustRegionCG(maxiter=1000, cg_monitor=lambda *args: ncg.append(1),
+                cg_preconditioner=HutchinsonDiagonal(8, random_state=1))
+    r = trcg.minimize(problem, numpy.zeros(100))
+    assert r.converged
+    assert_allclose(problem.f(r.x), 0, atol=1e-7)
+    assert len(ncg) < n0 / 2
+    assert r.hev < r0.hev
+
+def test_nystrom_exact():
+    # exact for a hessian of rank below the rank of the sketch
+    rng = numpy.random.RandomState(2)
+    U, r = numpy.linalg.qr(rng.normal(size=(50, 5)))
+    s = numpy.array([100., 50, 20, 10, 5])
+    problem = ChiSquareProblem(J=(U * (s / 2) ** 0.5).T)
+    x = numpy.zeros(50)
+    A = HessianOperator(problem, x, x)
+
+    builder = NystromPreconditioner(rank=8, period=3, random_state=1)
+    C = builder(A)
+    assert_allclose(builder.lam, s[::-1], rtol=1e-5)
+    Ub = numpy.array(builder.U)
+    assert_allclose(Ub.dot(Ub.T), numpy.eye(5), atol=1e-8)
+    assert_allclose(Ub.T.dot(Ub).dot(U), U, atol=1e-6)
+
+    v = rng.normal(size=50)
+    assert_allclose(C(C(v, 1), -1), v)
+    H = numpy.array([A(e) for e in numpy.eye(50)])
+    # the top eigen values are mapped to lambda_k
+    for u in U.T:
+        assert_allclose(C(H.dot(u), -1), 5 * u, atol=1e-4)
+
+    # the shifted form maps lambda to lambda (lambda_k + mu) / (lambda + mu)
+    builder.shift = 3.
+    for u, l in zip(U.T, s):
+        assert_allclose(C(H.dot(u), -1), l * (5 + 3.) / (l + 3.) * u, atol=1e-4)
+    builder.shift = 0.
+
+    pre = builder.preconditioner()
+    assert_allclose(pre.Pvp(pre.Pvp(v, 1), 1), C(v, 1))
+    assert_allclose(pre.vPp(pre.Pvp(v, 1), -1), v)
+
+    # refreshed every period new points
+    U0 = builder.U
+    builder(A)
+    assert builder.U is U0
+    builder(HessianOperator(problem, x.copy(), x))
+    builder(HessianOperator(problem, x.copy(), x))
+    assert builder.U is U0
+    builder(HessianOperator(problem, x.copy(), x))
+    assert builder.U is not U0
+
+def test_nystrom_tr():
+    problem = make_spiked(100, 10)
+
+    ncg = []
+    trcg = TrustRegionCG(maxiter=1000, cg_monitor=lambda *args: ncg.append(1))
+    r0 = trcg.minimize(problem, numpy.zeros(100))
+    n0 = len(ncg)
+
+    ncg[:] = []
+    trcg = TrustRegionCG(maxiter=1000, cg_monitor=lambda *args: ncg.append(1),
+                cg_preconditioner=NystromPreconditioner(20, random_state=1))
+    r = trcg.minimize(problem, numpy.zeros(100))
+    assert r.converged
+    assert_allclose(problem.f(r.x), 0, atol=1e-7)
+    assert len(ncg) < n0 / 2
+    assert r.hev < r0.hev
+    # the condition number estimated from the ritz values
+    assert r.ritz_cond < r0.ritz_cond / 100
+
+@pytest.mark.parametrize("shift", [0., 100.])
+def test_nystrom_scaled(shift):
+    # a slowly decaying spectrum, poorly resolved by the sketch.
+    problem = make_chisquare(100, 2)
+
+    ncg = []
+    trcg = TrustRegionCG(maxiter=1000, cg_monitor=lambda *args: ncg.append(1))
+    r0 = trcg.minimize(problem, numpy.zeros(100))
+    n0 = len(ncg)
+
+    ncg[:] = []
+    trcg = TrustRegionCG(maxiter=1000, cg_monitor=lambda *args: ncg.append(1),
+                cg_preconditioner=NystromPreconditioner(40, random_state=1, shift=shift))
+    r = trcg.minimize(problem, numpy.zeros(100))
+    assert r.converged
+    assert_allclose(problem.f(r.x), 0, atol=1e-7)
+    # no worse than without the sketch, including the products of the probes.
+    assert len(ncg) < n0
+    assert r.hev < r0.hev
+
+def test_nystrom_problem_precond():
+    problem = make_spiked(100, 10)
+    x0 = numpy.zeros(100)
+
+    builder = NystromPreconditioner(20, random_state=1)
+    builder.build(HessianOperator(problem, x0, problem.g2Pg(problem.g(x0))))
+    pproblem = make_spiked(100, 10, precond=builder.preconditioner())
+    pproblem.check_preconditioner(x0)
+
+    ncg = []
+    trcg = TrustRegionCG(maxiter=1000, cg_monitor=lambda *args: ncg.append(1))
+    r0 = trcg.minimize(problem, x0)
+    n0 = len(ncg)
+
+    ncg[:] = []
+    r = trcg.minimize(pproblem, x0)
+    assert r.converged
+    assert_allclose(problem.f(r.x), 0, atol=1e-7)
+    assert len(ncg) < n0 / 2
@@ -0,0 +1,67 @@
+from __future__ import print_function
+
+import numpy
+from numpy.testing import assert_allclose
+
+from abopt.base import VectorSpace
+from abopt.vectorspace import real_vector_space, complex_vector_space, RealVectorSpace
+import abopt.vectorspace
+
+import pytest
+
+@pytest.mark.parametrize("dtype", [None, 'f4', 'bf16'])
+def test_real_block(dtype, monkeypatch):
+    # exercise the chunking
+    monkeypatch.setattr(abopt.vectorspace, '_CHUNKSIZE', 7)
+
+    vs = real_vector_space
+    rng = numpy.random.RandomState(1)
+    V = rng.normal(size=(3, 4, 5))
+    b = rng.normal(size=(4, 5))
+
+    A = vs.block(b, 3, dtype)
+    assert len(A) == 3
+    for i in range(3):
+        A[i] = V[i]
+
+    rtol = {None : 1e-12, 'f4' : 1e-6, 'bf16' : 1e-2}[dtype]
+
+    assert_allclose(A[1], V[1], rtol=rtol)
+    # sums have cancellations; compare against the norms
+    atol = rtol * 20
+    assert_allclose(vs.blockdot(A, b), [(v * b).sum() for v in V], atol=atol)
+    assert_allclose(vs.blockdot(A[1:], b), [(v * b).sum() for v in V[1:]], atol=atol)
+
+    c = numpy.array([1., 2., 3.])
+    r = vs.blockaddmul(b, A, c)
+    assert r.dtype == numpy.dtype('f8')
+    assert_allclose(r, b + numpy.tensordot(c, V, axes=1), atol=atol)
+
+    vs.blockassign(A, 2, V[0], V[1], -1)
+    assert_allclose(A[2], V[0] - V[1], rtol=rtol, atol=rtol)
+
+def test_default_block():
+    # the loop implementations on the base class
+    vs = VectorSpace(addmul=RealVectorSpace().addmul, dot=RealVectorSpace().dot)
+    rng = numpy.random.RandomState(1)
+    V = rng.normal(size=(3, 4))
+    b = rng.normal(size=4)
+
+    A = vs.block(b, 3)
+    for i in range(3):
+        vs.blockassign(A, i, 0, V[i], 2)
+
+    assert_allclose(vs.blockdot(A, b), 2 * V.dot(b))
+    assert_allclose(vs.blockaddmul(b, A, [1, 0, 1]), b + 2 * V[0] + 2 * V[2])
+
+    with pytest.raises(NotImplementedError):
+        vs.block(b, 3, 'f4')
+
+def test_complex_block():
+    vs = complex_vector_space
+    V = numpy.array([[1 + 1j, 2], [3j, 1]])
+    b = numpy.array([1 + 2j, 1j])
+    A = vs.block(b, 2)
+    A[0] = V[0]
+    A[1] = V[1]
+    assert_allclose(vs.blockdot(A, b), [vs.dot(V[0], b), vs.dot(V[1], b)])
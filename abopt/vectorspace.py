@@ -32,6 +32,118 @@ class RealVectorSpace(VectorSpace):
         except TypeError:
             return float(a * b)
 
+    def block(self, b, n, dtype=None):
+        """ a contiguous 2-d array for numpy vectors.
+
+            dtype may be 'f4' or 'bf16' to store the vectors in reduced
+            precision; blockdot and blockaddmul still accumulate in float64.
+        """
+        import numpy
+        if isinstance(b, numpy.ndarray):
+            if dtype == 'bf16':
+                return BFloat16Block(numpy.zeros((n,) + b.shape, dtype='u2'))
+            if dtype is None:
+                dtype = b.dtype
+            return numpy.zeros((n,) + b.shape, dtype=dtype)
+        return VectorSpace.block(self, b, n, dtype)
+
+    def nbytes(self, b, dtype=None):
+        """ bytes of b in a block of dtype """
+        import numpy
+        if dtype == 'bf16':
+            return numpy.size(b) * 2
+        if dtype is not None:
+            return numpy.size(b) * numpy.dtype(dtype).itemsize
+        return numpy.asarray(b).nbytes
+
+    def blockassign(self, A, i, a, b, c=1):
+        """ A[i] = a + b * c, in place for a 2-d array """
+        import numpy
+        if isinstance(A, numpy.ndarray):
+            out = A[i]
+            numpy.multiply(b, c, out=out)
+            if a is not 0: numpy.add(out, a, out=out)
+            return
+        VectorSpace.blockassign(self, A, i, a, b, c)
+
+    def blockdot(self, A, b):
+        """ einsum('ij,j->i', A, b) """
+        import numpy
+        if _is_reduced(A):
+            raw, decode = _raw(A)
+            b = numpy.ravel(b)
+            r = numpy.zeros(len(raw))
+            for i in range(0, raw.shape[1], _CHUNKSIZE):
+                sl = slice(i, i + _CHUNKSIZE)
+                r += decode(raw[:, sl]).astype('f8').dot(b[sl])
+            return r
+        if isinstance(A, numpy.ndarray):
+            return A.reshape(len(A), -1).dot(numpy.ravel(b))
+        return VectorSpace.blockdot(self, A, b)
+
+    def blockaddmul(self, a, A, c):
+        """ a + einsum('ij,i->j', A, c) """
+        import numpy
+        if _is_reduced(A):
+            raw, decode = _raw(A)
+            r = numpy.zeros(raw.shape[1])
+            for i in range(0, raw.shape[1], _CHUNKSIZE):
+                sl = slice(i, i + _CHUNKSIZE)
+                r[sl] = numpy.dot(c, decode(raw[:, sl]).astype('f8'))
+            c = r.reshape(A[0].shape)
+            if a is not 0: c = c + a
+            return c
+        if isinstance(A, numpy.ndarray):
+            c = numpy.tensordot(c, A, axes=1)
+            if a is not 0: c = c + a
+            return c
+        return VectorSpace.blockaddmul(self, a, A, c)
+
+# reduced precision blocks are processed in chunks of columns,
+# such that the float64 temporaries are small.
+_CHUNKSIZE = 65536
+
+class BFloat16Block(object):
+    """ A block of real vectors stored as bfloat16: the upper 16 bits
+        of float32, rounded to the nearest even.
+
+        Vectors read from the block are float32 copies.
+    """
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return BFloat16Block(self.data[i])
+        return _bf16_decode(self.data[i])
+
+    def __setitem__(self, i, v):
+        self.data[i] = _bf16_encode(v)
+
+def _bf16_encode(v):
+    import numpy
+    u = numpy.asarray(v, dtype='f4').view('u4')
+    u = u + (0x7fff + ((u >> 16) & 1))
+    return (u >> 16).astype('u2')
+
+def _bf16_decode(d):
+    return (d.astype('u4') << 16).view('f4')
+
+def _is_reduced(A):
+    import numpy
+    if isinstance(A, BFloat16Block):
+        return True
+    return isinstance(A, numpy.ndarray) and A.dtype.kind == 'f' and A.dtype.itemsize < 8
+
+def _raw(A):
+    """ the 2-d storage of a reduced precision block and the function to decode it. """
+    if isinstance(A, BFloat16Block):
+        return A.data.reshape(len(A), -1), _bf16_decode
+    return A.reshape(len(A), -1), lambda x: x
+
 # helper functions to pack and unpack complex numbers.
 def _c2r(a):
     # complex vector space needs numpy
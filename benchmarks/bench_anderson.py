@@ -0,0 +1,48 @@
+"""
+    Anderson acceleration against LBFGS on the problems of abopt.testing.
+
+        python benchmarks/bench_anderson.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+from abopt.abopt2 import LBFGS, AndersonAcceleration
+from abopt.testing import RosenProblem, ChiSquareProblem
+
+def make_chisquare(n, phi=None, seed=1):
+    rng = numpy.random.RandomState(seed)
+    # singular values spanning 1.5 decades
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    J = U.dot(numpy.diag(numpy.logspace(0, 1.5, n))).dot(U.T)
+    if phi is None:
+        return ChiSquareProblem(J=J)
+    return ChiSquareProblem(J=J, phi=phi[0], phiprime=phi[1])
+
+def main():
+    problems = [
+        ('Rosen', RosenProblem(), 20),
+        ('Rosen', RosenProblem(), 100),
+        ('ChiSquare', make_chisquare(100), 100),
+        ('ChiSquareQuad', make_chisquare(100, phi=(lambda x: x + 0.1 * x ** 2, lambda x: 1 + 0.2 * x)), 100),
+    ]
+    optimizers = [
+        ('LBFGS', LBFGS()),
+        ('Anderson m=6', AndersonAcceleration()),
+        ('Anderson m=10', AndersonAcceleration(m=10)),
+        ('Anderson beta=1e-3', AndersonAcceleration(mixing=1e-3)),
+    ]
+
+    print('%-14s %4s %-20s %6s %6s %6s %12s' % ('problem', 'n', 'optimizer', 'nit', 'fev', 'gev', 'y'))
+    for name, problem, n in problems:
+        for oname, optimizer in optimizers:
+            r = optimizer.minimize(problem, numpy.zeros(n))
+            print('%-14s %4d %-20s %6d %6d %6d %12.4e' % (name, n, oname, r.nit, r.fev, r.gev, r.y))
+
+if __name__ == '__main__':
+    main()
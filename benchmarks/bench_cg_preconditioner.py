@@ -0,0 +1,102 @@
+"""
+    Builders of cg_preconditioner (abopt.preconditioners) for TrustRegionCG
+    on ill-conditioned ChiSquareProblem instances:
+
+    'scaled' : J = (I + N / sqrt(n)) S, where N is a normal random matrix
+               and S scales the columns over a few decades;
+
+    'spiked' : J = U diag(s) U^T, with k singular values over one decade
+               from sqrt(1000) to 100 times the rest.
+
+    The cg iterations are counted with cg_monitor; hev includes the
+    products of the probes. cond is the median of the condition number of the
+    preconditioned Hessian estimated from the Ritz values of cg (state.ritz_cond).
+    'nystrom precond' builds the Nystrom sketch once
+    at x0 and minimizes the Problem with preconditioner(); hev then excludes
+    the rank products of the sketch.
+
+        python benchmarks/bench_cg_preconditioner.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+from abopt.abopt2 import TrustRegionCG
+from abopt.algs.trustregion import HessianOperator
+from abopt.testing import ChiSquareProblem
+from abopt.preconditioners import HutchinsonDiagonal, NystromPreconditioner
+
+def make_chisquare(n, decades, seed=1):
+    rng = numpy.random.RandomState(seed)
+    J = rng.normal(size=(n, n)) / n ** 0.5 + numpy.eye(n)
+    J = J * numpy.logspace(0, decades, n)[None, :]
+    return ChiSquareProblem(J=J)
+
+def make_spiked(n, k, seed=1, precond=None):
+    rng = numpy.random.RandomState(seed)
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    s = numpy.concatenate([numpy.logspace(1.5, 2.5, k), 1 + rng.uniform(size=n - k)])
+    return ChiSquareProblem(J=U.dot(numpy.diag(s)).dot(U.T), precond=precond)
+
+def nystrom_problem(n, k, rank):
+    """ the spiked problem preconditioned by a Nystrom sketch at x0. """
+    problem = make_spiked(n, k)
+    x0 = numpy.zeros(n)
+    builder = NystromPreconditioner(rank, random_state=1)
+    builder.build(HessianOperator(problem, x0, problem.g2Pg(problem.g(x0))))
+    return make_spiked(n, k, precond=builder.preconditioner())
+
+def exact_diagonal(A):
+    """ the diagonal of the Hessian from n products, for reference. """
+    d = 0
+    for v in numpy.eye(len(A.Pg)):
+        d = d + v * A(v)
+    d = d / d.mean()
+    return lambda v, direction: v * d ** direction
+
+def run(n, label, name, problem, builder):
+    ncg = []
+    conds = []
+    def monitor(state):
+        if state.ritz_cond is not None:
+            conds.append(state.ritz_cond)
+
+    trcg = TrustRegionCG(maxiter=1000, cg_preconditioner=builder,
+                cg_monitor=lambda *args: ncg.append(1))
+    r = trcg.minimize(problem, numpy.zeros(n), monitor=monitor)
+    print('%4d %-10s %-22s %5s %6d %6d %7d %7d %9.2e %12.4e' % (n, label, name, r.converged,
+                r.nit, r.gev, r.hev, len(ncg), numpy.median(conds), r.y))
+
+def main():
+    builders = [
+        ('none', lambda: None),
+        ('exact diagonal', lambda: exact_diagonal),
+        ('hutchinson 4', lambda: HutchinsonDiagonal(4, random_state=1)),
+        ('hutchinson 8', lambda: HutchinsonDiagonal(8, random_state=1)),
+        ('hutchinson 16', lambda: HutchinsonDiagonal(16, random_state=1)),
+        ('hutchinson 8 period 5', lambda: HutchinsonDiagonal(8, period=5, random_state=1)),
+        ('nystrom 20', lambda: NystromPreconditioner(20, random_state=1)),
+        ('nystrom 40', lambda: NystromPreconditioner(40, random_state=1)),
+        ('nystrom 40 period 1000', lambda: NystromPreconditioner(40, period=1000, random_state=1)),
+        ('nystrom 40 shift 10', lambda: NystromPreconditioner(40, random_state=1, shift=10.)),
+    ]
+
+    print('%4s %-10s %-22s %5s %6s %6s %7s %7s %9s %12s' % ('n', 'problem', 'preconditioner', 'conv', 'nit', 'gev', 'hev', 'cgiter', 'cond', 'y'))
+    for n in [100, 300]:
+        for decades in [2, 3]:
+            problem = make_chisquare(n, decades)
+            for name, builder in builders:
+                run(n, 'scaled %d' % decades, name, problem, builder())
+        for k in [10, 20]:
+            problem = make_spiked(n, k)
+            for name, builder in builders:
+                run(n, 'spiked %d' % k, name, problem, builder())
+            run(n, 'spiked %d' % k, 'nystrom precond %d' % (2 * k), nystrom_problem(n, k, 2 * k), None)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+    The diag_update schemes of LBFGS (see the docstring of abopt.algs.lbfgs),
+    with and without rescale_diag, under each line search,
+    on the problems of abopt.testing at increasing dimension.
+
+    For each run the iterations, fev, gev, hev, wallclock and the peak memory
+    traced by tracemalloc are recorded. The peak memory comes from a second run
+    of the same minimization, such that tracing does not affect the wallclock.
+
+    A table of all runs and a summary ranking the schemes by the geometric mean
+    of fev + gev over the problems are printed; the runs are also written as JSON.
+
+        python benchmarks/bench_lbfgs_diag_update.py --dims 10 100 1000 --output lbfgs.json
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy
+
+from abopt.abopt2 import LBFGS
+from abopt.algs import lbfgs
+from abopt.linesearch import backtrace, minpack, exact
+from abopt.testing import RosenProblem, ChiSquareProblem
+
+diag_updates = [
+    lbfgs.scalar,
+    lbfgs.inverse_bfgs,
+    lbfgs.direct_bfgs,
+    lbfgs.pre_scaled_direct_bfgs,
+    lbfgs.post_scaled_direct_bfgs,
+    lbfgs.inverse_dfp,
+    lbfgs.pre_scaled_inverse_dfp,
+    lbfgs.post_scaled_inverse_dfp,
+]
+
+linesearches = [backtrace, minpack, exact]
+
+def make_chisquare(n, phi=None, seed=1):
+    rng = numpy.random.RandomState(seed)
+    # singular values spanning 1.5 decades
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    J = U.dot(numpy.diag(numpy.logspace(0, 1.5, n))).dot(U.T)
+    if phi is None:
+        return ChiSquareProblem(J=J)
+    return ChiSquareProblem(J=J, phi=phi[0], phiprime=phi[1])
+
+def make_problems(n):
+    return [
+        ('Rosen', RosenProblem()),
+        ('ChiSquare', make_chisquare(n)),
+        ('ChiSquareQuad', make_chisquare(n, phi=(lambda x: x + 0.1 * x ** 2, lambda x: 1 + 0.2 * x))),
+    ]
+
+def minimize(optimizer, problem, n):
+    """ the final state and the error; some schemes blow up,
+        then the state is the last one seen by the monitor.
+    """
+    last = []
+    def monitor(state):
+        last[:] = [state]
+
+    try:
+        return optimizer.minimize(problem, numpy.zeros(n), monitor=monitor), None
+    except Exception as e:
+        return last[0], '%s: %s' % (type(e).__name__, e)
+
+def run(problem, n, diag_update, rescale_diag, linesearch, maxiter):
+    optimizer = LBFGS(diag_update=diag_update, rescale_diag=rescale_diag,
+                linesearch=linesearch, maxiter=maxiter)
+
+    with numpy.errstate(all='ignore'):
+        t0 = time.time()
+        r, error = minimize(optimizer, problem, n)
+        wallclock = time.time() - t0
+
+        tracemalloc.start()
+        minimize(optimizer, problem, n)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return dict(
+        converged=bool(r.converged) and error is None,
+        error=error,
+        nit=int(r.nit),
+        fev=int(r.fev),
+        gev=int(r.gev),
+        hev=int(r.hev),
+        y=float(r.y),
+        wallclock=wallclock,
+        peak_memory=peak,
+    )
+
+def summarize(records):
+    """ rank the configurations by the geometric mean of fev + gev;
+        a configuration that failed on any problem is ranked by the number of failures first.
+    """
+    configs = {}
+    for rec in records:
+        key = (rec['diag_update'], rec['rescale_diag'], rec['linesearch'])
+        configs.setdefault(key, []).append(rec)
+
+    summary = []
+    for key, recs in configs.items():
+        failed = sum(not rec['converged'] for rec in recs)
+        evals = [rec['fev'] + rec['gev'] for rec in recs]
+        summary.append(dict(
+            diag_update=key[0], rescale_diag=key[1], linesearch=key[2],
+            failed=failed,
+            evals=float(numpy.exp(numpy.mean(numpy.log(evals)))),
+            wallclock=sum(rec['wallclock'] for rec in recs),
+        ))
+    summary.sort(key=lambda s: (s['failed'], s['evals']))
+    return summary
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--dims', type=int, nargs='+', default=[10, 100])
+    ap.add_argument('--maxiter', type=int, default=2000)
+    ap.add_argument('--output', default=None, help='JSON file of the runs and the summary')
+    ns = ap.parse_args()
+
+    records = []
+    print('%-14s %5s %-24s %5s %-9s %4s %6s %6s %6s %6s %9s %10s %11s' % ('problem', 'n',
+        'diag_update', 'rdiag', 'search', 'conv', 'nit', 'fev', 'gev', 'hev', 'time', 'peak', 'y'))
+    for n in ns.dims:
+        for name, problem in make_problems(n):
+            for diag_update in diag_updates:
+                for rescale_diag in [False, True]:
+                    for linesearch in linesearches:
+                        rec = run(problem, n, diag_update, rescale_diag, linesearch, ns.maxiter)
+                        rec.update(problem=name, n=n, diag_update=diag_update.__name__,
+                                rescale_diag=rescale_diag, linesearch=linesearch.__name__)
+                        records.append(rec)
+                        print('%-14s %5d %-24s %5s %-9s %4s %6d %6d %6d %6d %9.3f %10d %11.4e' % (name, n,
+                            rec['diag_update'], rescale_diag, rec['linesearch'], rec['converged'],
+                            rec['nit'], rec['fev'], rec['gev'], rec['hev'],
+                            rec['wallclock'], rec['peak_memory'], rec['y']))
+
+    summary = summarize(records)
+    print()
+    print('%-24s %5s %-9s %6s %10s %9s' % ('diag_update', 'rdiag', 'search', 'failed', 'fev+gev', 'time'))
+    for s in summary:
+        print('%-24s %5s %-9s %6d %10.1f %9.3f' % (s['diag_update'], s['rescale_diag'],
+            s['linesearch'], s['failed'], s['evals'], s['wallclock']))
+
+    if ns.output is not None:
+        with open(ns.output, 'w') as ff:
+            json.dump(dict(dims=ns.dims, maxiter=ns.maxiter, runs=records, summary=summary), ff, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+    Convergence of LBFGS with the curvature history in reduced precision.
+
+    For each storage dtype the history length m is scaled such that the
+    history takes the same memory as m=4 in float64.
+
+        python benchmarks/bench_lbfgs_history_dtype.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+from abopt.abopt2 import LBFGS
+from abopt.testing import RosenProblem, ChiSquareProblem
+
+def make_chisquare(n, seed=1):
+    rng = numpy.random.RandomState(seed)
+    # singular values spanning 1.5 decades
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    J = U.dot(numpy.diag(numpy.logspace(0, 1.5, n))).dot(U.T)
+    return ChiSquareProblem(J=J)
+
+def history_bytes(B):
+    itemsize = {None : 8, 'f4' : 4, 'bf16' : 2}[B.dtype]
+    return len(B.block) * B.block[0].size * itemsize
+
+def main():
+    n = 100
+    problems = [
+        ('RosenProblem', RosenProblem(), numpy.zeros(n)),
+        ('ChiSquareProblem', make_chisquare(n), numpy.zeros(n)),
+    ]
+
+    configs = [(None, 4), ('f4', 8), ('bf16', 16), ('f4', 4), ('bf16', 4)]
+
+    print('%-18s %6s %4s %8s %8s %6s %6s %6s %12s' % ('problem', 'dtype', 'm', 'compact', 'bytes', 'nit', 'fev', 'gev', 'y'))
+    for name, problem, x0 in problems:
+        for compact in [False, True]:
+            for dtype, m in configs:
+                lbfgs = LBFGS(m=m, history_dtype=dtype, compact=compact, maxiter=5000)
+                r = lbfgs.minimize(problem, x0)
+                print('%-18s %6s %4d %8s %8d %6d %6d %6d %12.4e' % (name, dtype or 'f8', m, compact,
+                    history_bytes(r.B), r.nit, r.fev, r.gev, r.y))
+
+if __name__ == '__main__':
+    main()
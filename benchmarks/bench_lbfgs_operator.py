@@ -0,0 +1,48 @@
+"""
+    Reusing the L-BFGS hessian approximation of one problem on a related problem.
+
+    LBFGS is run for a few iterations on a chi-square problem; the hessian
+    approximation is then used as the cg_preconditioner of TrustRegionCG
+    and as the preconditioner of the problem, for a perturbed problem.
+
+        python benchmarks/bench_lbfgs_operator.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+from abopt.abopt2 import LBFGS, TrustRegionCG
+from abopt.algs.lbfgs import LBFGSOperator
+from abopt.testing import ChiSquareProblem
+
+def main():
+    n = 100
+    rng = numpy.random.RandomState(1)
+    # singular values spanning 2 decades
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    J = U.dot(numpy.diag(numpy.logspace(0, 2, n))).dot(U.T)
+    J1 = J + 0.01 * U.dot(numpy.diag(rng.normal(size=n))).dot(U.T)
+
+    print('%3s %6s %-10s %-14s %6s %6s %6s %6s %10s' % ('m', 'maxit', 'reuse', 'optimizer', 'nit', 'fev', 'gev', 'hev', 'y'))
+    for m, maxiter in [(10, 30), (20, 100), (40, 200)]:
+        B = LBFGS(m=m, maxiter=maxiter).minimize(ChiSquareProblem(J=J), numpy.zeros(n)).B
+        op = LBFGSOperator(B)
+
+        runs = [
+            ('none', 'TrustRegionCG', TrustRegionCG(maxradius=1e3), ChiSquareProblem(J=J1)),
+            ('cg', 'TrustRegionCG', TrustRegionCG(maxradius=1e3, cg_preconditioner=op.cg_preconditioner), ChiSquareProblem(J=J1)),
+            ('precond', 'TrustRegionCG', TrustRegionCG(maxradius=1e3), ChiSquareProblem(J=J1, precond=op.preconditioner())),
+            ('none', 'LBFGS', LBFGS(), ChiSquareProblem(J=J1)),
+            ('precond', 'LBFGS', LBFGS(), ChiSquareProblem(J=J1, precond=op.preconditioner())),
+        ]
+        for reuse, name, optimizer, problem in runs:
+            r = optimizer.minimize(problem, numpy.zeros(n))
+            print('%3d %6d %-10s %-14s %6d %6d %6d %6d %10.3e' % (m, maxiter, reuse, name, r.nit, r.fev, r.gev, r.hev, r.y))
+
+if __name__ == '__main__':
+    main()
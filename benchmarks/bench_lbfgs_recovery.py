@@ -0,0 +1,66 @@
+"""
+    Recovery of LBFGS from failed steps and pairs of bad curvature.
+
+    recovery decides what is kept of the curvature history after a failed step;
+    curvature decides how pairs with ys <= 0 enter the history.
+
+    The convex problems rarely produce a failed step or a pair of bad
+    curvature, and all the strategies agree there; the double well started in
+    its concave region does both. nrec counts the calls to recover.
+
+        python benchmarks/bench_lbfgs_recovery.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+from abopt.abopt2 import LBFGS
+from abopt.base import Problem
+from abopt.linesearch import backtrace, minpack
+from abopt.testing import RosenProblem, ChiSquareProblem
+
+def make_chisquare(n, seed=1):
+    rng = numpy.random.RandomState(seed)
+    # singular values spanning 1.5 decades
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    J = U.dot(numpy.diag(numpy.logspace(0, 1.5, n))).dot(U.T)
+    return ChiSquareProblem(J=J)
+
+def make_doublewell():
+    # concave for |x| < 3 ** -0.5
+    def f(x): return numpy.sum(x ** 4 / 4 - x ** 2 / 2 + 0.1 * x)
+    def g(x): return x ** 3 - x + 0.1
+    return Problem(objective=f, gradient=g)
+
+class CountingLBFGS(LBFGS):
+    def recover(self, problem, state, B):
+        self.nrec += 1
+        return LBFGS.recover(self, problem, state, B)
+
+def main():
+    problems = [
+        ('RosenProblem', RosenProblem(), numpy.zeros(20)),
+        ('RosenProblem', RosenProblem(), numpy.zeros(100)),
+        ('ChiSquareProblem', make_chisquare(100), numpy.zeros(100)),
+        ('DoubleWell', make_doublewell(), numpy.random.RandomState(1).uniform(-0.5, 0.5, size=20)),
+        ('DoubleWell', make_doublewell(), numpy.random.RandomState(1).uniform(-0.5, 0.5, size=100)),
+    ]
+
+    print('%-18s %4s %9s %16s %6s %6s %6s %6s %6s %12s' % ('problem', 'n', 'linesearch', 'recovery', 'curv', 'nit', 'fev', 'gev', 'nrec', 'y'))
+    for name, problem, x0 in problems:
+        for linesearch in [backtrace, minpack]:
+            for recovery in ['purge', 'drop_oldest', 'drop_suspicious']:
+                for curvature in [None, 'skip', 'damp']:
+                    lbfgs = CountingLBFGS(linesearch=linesearch, recovery=recovery, curvature=curvature, maxiter=5000)
+                    lbfgs.nrec = 0
+                    r = lbfgs.minimize(problem, x0)
+                    print('%-18s %4d %9s %16s %6s %6d %6d %6d %6d %12.4e' % (name, len(x0), linesearch.__name__,
+                        recovery, curvature, r.nit, r.fev, r.gev, lbfgs.nrec, r.y))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+    NewtonCG with the fixed and the Eisenstat-Walker forcing terms, under
+    backtrace and minpack, against LBFGS and TrustRegionCG on the problems
+    of abopt.testing.
+
+        python benchmarks/bench_newtoncg.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+from abopt.abopt2 import LBFGS, TrustRegionCG, NewtonCG
+from abopt.linesearch import backtrace, minpack
+from abopt.testing import RosenProblem, ChiSquareProblem
+
+def make_chisquare(n, phi=None, seed=1):
+    rng = numpy.random.RandomState(seed)
+    # singular values spanning 1.5 decades
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    J = U.dot(numpy.diag(numpy.logspace(0, 1.5, n))).dot(U.T)
+    if phi is None:
+        return ChiSquareProblem(J=J)
+    return ChiSquareProblem(J=J, phi=phi[0], phiprime=phi[1])
+
+def main():
+    problems = [
+        ('Rosen', RosenProblem(), 20),
+        ('Rosen', RosenProblem(), 100),
+        ('ChiSquare', make_chisquare(100), 100),
+        ('ChiSquareQuad', make_chisquare(100, phi=(lambda x: x + 0.1 * x ** 2, lambda x: 1 + 0.2 * x)), 100),
+    ]
+    optimizers = [
+        ('lbfgs', LBFGS(maxiter=5000)),
+        ('trustregion', TrustRegionCG(maxiter=5000)),
+    ]
+    for linesearch in [backtrace, minpack]:
+        for forcing in [None, 'ew1', 'ew2']:
+            for cg_rtol in [0.1, 1e-2]:
+                if forcing is not None and cg_rtol != 0.1: continue
+                optimizers.append(('newtoncg %s %s %g' % (linesearch.__name__, forcing, cg_rtol),
+                    NewtonCG(linesearch=linesearch, forcing=forcing, cg_rtol=cg_rtol, maxiter=5000)))
+
+    print('%-14s %4s %-28s %5s %6s %6s %6s %6s %12s' % ('problem', 'n', 'optimizer', 'conv', 'nit', 'fev', 'gev', 'hev', 'y'))
+    for name, problem, n in problems:
+        for oname, optimizer in optimizers:
+            r = optimizer.minimize(problem, numpy.zeros(n))
+            print('%-14s %4d %-28s %5s %6d %6d %6d %6d %12.4e' % (name, n, oname, r.converged, r.nit, r.fev, r.gev, r.hev, r.y))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+    The quasi-Newton trust region against TrustRegionCG and LBFGS
+    on the problems of abopt.testing; QuasiNewtonTrustRegion takes no hessian
+    vector products (hev), only objectives (fev) and gradients (gev).
+
+        python benchmarks/bench_qntrustregion.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+from abopt.abopt2 import LBFGS, TrustRegionCG, QuasiNewtonTrustRegion
+from abopt.testing import RosenProblem, ChiSquareProblem
+
+def make_chisquare(n, phi=None, seed=1):
+    rng = numpy.random.RandomState(seed)
+    # singular values spanning 1.5 decades
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    J = U.dot(numpy.diag(numpy.logspace(0, 1.5, n))).dot(U.T)
+    if phi is None:
+        return ChiSquareProblem(J=J)
+    return ChiSquareProblem(J=J, phi=phi[0], phiprime=phi[1])
+
+def main():
+    problems = [
+        ('Rosen', RosenProblem(), 20),
+        ('Rosen', RosenProblem(), 100),
+        ('ChiSquare', make_chisquare(100), 100),
+        ('ChiSquareQuad', make_chisquare(100, phi=(lambda x: x + 0.1 * x ** 2, lambda x: 1 + 0.2 * x)), 100),
+    ]
+    optimizers = [
+        ('LBFGS', LBFGS(maxiter=5000)),
+        ('TrustRegionCG', TrustRegionCG(maxiter=5000)),
+        ('QNTR bfgs m=6', QuasiNewtonTrustRegion(model='bfgs', maxiter=5000)),
+        ('QNTR bfgs m=12', QuasiNewtonTrustRegion(model='bfgs', m=12, maxiter=5000)),
+        ('QNTR sr1 m=6', QuasiNewtonTrustRegion(model='sr1', maxiter=5000)),
+    ]
+
+    print('%-14s %4s %-16s %5s %6s %6s %6s %6s %12s' % ('problem', 'n', 'optimizer', 'conv', 'nit', 'fev', 'gev', 'hev', 'y'))
+    for name, problem, n in problems:
+        for oname, optimizer in optimizers:
+            r = optimizer.minimize(problem, numpy.zeros(n))
+            print('%-14s %4d %-16s %5s %6d %6d %6d %6d %12.4e' % (name, n, oname, r.converged, r.nit, r.fev, r.gev, r.hev, r.y))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+    Stochastic L-BFGS on a least squares problem of increasing number of terms.
+
+    The excess objective over the minimum is reported after the same number of
+    mini-batch evaluations; the time per iteration does not depend on the number of terms.
+
+        python benchmarks/bench_stochastic_lbfgs.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import time
+import numpy
+
+from abopt.abopt2 import StochasticLBFGS
+from abopt.testing import LeastSquaresProblem
+
+def main():
+    configs = [
+        ('sgd', dict(m=0, rate=0.01, rate_decay=0.01)),
+        ('overlap', dict(pairs='overlap', rate=0.1, rate_decay=0.01)),
+        ('hvp', dict(pairs='hvp', rate=0.01, rate_decay=0.0)),
+    ]
+
+    print('%9s %-8s %6s %6s %6s %6s %10s %12s' % ('nterms', 'pairs', 'nit', 'fev', 'gev', 'hev', 'ms/it', 'f - fmin'))
+    for nterms in [10000, 1000000]:
+        problem = LeastSquaresProblem(nterms=nterms)
+        fmin = problem.f(problem.xmin)
+        for name, kwargs in configs:
+            optimizer = StochasticLBFGS(maxiter=500, random_state=1, **kwargs)
+            t0 = time.time()
+            r = optimizer.minimize(problem, numpy.zeros(10))
+            t1 = time.time()
+            print('%9d %-8s %6d %6d %6d %6d %10.3f %12.4e' % (nterms, name, r.nit, r.fev, r.gev, r.hev,
+                (t1 - t0) / r.nit * 1000, problem.f(r.x) - fmin))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+    The configurations of TrustRegionCG on the problems of abopt.testing,
+    counting the hessian vector products (hev).
+
+        python benchmarks/bench_trustregion.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+from abopt.abopt2 import TrustRegionCG
+from abopt.testing import RosenProblem, ChiSquareProblem
+
+def make_chisquare(n, phi=None, seed=1):
+    rng = numpy.random.RandomState(seed)
+    # singular values spanning 1.5 decades
+    U, r = numpy.linalg.qr(rng.normal(size=(n, n)))
+    J = U.dot(numpy.diag(numpy.logspace(0, 1.5, n))).dot(U.T)
+    if phi is None:
+        return ChiSquareProblem(J=J)
+    return ChiSquareProblem(J=J, phi=phi[0], phiprime=phi[1])
+
+def main():
+    problems = [
+        ('Rosen', RosenProblem(), 20),
+        ('Rosen', RosenProblem(), 100),
+        ('ChiSquare', make_chisquare(100), 100),
+        ('ChiSquareQuad', make_chisquare(100, phi=(lambda x: x + 0.1 * x ** 2, lambda x: 1 + 0.2 * x)), 100),
+        ('RosenPrecond', RosenProblem(precond=True), 20),
+    ]
+    optimizers = [
+        ('steihaug', TrustRegionCG(maxiter=5000)),
+        ('gltr', TrustRegionCG(subproblem='gltr', maxiter=5000)),
+        ('pipelined', TrustRegionCG(subproblem='pipelined', maxiter=5000)),
+        ('deflation k=2 l=8', TrustRegionCG(cg_deflation=2, cg_recycle=8, maxiter=5000)),
+        ('deflation k=4 l=16', TrustRegionCG(cg_deflation=4, cg_recycle=16, maxiter=5000)),
+        ('forcing ew1', TrustRegionCG(cg_forcing='ew1', maxiter=5000)),
+        ('forcing ew2', TrustRegionCG(cg_forcing='ew2', maxiter=5000)),
+        ('forcing ew2 max 0.1', TrustRegionCG(cg_forcing='ew2', cg_forcing_max=0.1, maxiter=5000)),
+        ('gltr forcing ew2', TrustRegionCG(subproblem='gltr', cg_forcing='ew2', maxiter=5000)),
+        ('pipelined forcing ew1', TrustRegionCG(subproblem='pipelined', cg_forcing='ew1', maxiter=5000)),
+    ]
+
+    total = {}
+    print('%-14s %4s %-24s %5s %6s %6s %6s %6s %12s' % ('problem', 'n', 'optimizer', 'conv', 'nit', 'fev', 'gev', 'hev', 'y'))
+    for name, problem, n in problems:
+        for oname, optimizer in optimizers:
+            r = optimizer.minimize(problem, numpy.zeros(n))
+            print('%-14s %4d %-24s %5s %6d %6d %6d %6d %12.4e' % (name, n, oname, r.converged, r.nit, r.fev, r.gev, r.hev, r.y))
+            total[oname] = total.get(oname, 0) + r.hev
+
+    print()
+    print('%-24s %6s %8s' % ('optimizer', 'hev', 'saved'))
+    for oname, optimizer in optimizers:
+        print('%-24s %6d %7.1f%%' % (oname, total[oname], 100. * (1 - total[oname] / total['steihaug'])))
+
+if __name__ == '__main__':
+    main()
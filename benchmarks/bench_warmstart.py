@@ -0,0 +1,68 @@
+"""
+    Evaluations saved by warm starts over a sequence of related problems.
+
+    The sequence is a continuation of ChiSquareProblem in the nonlinearity
+    phi(x) = x + beta x^2. Each problem starts from the solution of the
+    previous one; the warm start additionally carries over the state variables
+    returned by optimizer.warmstart.
+
+    Only LBFGS carries state, its hessian approximation. TrustRegionCG and
+    LineSearchGradientDescent carry nothing; their warm start is the cold one.
+
+        python benchmarks/bench_warmstart.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+# runs from a checkout, without installing abopt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+from abopt.abopt2 import LBFGS
+from abopt.testing import ChiSquareProblem
+
+def make_problems(n, nsteps=10, betamax=0.2, seed=1):
+    rng = numpy.random.RandomState(seed)
+    J = numpy.eye(n) * 3 + rng.normal(size=(n, n)) * 0.3
+
+    def make_problem(beta):
+        def phi(x): return x + beta * x ** 2
+        def phiprime(x): return 1 + 2 * beta * x
+        return ChiSquareProblem(J=J, phi=phi, phiprime=phiprime)
+
+    return [make_problem(beta) for beta in numpy.linspace(0, betamax, nsteps)]
+
+def run(optimizer, problems, x0, warm):
+    x = x0
+    state = None
+    total = dict(nit=0, fev=0, gev=0, hev=0)
+    for problem in problems:
+        if warm and state is not None:
+            state_args = optimizer.warmstart(state)
+        else:
+            state_args = {}
+        state = optimizer.minimize(problem, x, **state_args)
+        x = state.x
+        for key in total:
+            total[key] += state[key]
+    return total
+
+def main():
+    n = 20
+    problems = make_problems(n)
+    optimizers = [
+        ('LBFGS', LBFGS()),
+        ('LBFGS m=20', LBFGS(m=20)),
+    ]
+
+    print('%-26s %6s %6s %6s %6s %6s' % ('optimizer', 'start', 'nit', 'fev', 'gev', 'hev'))
+    for name, optimizer in optimizers:
+        for warm in [False, True]:
+            total = run(optimizer, problems, numpy.zeros(n), warm)
+            print('%-26s %6s %6d %6d %6d %6d' % (name, 'warm' if warm else 'cold',
+                    total['nit'], total['fev'], total['gev'], total['hev']))
+
+if __name__ == '__main__':
+    main()